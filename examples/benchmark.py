@@ -2,7 +2,7 @@ import os
 import sys
 import random
 
-from myrmidon import Game, Entity
+from myrmidon import Game, Entity, LightEntity
 from myrmidon.consts import *
 from pygame.locals import *
 
@@ -15,12 +15,23 @@ class TestEntity(Entity):
         self.image = self.window.I_MYRMIDON
         while True:
             yield
+
+
+class LightTestEntity(LightEntity):
+    __slots__ = ('x_amount', 'y_amount', 'rot_amount', 'scale_amount')
+    def execute(self, window):
+        self.x = (Game.screen_resolution[0] / 2) + random.randint(-200, 200)
+        self.y = (Game.screen_resolution[1] / 2) + random.randint(-200, 200)
+        self.image = window.I_MYRMIDON
+        while True:
+            yield
             
 
 class BenchmarkTest(Entity):
     name = "A Benchmark Test"
     num_test_entities = 20
     test_length = 5
+    entity_class = TestEntity
     
     def execute(self, window):
         self.window = window
@@ -53,7 +64,7 @@ class BenchmarkTest(Entity):
     def create_single_test_entity(self):
         """Override this in tests, but make sure the base method is called,
         it will return the created entity so you can alter the parameters."""
-        self.test_entities.append(TestEntity(self.window))
+        self.test_entities.append(self.entity_class(self.window))
         return self.test_entities[-1]
 
     def update_entity(self, entity):
@@ -117,11 +128,22 @@ class ScalingEntityTest(BenchmarkTest):
         entity.scale += entity.scale_amount
         if entity.scale < .5 or entity.scale > 3.0:
             entity.scale_amount = -entity.scale_amount
+
+
+class LightMovingEntityTest(MovingEntityTest):
+    name = "Moving Light Entities"
+    entity_class = LightTestEntity
+
+
+class LightRotatingEntityTest(RotatingEntityTest):
+    name = "Rotating Light Entities"
+    entity_class = LightTestEntity
         
 
 class Application(Entity):
     tests = [StaticEntityTest, TintedStaticEntityTest, MovingEntityTest,
-             RotatingEntityTest, ScalingEntityTest,]
+             RotatingEntityTest, ScalingEntityTest, LightMovingEntityTest,
+             LightRotatingEntityTest,]
     
     def execute(self):
         self.load_media()
@@ -79,6 +79,8 @@ class Ship(Entity):
 
 
 class Shot(Entity):
+    pooled = True
+
     def execute(self, game, x, y, angle_to = 0.0):
         self.image = game.graphics['shot']
         self.x = x
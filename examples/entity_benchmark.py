@@ -0,0 +1,68 @@
+"""
+Compares the memory used by and the cost of setting attributes on Entity
+and LightEntity. Runs headless so it needs no window or graphics.
+"""
+import timeit
+import tracemalloc
+
+from myrmidon import Game, Entity, LightEntity
+
+
+NUM_ENTITIES = 10000
+NUM_SETS = 200000
+
+
+class Main(Entity):
+    def execute(self):
+        while True:
+            yield
+
+
+class HeavyEntity(Entity):
+    def execute(self):
+        while True:
+            yield
+
+
+class SmallEntity(LightEntity):
+    __slots__ = ()
+    def execute(self):
+        while True:
+            yield
+
+
+def measure_memory(entity_class):
+    """Returns the average number of bytes allocated for each entity created."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    entities = [entity_class() for i in range(NUM_ENTITIES)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    for entity in entities:
+        entity.destroy()
+    Game.step()
+    return allocated / float(NUM_ENTITIES)
+
+
+def measure_setter(entity_class, attribute):
+    """Returns the average time in nanoseconds of setting an attribute once."""
+    entity = entity_class()
+    setter = lambda: setattr(entity, attribute, 1.0)
+    elapsed = min(timeit.repeat(setter, number = NUM_SETS, repeat = 5))
+    entity.destroy()
+    Game.step()
+    return elapsed / NUM_SETS * 1e9
+
+
+Game.headless = True
+Main()
+
+print("{0:<18}{1:>14}{2:>14}".format("", "Entity", "LightEntity"))
+print("{0:<18}{1:>14.1f}{2:>14.1f}".format(
+    "bytes each", measure_memory(HeavyEntity), measure_memory(SmallEntity)
+    ))
+for attribute in ("x", "rotation", "alpha", "z"):
+    print("{0:<18}{1:>14.1f}{2:>14.1f}".format(
+        attribute + " set (ns)", measure_setter(HeavyEntity, attribute), measure_setter(SmallEntity, attribute)
+        ))
@@ -65,6 +65,8 @@ class Window(Entity):
 
 
 class Shot(Entity):
+    pooled = True
+
     def execute(self, game, x, y, angle_to = 0.0):
         self.image = game.graphics['shot']
         self.x = x
@@ -1,4 +1,5 @@
 from myrmidon.entity import Entity
+from myrmidon.light_entity import LightEntity
 from myrmidon.game import Game, MyrmidonError
 from myrmidon.base_entity import BaseEntity
 from myrmidon.base_image import BaseImage
@@ -6,4 +7,5 @@ from myrmidon.base_font import BaseFont
 from myrmidon.base_audio import BaseAudio
 from myrmidon.base_module import BaseModule
 from myrmidon.screen_overlay import ScreenOverlay
+from myrmidon.particles import ParticleEmitter
 from myrmidon.module_loader import ModuleLoader
@@ -34,6 +34,18 @@ class MyrmidonWindowDummy(object):
         def tick(self, fps_rate):
             pass
 
+        def get_fps(self):
+            return 0
+
+    def set_window_loop(self, callback, target_fps = 30):
+        pass
+
+    def open_window(self):
+        pass
+
+    def app_loop_tick(self):
+        pass
+
     def change_resolution(self, resolution):
         pass
 
@@ -48,8 +60,10 @@ class MyrmidonWindowDummy(object):
 class MyrmidonGfxDummy(object):
 
     clear_colour = (0.0, 0.0, 0.0, 1.0)
+    # Which alter_* methods need calling when an Entity changes. Entity types that
+    # skip notifying the gfx engine, like LightEntity, check this first.
+    alter_hooks_required = ()
     prev_blend = False
-    entities_z_order_list = []
     device_resolution = (0, 0)
 
     def change_resolution(self, resolution):
@@ -62,7 +76,7 @@ class MyrmidonGfxDummy(object):
         pass
 
     def draw_entities(self, entity_list):
-        pass	
+        pass
 	
     def create_texture_list(self, entity, image):
         return None
@@ -71,10 +85,13 @@ class MyrmidonGfxDummy(object):
         pass
 
     def register_entity(self, entity):
-        self.entities_z_order_list.append(entity)
+        pass
+
+    def register_entities(self, entities):
+        pass
 
     def remove_entity(self, entity):
-        self.entities_z_order_list.remove(entity)
+        pass
 
     def alter_x(self, entity, x):
         pass
@@ -100,9 +117,18 @@ class MyrmidonGfxDummy(object):
     def alter_alpha(self, entity, alpha):
         pass
 
+    def alter_display(self, entity, display):
+        pass
+
+    def draw_particles(self, emitter):
+        pass
+
     def new_image(self, width, height, colour = None):
         return MyrmidonGfxDummy.Image()
 
+    def load_atlas(self, images, max_size = 2048, padding = 1, cache_file = None):
+        return [MyrmidonGfxDummy.Image() for x in images]
+
     def draw_line(self, start, finish, colour = (1.0,1.0,1.0,1.0), width = 5.0, noloadidentity = False):
         pass
 
@@ -124,6 +150,8 @@ class MyrmidonGfxDummy(object):
         height = 0
         filename = None
         is_sequence_image = False
+        uvs = None
+        in_atlas = False
         def __init__(self, image = None, sequence = False, width = None, height = None):
             pass
 
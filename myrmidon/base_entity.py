@@ -32,4 +32,5 @@ while still referencing Game directly.
 """
 
 class BaseEntity(object):
-    pass
+    # Empty so that subclasses can choose to use __slots__
+    __slots__ = ()
@@ -43,6 +43,14 @@ class BaseImage(object):
     # If this Image is a sequence of images and contains a number of frames.
     is_sequence_image = False
 
+    # If each frame is a region of a larger texture, such as an atlas, a list of the
+    # (left, top, right, bottom) texture coordinates of each frame, going from 0.0 to 1.0.
+    # None means each frame uses its whole texture.
+    uvs = None
+
+    # True if the texture is shared with other Images and should not be freed with this one.
+    in_atlas = False
+
     def __init__(self, image = None, sequence = False, width = None, height = None):
         """
         Image objects need to implement this init method. It is perfectly acceptable to
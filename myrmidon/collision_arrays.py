@@ -0,0 +1,263 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+Collision checks for whole groups of Entities at once using NumPy. The
+collision shapes of each group are packed into arrays, pairs that are close
+enough to possibly collide are found by comparing bounding boxes and then
+the same tests as Game's single pair collision methods are run on every
+candidate pair together.
+"""
+
+try:
+    import numpy
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+from myrmidon.consts import *
+from myrmidon.collision_shapes import BOUNDS_MARGIN
+
+# Roughly how many pairs of bounding boxes are compared at a time
+CANDIDATE_CHUNK_SIZE = 262144
+
+SHAPE_RECTANGLE = 0
+SHAPE_CIRCLE = 1
+SHAPE_POINT = 2
+
+shape_codes = {
+    COLLISION_TYPE_RECTANGLE : SHAPE_RECTANGLE,
+    COLLISION_TYPE_CIRCLE : SHAPE_CIRCLE,
+    COLLISION_TYPE_POINT : SHAPE_POINT,
+    }
+
+
+class PackedGroup(object):
+    """
+    The collision shapes of a list of Entities stored as arrays, one row per
+    Entity. Only the columns that make sense for each Entity's shape are filled.
+    Entities that have collision_on set to False are left out, index maps each
+    row back to the Entity's position in the list that was packed.
+    """
+
+    def __init__(self, entities):
+        rows = [(i, entity) for i, entity in enumerate(entities) if entity.collision_on]
+        count = len(rows)
+        self.entities = [entity for i, entity in rows]
+        self.index = numpy.array([i for i, entity in rows], numpy.intp)
+        self.identity = numpy.array([id(entity) for entity in self.entities], numpy.int64)
+        self.shape = numpy.empty(count, numpy.int8)
+        self.position = numpy.zeros((count, 2))
+        self.bounds = numpy.zeros((count, 4))
+        # Rectangle only - corners in the order ul, ur, ll, lr, width and height,
+        # cos and sin of the reversed rotation, and the bounds of the areas that
+        # circle and point tests against it can hit
+        self.corners = numpy.zeros((count, 4, 2))
+        self.size = numpy.zeros((count, 2))
+        self.reverse_rotation = numpy.zeros((count, 2))
+        self.circle_test_bounds = numpy.zeros((count, 4))
+        self.point_test_bounds = numpy.zeros((count, 4))
+        # Circle only
+        self.radius = numpy.zeros(count)
+        # Point only
+        self.point = numpy.zeros((count, 2))
+
+        for row, entity in enumerate(self.entities):
+            shape = shape_codes[entity.collision_type]
+            self.shape[row] = shape
+            self.position[row] = (entity.x, entity.y)
+            self.bounds[row] = entity.collision_calculate_bounds()
+            if shape == SHAPE_RECTANGLE:
+                self.pack_rectangle(row, entity)
+            elif shape == SHAPE_CIRCLE:
+                self.radius[row] = entity.collision_circle_calculate_radius()
+            else:
+                self.point[row] = entity.collision_point_calculate_point()
+
+    def __len__(self):
+        return len(self.entities)
+
+    def pack_rectangle(self, row, entity):
+        shape = entity.collision_rectangle_calculate_shape()
+        corners = shape.corners
+        self.corners[row] = ((corners[0], corners[1]), (corners[2], corners[3]),
+                             (corners[4], corners[5]), (corners[6], corners[7]))
+        self.size[row] = shape.size
+        self.reverse_rotation[row] = shape.reverse_rotation
+        self.circle_test_bounds[row] = shape.circle_test_bounds
+        self.point_test_bounds[row] = shape.point_test_bounds
+
+
+def candidate_pairs(bounds_a, bounds_b):
+    """Returns two arrays of row numbers for every pair of bounding boxes that
+    overlap, one from each of the arrays of boxes given."""
+    if not len(bounds_a) or not len(bounds_b):
+        empty = numpy.zeros(0, numpy.intp)
+        return empty, empty
+    chunk = max(1, CANDIDATE_CHUNK_SIZE // len(bounds_b))
+    min_x_b = bounds_b[:, 0] - BOUNDS_MARGIN
+    min_y_b = bounds_b[:, 1] - BOUNDS_MARGIN
+    max_x_b = bounds_b[:, 2] + BOUNDS_MARGIN
+    max_y_b = bounds_b[:, 3] + BOUNDS_MARGIN
+    rows_a = []
+    rows_b = []
+    for start in range(0, len(bounds_a), chunk):
+        part = bounds_a[start:start + chunk]
+        overlap = (part[:, 0, None] <= max_x_b) & (part[:, 2, None] >= min_x_b) \
+            & (part[:, 1, None] <= max_y_b) & (part[:, 3, None] >= min_y_b)
+        found_a, found_b = numpy.nonzero(overlap)
+        rows_a.append(found_a + start)
+        rows_b.append(found_b)
+    return numpy.concatenate(rows_a), numpy.concatenate(rows_b)
+
+
+def rectangle_to_rectangle(group_a, rows_a, group_b, rows_b):
+    """Separating axis test, worked out the same way as Game.collision_rectangle_to_rectangle."""
+    corners_a = group_a.corners[rows_a]
+    corners_b = group_b.corners[rows_b]
+    ul_a, ur_a, lr_a = corners_a[:, 0], corners_a[:, 1], corners_a[:, 3]
+    ul_b, ur_b, ll_b = corners_b[:, 0], corners_b[:, 1], corners_b[:, 2]
+    axes = (ur_a - ul_a, ur_a - lr_a, ul_b - ll_b, ul_b - ur_b)
+    colliding = numpy.ones(len(rows_a), bool)
+    for axis in axes:
+        axis_x = axis[:, 0, None]
+        axis_y = axis[:, 1, None]
+        length = (axis_x * axis_x) + (axis_y * axis_y)
+        extents = []
+        for corners in (corners_a, corners_b):
+            projection = ((corners[:, :, 0] * axis_x) + (corners[:, :, 1] * axis_y)) / length
+            projection = ((projection * axis_x) * axis_x) + ((projection * axis_y) * axis_y)
+            extents.append((projection.min(axis = 1), projection.max(axis = 1)))
+        (min_a, max_a), (min_b, max_b) = extents
+        colliding &= (min_b <= max_a) & (max_b >= min_a)
+    return colliding
+
+
+def point_to_rectangle(points, point_rows, rectangles, rectangle_rows):
+    """Same test as Game.collision_point_to_rectangle."""
+    point = points.point[point_rows]
+    centre = rectangles.position[rectangle_rows]
+    cos_r = rectangles.reverse_rotation[rectangle_rows, 0]
+    sin_r = rectangles.reverse_rotation[rectangle_rows, 1]
+    offset_x = point[:, 0] - centre[:, 0]
+    offset_y = point[:, 1] - centre[:, 1]
+    rotated_x = (cos_r * offset_x - sin_r * offset_y) + centre[:, 0]
+    rotated_y = (sin_r * offset_x + cos_r * offset_y) + centre[:, 1]
+    origin = rectangles.corners[rectangle_rows, 0]
+    size = rectangles.size[rectangle_rows]
+    return (rotated_x > origin[:, 0]) & (rotated_x < (origin[:, 0] + size[:, 0])) \
+        & (rotated_y > origin[:, 1]) & (rotated_y < (origin[:, 1] + size[:, 1]))
+
+
+def circle_to_rectangle(circles, circle_rows, rectangles, rectangle_rows):
+    """Same test as Game.collision_circle_to_rectangle."""
+    circle = circles.position[circle_rows]
+    radius = circles.radius[circle_rows]
+    centre = rectangles.position[rectangle_rows]
+    cos_r = rectangles.reverse_rotation[rectangle_rows, 0]
+    sin_r = rectangles.reverse_rotation[rectangle_rows, 1]
+    offset_x = circle[:, 0] - centre[:, 0]
+    offset_y = circle[:, 1] - centre[:, 1]
+    rotated_x = (cos_r * offset_x - sin_r * offset_y) + centre[:, 0]
+    rotated_y = (sin_r * offset_x + cos_r * offset_y) + centre[:, 1]
+    half_width = rectangles.size[rectangle_rows, 0] / 2
+    half_height = rectangles.size[rectangle_rows, 1] / 2
+    distance_x = numpy.abs(rotated_x - centre[:, 0])
+    distance_y = numpy.abs(rotated_y - centre[:, 1])
+    outside = (distance_x > (half_width + radius)) | (distance_y > (half_height + radius))
+    inside = (distance_x <= half_width) | (distance_y <= half_height)
+    corner_distance_sq = ((distance_x - half_width) ** 2) + ((distance_y - half_height) ** 2)
+    return ~outside & (inside | (corner_distance_sq <= (radius ** 2)))
+
+
+def circle_to_circle(group_a, rows_a, group_b, rows_b):
+    """Same test as Game.collision_circle_to_circle."""
+    position_a = group_a.position[rows_a]
+    position_b = group_b.position[rows_b]
+    distance_sq = ((position_b[:, 1] - position_a[:, 1]) ** 2) + ((position_b[:, 0] - position_a[:, 0]) ** 2)
+    return ~(distance_sq > (group_a.radius[rows_a] + group_b.radius[rows_b]) ** 2)
+
+
+def point_to_circle(points, point_rows, circles, circle_rows):
+    """Same test as Game.collision_point_to_circle."""
+    point = points.point[point_rows]
+    centre = circles.position[circle_rows]
+    distance = numpy.sqrt(((centre[:, 1] - point[:, 1]) ** 2) + ((centre[:, 0] - point[:, 0]) ** 2))
+    return ~(distance > circles.radius[circle_rows])
+
+
+def point_to_point(group_a, rows_a, group_b, rows_b):
+    """Same test as Game.collision_point_to_point."""
+    point_a = group_a.point[rows_a]
+    point_b = group_b.point[rows_b]
+    return (point_a[:, 0] == point_b[:, 0]) & (point_a[:, 1] == point_b[:, 1])
+
+
+# For each pair of shapes - the test, whether group a's shape is the first
+# argument of the test and which bounds to find candidates with for each group
+shape_pair_tests = {
+    (SHAPE_RECTANGLE, SHAPE_RECTANGLE) : (rectangle_to_rectangle, True, "bounds", "bounds"),
+    (SHAPE_POINT, SHAPE_RECTANGLE) : (point_to_rectangle, True, "bounds", "point_test_bounds"),
+    (SHAPE_RECTANGLE, SHAPE_POINT) : (point_to_rectangle, False, "point_test_bounds", "bounds"),
+    (SHAPE_CIRCLE, SHAPE_RECTANGLE) : (circle_to_rectangle, True, "bounds", "circle_test_bounds"),
+    (SHAPE_RECTANGLE, SHAPE_CIRCLE) : (circle_to_rectangle, False, "circle_test_bounds", "bounds"),
+    (SHAPE_CIRCLE, SHAPE_CIRCLE) : (circle_to_circle, True, "bounds", "bounds"),
+    (SHAPE_POINT, SHAPE_CIRCLE) : (point_to_circle, True, "bounds", "bounds"),
+    (SHAPE_CIRCLE, SHAPE_POINT) : (point_to_circle, False, "bounds", "bounds"),
+    (SHAPE_POINT, SHAPE_POINT) : (point_to_point, True, "bounds", "bounds"),
+    }
+
+
+def collide_packed(group_a, group_b):
+    """Returns an array of (index in a, index in b) pairs for every colliding pair
+    of Entities between two PackedGroups, sorted by the index in a then b."""
+    found = []
+    for (shape_a, shape_b), (test, a_first, bounds_name_a, bounds_name_b) in shape_pair_tests.items():
+        subset_a = numpy.nonzero(group_a.shape == shape_a)[0]
+        subset_b = numpy.nonzero(group_b.shape == shape_b)[0]
+        if not len(subset_a) or not len(subset_b):
+            continue
+        found_a, found_b = candidate_pairs(
+            getattr(group_a, bounds_name_a)[subset_a],
+            getattr(group_b, bounds_name_b)[subset_b]
+            )
+        rows_a = subset_a[found_a]
+        rows_b = subset_b[found_b]
+        # An Entity never collides with itself
+        different = group_a.identity[rows_a] != group_b.identity[rows_b]
+        rows_a = rows_a[different]
+        rows_b = rows_b[different]
+        if not len(rows_a):
+            continue
+        if a_first:
+            colliding = test(group_a, rows_a, group_b, rows_b)
+        else:
+            colliding = test(group_b, rows_b, group_a, rows_a)
+        found.append(numpy.column_stack((group_a.index[rows_a[colliding]], group_b.index[rows_b[colliding]])))
+    if not found:
+        return numpy.zeros((0, 2), numpy.intp)
+    pairs = numpy.concatenate(found)
+    return pairs[numpy.lexsort((pairs[:, 1], pairs[:, 0]))]
@@ -0,0 +1,152 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+
+Cached collision data for rectangle shapes. Everything the narrowphase
+needs to know about a rectangle that only depends on its transform - the
+corners, the separating axes and the rectangle's own extent along them,
+an enclosing bounding box and the reversed rotation used by the point and
+circle tests - is worked out once when the transform changes rather than
+for every pair of shapes being tested.
+"""
+
+import math
+from collections import namedtuple
+
+
+# Bounding boxes are grown by this much before rejecting a pair with them so
+# rounding can never make them disagree with the exact tests that follow
+BOUNDS_MARGIN = 1e-6
+
+
+RectangleShape = namedtuple("RectangleShape", (
+    # Corners flattened to (ul_x, ul_y, ur_x, ur_y, ll_x, ll_y, lr_x, lr_y)
+    "corners",
+    # (min_x, min_y, max_x, max_y) enclosing the corners
+    "bounds",
+    # Width and height of the rectangle
+    "size",
+    # Cos and sin of the reversed rotation, used to turn points and circles
+    # into the rectangle's space
+    "reverse_rotation",
+    # The areas that any point or circle centre touching the rectangle must be in
+    "point_test_bounds",
+    "circle_test_bounds",
+    # Separating axes used when this is the first and second rectangle of a pair,
+    # each given as (axis_x, axis_y, length_squared, own_min, own_max)
+    "first_axes",
+    "second_axes",
+    ))
+
+
+def project_corners(corners, axis_x, axis_y, length_squared):
+    """Projects the four corners of a rectangle on to an axis and returns the
+    minimum and maximum projected values as a two-part tuple.
+
+    Keyword arguments:
+    -- corners: The flattened corners of the rectangle.
+    -- axis_x: First part of the axis.
+    -- axis_y: Second part of the axis.
+    -- length_squared: The squared length of the axis.
+    """
+    projection = ((corners[0] * axis_x) + (corners[1] * axis_y)) / length_squared
+    value_min = value_max = ((projection * axis_x) * axis_x) + ((projection * axis_y) * axis_y)
+    for i in (2, 4, 6):
+        projection = ((corners[i] * axis_x) + (corners[i + 1] * axis_y)) / length_squared
+        value = ((projection * axis_x) * axis_x) + ((projection * axis_y) * axis_y)
+        if value < value_min:
+            value_min = value
+        elif value > value_max:
+            value_max = value
+    return value_min, value_max
+
+
+def rectangle_axis(corners, start, end):
+    """Returns the axis running between two corners, along with its squared
+    length and the extent of the rectangle along it.
+
+    Keyword arguments:
+    -- corners: The flattened corners of the rectangle.
+    -- start: Index of the corner the axis points from.
+    -- end: Index of the corner the axis points to.
+    """
+    axis_x = corners[start] - corners[end]
+    axis_y = corners[start + 1] - corners[end + 1]
+    length_squared = (axis_x * axis_x) + (axis_y * axis_y)
+    # Rectangles with no width or height have no extent to work out, separating
+    # axis tests against them will fail the same way they always have
+    if not length_squared:
+        return (axis_x, axis_y, length_squared, None, None)
+    return (axis_x, axis_y, length_squared) + project_corners(corners, axis_x, axis_y, length_squared)
+
+
+def rectangle_shape(corners, size, x, y, rotation):
+    """Builds the RectangleShape for a rectangle.
+
+    Keyword arguments:
+    -- corners: Dictionary containing the 'ul', 'ur', 'll' and 'lr' corners as returned
+      by collision_rectangle_calculate_corners.
+    -- size: The width and height of the rectangle.
+    -- x: First coordinate part of the position the rectangle rotates about.
+    -- y: Second coordinate part of the position the rectangle rotates about.
+    -- rotation: The rotation of the rectangle in degrees.
+    """
+    flat = corners['ul'] + corners['ur'] + corners['ll'] + corners['lr']
+    width, height = size
+    xs = flat[0::2]
+    ys = flat[1::2]
+
+    reverse = math.radians(-rotation)
+    cos_r = math.cos(reverse)
+    sin_r = math.sin(reverse)
+
+    # Points are rotated about the position into the rectangle's space
+    # and tested against its top left corner, so the hit area is that box turned back
+    point_xs = []
+    point_ys = []
+    for box_x in (flat[0], flat[0] + width):
+        for box_y in (flat[1], flat[1] + height):
+            point_xs.append(x + cos_r * (box_x - x) + sin_r * (box_y - y))
+            point_ys.append(y - sin_r * (box_x - x) + cos_r * (box_y - y))
+
+    # Circles are tested against the rectangle centred on the position, so any
+    # circle centre that can hit it is within the box enclosing that
+    extent_x = abs(cos_r) * width / 2 + abs(sin_r) * height / 2
+    extent_y = abs(sin_r) * width / 2 + abs(cos_r) * height / 2
+
+    return RectangleShape(
+        corners = flat,
+        bounds = (min(xs), min(ys), max(xs), max(ys)),
+        size = (width, height),
+        reverse_rotation = (cos_r, sin_r),
+        point_test_bounds = (min(point_xs), min(point_ys), max(point_xs), max(point_ys)),
+        circle_test_bounds = (x - extent_x, y - extent_y, x + extent_x, y + extent_y),
+        # ur - ul, ur - lr
+        first_axes = (rectangle_axis(flat, 2, 0), rectangle_axis(flat, 2, 6)),
+        # ul - ll, ul - ur
+        second_axes = (rectangle_axis(flat, 0, 4), rectangle_axis(flat, 0, 2)),
+        )
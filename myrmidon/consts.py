@@ -50,6 +50,9 @@ COLLISION_TYPE_RECTANGLE = 'rectangle'
 COLLISION_TYPE_CIRCLE = 'circle'
 COLLISION_TYPE_POINT = 'point'
 
+# Every bit set, for collision masks that include all layers
+COLLISION_MASK_ALL = -1
+
 # BEWARE - HERE BE HACKS
 # This used to do this all the time, but it breaks when you're
 # not using PyGame as the input. Unfortunately I liked only needing
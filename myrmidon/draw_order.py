@@ -0,0 +1,187 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+The order that Entities are drawn in, shared by every gfx engine. Entities
+are kept in buckets by z value with the z values themselves kept sorted, so
+changing an Entity's depth just moves it from one bucket to another rather
+than needing everything to be sorted again. Entities sharing a depth are
+drawn in the order they were registered, the same as a stable sort by z, or
+can be sorted by y position once a frame for top-down games where things
+lower down the screen should be drawn in front.
+"""
+
+import bisect
+from operator import attrgetter
+
+
+class DrawOrder(object):
+
+    y_position = attrgetter('y')
+
+    def __init__(self):
+        # z values that have Entities at them, lowest first
+        self.depths = []
+        # z value to a list of the Entities at that depth in registration order, and
+        # a matching list of their registration orders to search through
+        self.buckets = {}
+        self.bucket_keys = {}
+        # Entity to a tuple of (z value of the bucket it's in, its registration order)
+        self.entity_depths = {}
+        self.order = []
+        # Set when Entities are added, removed or change depth
+        self.dirty = False
+        # y_sort that the current order was built with
+        self.y_sort = False
+        # z value to the y sorted list of Entities at that depth last time it was built
+        self.y_sorted_buckets = {}
+        # Goes up by one every time the order returned by entities changes
+        self.changes = 0
+
+    def __len__(self):
+        return len(self.entity_depths)
+
+    def __contains__(self, entity):
+        return entity in self.entity_depths
+
+    def add(self, entity):
+        """Puts an Entity into the bucket for its current z value, after every
+        Entity there that was registered before it.
+
+        Keyword arguments:
+        -- entity: The Entity to add. Must have z and _registration_order attributes.
+        """
+        self.insert(entity, entity.z, entity._registration_order)
+
+    def remove(self, entity):
+        """Takes an Entity out of the draw order. Silently does nothing if
+        it isn't in there."""
+        if not entity in self.entity_depths:
+            return
+        self.take_out(entity)
+
+    def alter_z(self, entity, z):
+        """Moves an Entity to the bucket for a new z value, keeping its place in
+        registration order. Entities that aren't in the draw order yet are ignored,
+        they go in at whatever their z is when they're added.
+
+        Keyword arguments:
+        -- entity: The Entity that has changed depth.
+        -- z: Its new z value.
+        """
+        place = self.entity_depths.get(entity)
+        if place is None or place[0] == z:
+            return
+        self.take_out(entity)
+        self.insert(entity, z, place[1])
+
+    def insert(self, entity, z, key):
+        bucket = self.buckets.get(z)
+        if bucket is None:
+            bucket = self.buckets[z] = []
+            keys = self.bucket_keys[z] = []
+            bisect.insort(self.depths, z)
+        else:
+            keys = self.bucket_keys[z]
+        # Newly registered Entities always go on the end
+        if not keys or keys[-1] < key:
+            bucket.append(entity)
+            keys.append(key)
+        else:
+            index = bisect.bisect_left(keys, key)
+            bucket.insert(index, entity)
+            keys.insert(index, key)
+        self.entity_depths[entity] = (z, key)
+        self.dirty = True
+
+    def take_out(self, entity):
+        z, key = self.entity_depths.pop(entity)
+        bucket = self.buckets[z]
+        keys = self.bucket_keys[z]
+        index = bisect.bisect_left(keys, key)
+        del bucket[index]
+        del keys[index]
+        if not bucket:
+            del self.buckets[z]
+            del self.bucket_keys[z]
+            del self.depths[bisect.bisect_left(self.depths, z)]
+        self.dirty = True
+
+    def entities(self, y_sort = False):
+        """Returns a list of every Entity in the order they should be drawn,
+        highest z first. The list is reused between calls and must not be changed.
+
+        Keyword arguments:
+        -- y_sort: True to sort Entities at the same depth by their y position,
+         lowest first, or a collection of the z values that should be sorted this
+         way. Entities with the same y stay in registration order. (default False)
+        """
+        if not y_sort:
+            y_sort = False
+        elif not y_sort is True:
+            # Our own copy so changes to the collection given are noticed
+            y_sort = frozenset(y_sort)
+        if not self.dirty and not y_sort and self.y_sort is False:
+            return self.order
+        # Turning y sorting on or off is rare enough to check the whole order after
+        resorted = not y_sort == self.y_sort
+        changed = self.dirty
+
+        # y positions aren't watched, so depths being sorted by them are sorted
+        # every time and only looked at again if that changed anything
+        buckets = self.buckets
+        y_sorted_buckets = {}
+        if y_sort:
+            previous = self.y_sorted_buckets
+            for z in self.depths:
+                if y_sort is True or z in y_sort:
+                    y_sorted = y_sorted_buckets[z] = sorted(buckets[z], key = self.y_position)
+                    if not changed and not resorted and not y_sorted == previous.get(z):
+                        changed = True
+        self.y_sorted_buckets = y_sorted_buckets
+        self.dirty = False
+        if not changed and not resorted:
+            return self.order
+
+        order = []
+        for z in reversed(self.depths):
+            order.extend(y_sorted_buckets.get(z, buckets[z]))
+        self.y_sort = y_sort
+        if changed or not order == self.order:
+            self.order = order
+            self.changes += 1
+        return self.order
+
+    def clear(self):
+        """Removes every Entity from the draw order."""
+        self.depths = []
+        self.buckets = {}
+        self.bucket_keys = {}
+        self.entity_depths = {}
+        self.order = []
+        self.dirty = False
+        self.y_sorted_buckets = {}
+        self.changes += 1
@@ -33,16 +33,23 @@ Provides a Kviy-based graphics adaptor.
 
 import copy
 import math
+from array import array
+try:
+    import numpy
+    numpy_available = True
+except ImportError:
+    numpy_available = False
 
 from myrmidon import Game, Entity, BaseImage, MyrmidonError
 from myrmidon.consts import *
+from myrmidon.texture_atlas import AtlasBuilder as BaseAtlasBuilder, frame_uvs
 
 import kivy
 from kivy.core.image import Image as Kivy_Image
 from kivy.uix.label import Label
 from kivy.uix.widget import Widget
 from kivy.graphics import Rectangle, Color, Scale, Rotate, PushMatrix, PopMatrix, Translate, Quad, Ellipse, Line
-from kivy.graphics import Callback
+from kivy.graphics import Callback, Mesh, RenderContext
 from kivy.graphics.texture import Texture
 from kivy.core.window import Window
 from kivy.graphics.opengl import glBlendFunc, glBlendFuncSeparate, GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA, GL_ONE
@@ -52,10 +59,19 @@ class Myrmidon_Backend(Entity):
 
     clear_colour = (0.0, 0.0, 0.0, 1.0)
     letter_box_border_colour = (0.0, 0.0, 0.0, 1.0)
+    # Which alter_* methods need calling when an Entity changes. Entity types that
+    # skip notifying the gfx engine, like LightEntity, check this first.
+    alter_hooks_required = ('display',)
     draw_list_dirty = True
     entity_list_draw_order = []
+    # Game.draw_order.changes when the draw list was last built
+    draw_order_changes = None
+    atlas_builder = None
     letter_boxes = []
     device_resolution = None
+
+    # Kivy meshes use 16 bit indices so big particle emitters are split over several
+    particles_per_mesh = 16384
     
     def __init__(self):
         # Try hiding soft keys on certain android phones
@@ -97,19 +113,17 @@ class Myrmidon_Backend(Entity):
         self.widget.width = Window.width
         self.widget.height = Window.height
 
-        # If our z order is potentially dirty then we need to completely redraw
+        # If our z order has changed then we need to completely redraw
         # everything, se we clear the canvas and draw list, then get the proper order.
+        if not self.draw_order_changes == Game.draw_order.changes:
+            self.draw_list_dirty = True
         if self.draw_list_dirty:
             self.widget.canvas.clear()
             self.entity_draws = {}
             self.letter_boxes = []
 
             self.entity_list_draw_order = entity_list
-            self.entity_list_draw_order.sort(
-                key=lambda object:
-                object.z if hasattr(object, "z") else 0,
-                reverse = True
-                )
+            self.draw_order_changes = Game.draw_order.changes
             self.draw_list_dirty = False
 
         # Now render for each entity
@@ -117,7 +131,7 @@ class Myrmidon_Backend(Entity):
             if not entity.drawing:
                 continue
 
-            if entity.image and getattr(entity.image, "image", None) and entity.image.width and entity.image.height:
+            if entity.normal_draw and entity.image and getattr(entity.image, "image", None) and entity.image.width and entity.image.height:
 
                 # Work out the real width/height and screen position of the entity
                 size = ((entity.image.width) * (entity.scale * Game.device_scale), (entity.image.height) * (entity.scale * Game.device_scale))
@@ -129,15 +143,20 @@ class Myrmidon_Backend(Entity):
                     pos = ((x * Game.device_scale) - Game.global_x_pos_adjust, (y * Game.device_scale) - Game.global_y_pos_adjust)
                 cen = entity.get_centre_point()
 
-                # Figure out how the textures are drawn to accommodate for image flippery
-                w, h = self.get_dimensions_for_texture_coords(entity.image.width, entity.image.height)
-                tex_coords = (0, h, w, h, w, 0, 0, 0)
+                # Figure out how the textures are drawn to accommodate for image flippery.
+                # Images in an atlas only use their own region of the texture.
+                if entity.image.uvs is None:
+                    l, t = 0, 0
+                    r, b = self.get_dimensions_for_texture_coords(entity.image.width, entity.image.height)
+                else:
+                    l, t, r, b = entity.image.uvs[entity.image_seq]
+                tex_coords = (l, b, r, b, r, t, l, t)
                 if entity.flip_vertical and entity.flip_horizontal:
-                    tex_coords = (w, 0, 0, 0, 0, h, w, h)
+                    tex_coords = (r, t, l, t, l, b, r, b)
                 elif entity.flip_vertical:
-                    tex_coords = (0, 0, w, 0, w, h, 0, h)
+                    tex_coords = (l, t, r, t, r, b, l, b)
                 elif entity.flip_horizontal:
-                    tex_coords = (w, h, 0, h, 0, 0, w, 0)
+                    tex_coords = (r, b, l, b, l, t, r, t)
 
                 # If this entity hasn't yet been attached to the canvas then do so
                 if entity not in self.entity_draws:
@@ -190,6 +209,54 @@ class Myrmidon_Backend(Entity):
                         )
                     PopMatrix()                
 
+    def draw_particles(self, emitter):
+        vertices, tex_coords, colours = emitter.get_vertex_arrays()
+
+        # Create the meshes for this emitter the first time round
+        draws = self.entity_draws.get(emitter)
+        if draws is None:
+            draws = self.entity_draws[emitter] = {'meshes' : []}
+            draws['context'] = RenderContext(use_parent_projection = True, use_parent_modelview = True)
+            draws['context'].shader.vs = particle_vertex_shader
+            draws['context'].shader.fs = particle_fragment_shader
+            self.widget.canvas.add(draws['context'])
+            with draws['context']:
+                if emitter.blend:
+                    Callback(lambda instr: glBlendFunc(GL_SRC_ALPHA, GL_ONE))
+                else:
+                    platform.create_blend_instruction(emitter)
+        needed = int(math.ceil(float(len(vertices) // 4) / self.particles_per_mesh))
+        while len(draws['meshes']) < needed:
+            with draws['context']:
+                draws['meshes'].append(Mesh(fmt = particle_vertex_format, mode = 'triangles'))
+
+        # Convert to screen space, Kivy has y going up the screen
+        interleaved = numpy.empty((len(vertices), 8), numpy.float32)
+        interleaved[:, 0] = vertices[:, 0] * Game.device_scale - Game.global_x_pos_adjust
+        interleaved[:, 1] = (Game.screen_resolution[1] - vertices[:, 1]) * Game.device_scale
+        if not Game.screen_size_adjustment_compatability_mode:
+            interleaved[:, 1] -= Game.global_y_pos_adjust
+        if emitter.image.uvs is None:
+            left, top = 0, 0
+            right, bottom = self.get_dimensions_for_texture_coords(emitter.image.width, emitter.image.height)
+        else:
+            left, top, right, bottom = emitter.image.uvs[0]
+        interleaved[:, 2] = left + tex_coords[:, 0] * (right - left)
+        interleaved[:, 3] = top + tex_coords[:, 1] * (bottom - top)
+        interleaved[:, 4:8] = platform.prepare_particle_colours(colours)
+
+        vertices_per_mesh = self.particles_per_mesh * 4
+        for i, mesh in enumerate(draws['meshes']):
+            chunk = interleaved[i * vertices_per_mesh:(i + 1) * vertices_per_mesh]
+            data = array('f')
+            if hasattr(data, 'frombytes'):
+                data.frombytes(chunk.tobytes())
+            else:
+                data.fromstring(chunk.tostring())
+            mesh.texture = emitter.image.image.texture
+            mesh.vertices = data
+            mesh.indices = particle_indices(len(chunk) // 4, self.particles_per_mesh)
+
     def get_dimensions_for_texture_coords(self, o_width, o_height):
         """Returns two values between 0 and 1 representing the width and height of
         an image ready to use for texture coords. It takes into account the padding
@@ -228,6 +295,9 @@ class Myrmidon_Backend(Entity):
     def register_entity(self, entity):
         self.draw_list_dirty = True
 
+    def register_entities(self, entities):
+        self.draw_list_dirty = True
+
     def remove_entity(self, entity):
         self.draw_list_dirty = True
 
@@ -238,7 +308,7 @@ class Myrmidon_Backend(Entity):
         pass
 
     def alter_z(self, entity, z):
-        self.draw_list_dirty = True
+        pass
 
     def alter_image(self, entity, image):
         pass
@@ -273,6 +343,43 @@ class Myrmidon_Backend(Entity):
     def rgb_to_colour(self, colour):
         return tuple([c/255.0 for c in colour])
 
+    def load_atlas(self, images, max_size = 2048, padding = 1, cache_file = None):
+        return self.get_atlas_builder().build(images, max_size, padding, cache_file)
+
+    def get_atlas_builder(self):
+        if self.atlas_builder is None:
+            self.atlas_builder = self.AtlasBuilder(Game.atlas_page_size)
+        return self.atlas_builder
+
+    class AtlasBuilder(BaseAtlasBuilder):
+
+        def load_source(self, image):
+            if isinstance(image, str):
+                try:
+                    image = Kivy_Image(image, nocache=True)
+                except:
+                    raise MyrmidonError("Couldn't load image from " + image)
+            else:
+                image = Kivy_Image(image, nocache=True)
+            return image.texture, image.width, image.height
+
+        def create_page(self, width, height):
+            # Atlases aren't mipmapped, smaller levels would blend neighbouring images together
+            return Texture.create(size=(width, height), colorfmt='rgba', mipmap=False)
+
+        def copy_to_page(self, texture, source, x, y):
+            # Rows are copied in the order the source texture holds them, so a region keeps
+            # the same way up as the image did on its own
+            texture.blit_buffer(source.pixels, pos=(x, y), size=source.size, colorfmt='rgba')
+
+        def make_image(self, texture, uvs, width, height, entry):
+            image = Myrmidon_Backend.Image(texture, atlas=False)
+            if isinstance(entry["image"], str):
+                image.filename = entry["image"]
+            image.is_sequence_image = entry["sequence"]
+            image.set_texture_regions(uvs, width, height)
+            return image
+
     class Image(object):
         EMPTY_IMAGE = Kivy_Image(Texture.create(size=(0, 0)), nocache=True)
 
@@ -280,8 +387,15 @@ class Myrmidon_Backend(Entity):
         height = 0
         filename = None
         is_sequence_image = False
-
-        def __init__(self, image=None, sequence=False, width=None, height=None, mipmap=True):
+        # (left, top, right, bottom) texture coordinates of each frame if it's part of
+        # a larger texture, None if the image uses all of its texture
+        uvs = None
+        # True if the texture is shared with other Images and should not be freed with this one
+        in_atlas = False
+
+        def __init__(self, image=None, sequence=False, width=None, height=None, mipmap=True, atlas=None):
+            """The atlas argument can be set to True or False to put this image in a shared
+            texture or not, instead of following Game.auto_atlas."""
             if image is None:
                 self.image = self.EMPTY_IMAGE
                 self.width = 0
@@ -299,18 +413,43 @@ class Myrmidon_Backend(Entity):
                 self.image = Kivy_Image(image, nocache=True)
             self.width = self.image.width
             self.height = self.image.height
+            if Game.auto_atlas if atlas is None else atlas:
+                builder = Game.engine['gfx'].get_atlas_builder()
+                placed = builder.auto_place(self.image.texture, self.width, self.height)
+                if not placed is None:
+                    texture, x, y = placed
+                    self.image = Kivy_Image(texture, nocache=True)
+                    self.is_sequence_image = sequence
+                    frame_size, uvs = frame_uvs((builder.page_size, builder.page_size), x, y,
+                        self.width, self.height, sequence, width, height)
+                    self.set_texture_regions(uvs, frame_size[0], frame_size[1])
+                    return
             # on iOS, loading of images is deferred until the texture is first bound. Bind the texture to force it
             # to load
             if kivy.platform == 'ios':
                 self.image.texture.bind()
 
+        def set_texture_regions(self, uvs, width, height):
+            """Makes each frame of this image a region of its texture, which is shared
+            with other images.
+
+            Keyword arguments:
+            -- uvs: List of the (left, top, right, bottom) texture coordinates of each frame.
+            -- width: Width of each frame in pixels.
+            -- height: Height of each frame in pixels.
+            """
+            self.width = width
+            self.height = height
+            self.uvs = uvs
+            self.in_atlas = True
+
         def destroy(self):
             """
             Explicitly removes this image from the video memory
             This functionality requires the custom kivy version at
             http://github.com/arcticshores/kivy
             """
-            if self.image is None or self.image is self.EMPTY_IMAGE:
+            if self.image is None or self.image is self.EMPTY_IMAGE or self.in_atlas:
                 return
 
             from kivy.graphics.opengl import glBindTexture, glDeleteTextures
@@ -669,12 +808,53 @@ class Myrmidon_Backend(Entity):
                 return
 
             self.text_image_size = label.texture_size
-            self.image = Myrmidon_Backend.Image(label.texture)
+            self.image = Myrmidon_Backend.Image(label.texture, atlas=False)
             self._update_centre_point(self.alignment)
 
     Text = DefaultText
 
 
+# Particles are drawn with a shader that takes a colour for each vertex
+particle_vertex_format = [
+    (b'vPosition', 2, 'float'),
+    (b'vTexCoords0', 2, 'float'),
+    (b'vColor', 4, 'float'),
+    ]
+
+particle_vertex_shader = """
+$HEADER$
+attribute vec4 vColor;
+void main(void)
+{
+  frag_color = vColor * vec4(1.0, 1.0, 1.0, opacity);
+  tex_coord0 = vTexCoords0;
+  gl_Position = projection_mat * modelview_mat * vec4(vPosition.xy, 0.0, 1.0);
+}
+"""
+
+particle_fragment_shader = """
+$HEADER$
+void main(void)
+{
+  gl_FragColor = frag_color * texture2D(texture0, tex_coord0);
+}
+"""
+
+particle_index_buffer = array('H')
+
+def particle_indices(count, capacity):
+    """Returns the mesh indices for drawing a number of particle quads as two triangles
+    each, as an array of 16 bit ints. A single buffer is built for capacity quads
+    the first time and every count is given a slice of it."""
+    global particle_index_buffer
+    capacity = max(count, capacity)
+    if len(particle_index_buffer) < capacity * 6:
+        particle_index_buffer = array('H', [
+            corner + (quad * 4) for quad in range(capacity) for corner in (0, 1, 2, 2, 3, 0)
+            ])
+    return particle_index_buffer[:count * 6]
+
+
 # Platform specific functions
 class DefaultPlatform(object):
 
@@ -694,6 +874,11 @@ class DefaultPlatform(object):
         instruction.rgb = entity.colour
         instruction.a = entity.alpha
 
+    @staticmethod
+    def prepare_particle_colours(colours):
+        """Returns the array of particle vertex colours ready to be drawn"""
+        return colours
+
 
 class ApplePlatform(object):
 
@@ -730,6 +915,14 @@ class ApplePlatform(object):
             instruction.rgb = entity.colour[0]*entity.alpha, entity.colour[1]*entity.alpha, entity.colour[2]*entity.alpha
             instruction.a = entity.alpha
 
+    @staticmethod
+    def prepare_particle_colours(colours):
+        """Returns the array of particle vertex colours ready to be drawn"""
+        # images are loaded with pre-multiplied alpha so the colours must be too
+        colours = colours.copy()
+        colours[:, 0:3] *= colours[:, 3:4]
+        return colours
+
 
 platform = {
     'ios': ApplePlatform,
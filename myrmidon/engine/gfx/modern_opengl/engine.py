@@ -42,18 +42,22 @@ from OpenGL.GL.shaders import *
 from OpenGL.arrays import *
 from OpenGL.arrays.vbo import *
 from OpenGL.GLU import *
+import numpy
 from numpy import array
 from collections import defaultdict
 
 from myrmidon import Game, Entity, MyrmidonError
 from myrmidon.consts import *
+from myrmidon.texture_atlas import AtlasBuilder as BaseAtlasBuilder, frame_uvs
 
 
 class Myrmidon_Backend(object):
     plugins = {}
     
     clear_colour = (0.0, 0.0, 0.0, 1.0)
-    entities_z_order_list = []
+    # Which alter_* methods need calling when an Entity changes. Entity types that
+    # skip notifying the gfx engine, like LightEntity, check this first.
+    alter_hooks_required = ()
 
     max_textures = 2
 
@@ -65,6 +69,7 @@ class Myrmidon_Backend(object):
     vertex_buffer = None
 
     textures = []
+    atlas_builder = None
 
     def __init__(self):
         Game.load_engine_plugins(self, "gfx")
@@ -148,23 +153,23 @@ class Myrmidon_Backend(object):
 
 
     def draw_entities(self, entity_list):
-        if self.z_order_dirty == True:
-            self.entities_z_order_list.sort(
-                reverse=True,
-                key=lambda object:
-                    object.z if hasattr(object, "z") else 0
-                )
-            self.z_order_dirty = False
-
         glLoadIdentity()
 
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
         
-        # organise entities by graphic
+        # organise entities by graphic, ones that draw themselves (like particle
+        # emitters) are kept separately and drawn after the others at their depth
         entity_by_z = {}
-        for g in self.entities_z_order_list:
-            if g.image and g._drawing:
+        custom_draw_by_z = {}
+        for g in entity_list:
+            if not g._drawing:
+                continue
+            if not g.normal_draw:
+                if not g.z in custom_draw_by_z:
+                    custom_draw_by_z[g.z] = []
+                custom_draw_by_z[g.z].append(g)
+            elif g.image:
                 if not g.z in entity_by_z:
                     entity_by_z[g.z] = {}
                 
@@ -183,10 +188,10 @@ class Myrmidon_Backend(object):
             glUniform2f(self.uniforms["screen_resolution"], Game.screen_resolution[0], Game.screen_resolution[1])
             
             # render in batches grouped by texture
-            for z_value in entity_by_z:
+            for z_value in sorted(set(entity_by_z) | set(custom_draw_by_z), reverse = True):
                 pass_entities = {}	
 
-                for img in entity_by_z[z_value]:
+                for img in entity_by_z.get(z_value, ()):
                     pass_entities[img] = entity_by_z[z_value][img]			
 
                     if len(pass_entities) >= self.max_textures:
@@ -195,16 +200,51 @@ class Myrmidon_Backend(object):
 
                 if len(pass_entities) > 0:
                     self.render_batch(pass_entities)
+
+                for g in custom_draw_by_z.get(z_value, ()):
+                    g.draw()
                 
         finally:
             glUseProgram(0)
 
         
     def render_batch(self, entities):
+        texture_lookup = self.bind_textures(entities)
+
+        # Sum all the objects into one giant list and prepare the vertex buffer
+        master_entity_list = sum(entities.values(),[])
+        self.prepare_vertex_buffers(master_entity_list, texture_lookup)		
+        self.draw_vertex_buffer(4*len(master_entity_list))
+
+
+    def draw_particles(self, emitter):
+        if not emitter.particle_count:
+            return
+        # The whole emitter is one batch using a single texture
+        self.bind_textures([emitter.image.surfaces[0]])
+        vertices, tex_coords, colours = emitter.get_vertex_arrays()
+        if not emitter.image.uvs is None:
+            left, top, right, bottom = emitter.image.uvs[0]
+            tex_coords = tex_coords * (right - left, bottom - top) + (left, top)
+        vertex_array = numpy.zeros((len(vertices), 12), 'f')
+        vertex_array[:, 0:2] = vertices
+        vertex_array[:, 3] = 1.0
+        vertex_array[:, 4:8] = colours
+        vertex_array[:, 8:10] = tex_coords
+        vertex_array[:, 11] = 1.0
+        self.vertex_buffer.set_array(vertex_array)
+        if emitter.blend:
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE)
+        self.draw_vertex_buffer(len(vertices))
+        if emitter.blend:
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+
+    def bind_textures(self, textures):
         # Give each image a number for OpenGL to reference them by
         # and bind them
         texture_lookup = {}
-        for i,t in enumerate(entities):
+        for i,t in enumerate(textures):
             texture_lookup[t] = i
             # Programatically accessing the GL_TEXTURE* globals and activating them
             glActiveTexture(globals()["GL_TEXTURE%d" % i])
@@ -213,14 +253,15 @@ class Myrmidon_Backend(object):
 
         # OpenGL requires all image slots to be filled, so we throw
         # any old shit in to fill it all up.
-        for i in range(len(entities), self.max_textures):
+        for i in range(len(textures), self.max_textures):
             glActiveTexture(globals()["GL_TEXTURE%d" % i])
             glBindTexture(GL_TEXTURE_2D, self.textures[0])
             glUniform1i(self.uniforms["textures[%d]" % i], i)		
 
-        # Sum all the objects into one giant list and prepare the vertex buffer
-        master_entity_list = sum(entities.values(),[])
-        self.prepare_vertex_buffers(master_entity_list, texture_lookup)		
+        return texture_lookup
+
+
+    def draw_vertex_buffer(self, vertex_count):
         self.vertex_buffer.bind()
 
         try:
@@ -255,7 +296,7 @@ class Myrmidon_Backend(object):
                 self.vertex_buffer + (8 * 4)
                 )
 
-            glDrawArrays(GL_QUADS, 0, 4*len(master_entity_list))
+            glDrawArrays(GL_QUADS, 0, vertex_count)
 
         finally:
             self.vertex_buffer.unbind()        
@@ -273,34 +314,40 @@ class Myrmidon_Backend(object):
 
             entity_width = g.image.width
             entity_height = g.image.height
+            draw_x, draw_y = g.get_interpolated_position()
+            # Images in an atlas only use their own region of the texture
+            if g.image.uvs is None:
+                left, top, right, bottom = 0.0, 0.0, 1.0, 1.0
+            else:
+                left, top, right, bottom = g.image.uvs[g.image_seq]
 
             vertex_array.append(
-                self.coordinate_transform(-1.0, 1.0, entity_width * g.scale, entity_height * g.scale, cosr, sinr, g.x, g.y)
+                self.coordinate_transform(-1.0, 1.0, entity_width * g.scale, entity_height * g.scale, cosr, sinr, draw_x, draw_y)
                 + (0.0, 1.0)
                 + g.colour
                 + (g.alpha,)
-                + (0.0, 1.0, texture_lookup[g.image.surfaces[g.image_seq]], 1.0)
+                + (left, bottom, texture_lookup[g.image.surfaces[g.image_seq]], 1.0)
                 )			
             vertex_array.append(
-                self.coordinate_transform(1.0, 1.0, entity_width * g.scale, entity_height * g.scale, cosr, sinr, g.x, g.y)
+                self.coordinate_transform(1.0, 1.0, entity_width * g.scale, entity_height * g.scale, cosr, sinr, draw_x, draw_y)
                 + (0.0, 1.0)
                 + g.colour
                 + (g.alpha,)
-                + (1.0, 1.0, texture_lookup[g.image.surfaces[g.image_seq]], 1.0)
+                + (right, bottom, texture_lookup[g.image.surfaces[g.image_seq]], 1.0)
                 )			
             vertex_array.append(				
-                self.coordinate_transform(1.0, -1.0, entity_width * g.scale, entity_height * g.scale, cosr, sinr, g.x, g.y)
+                self.coordinate_transform(1.0, -1.0, entity_width * g.scale, entity_height * g.scale, cosr, sinr, draw_x, draw_y)
                 + (0.0, 1.0)
                 + g.colour
                 + (g.alpha,)
-                + (1.0, 0.0, texture_lookup[g.image.surfaces[g.image_seq]], 1.0)
+                + (right, top, texture_lookup[g.image.surfaces[g.image_seq]], 1.0)
             )		
             vertex_array.append(
-                self.coordinate_transform(-1.0, -1.0, entity_width * g.scale, entity_height * g.scale, cosr, sinr, g.x, g.y)
+                self.coordinate_transform(-1.0, -1.0, entity_width * g.scale, entity_height * g.scale, cosr, sinr, draw_x, draw_y)
                 + (0.0, 1.0)
                 + g.colour
                 + (g.alpha,)
-                + (0.0, 0.0, texture_lookup[g.image.surfaces[g.image_seq]], 1.0)
+                + (left, top, texture_lookup[g.image.surfaces[g.image_seq]], 1.0)
                 )
 
         self.vertex_buffer.set_array(array(vertex_array, 'f'))        
@@ -317,12 +364,15 @@ class Myrmidon_Backend(object):
 
 
     def register_entity(self, entity):
-        self.entities_z_order_list.append(entity)
-        self.z_order_dirty = True
+        pass
+
+
+    def register_entities(self, entities):
+        pass
 
 
     def remove_entity(self, entity):
-        self.entities_z_order_list.remove(entity)
+        pass
 
 
     def alter_x(self, entity, x):
@@ -334,7 +384,7 @@ class Myrmidon_Backend(object):
 
 
     def alter_z(self, entity, z):
-        self.z_order_dirty = True
+        pass
 
 
     def alter_image(self, entity, image):
@@ -357,6 +407,10 @@ class Myrmidon_Backend(object):
         pass
 
 
+    def alter_display(self, entity, display):
+        pass
+
+
     def new_image(self, width, height, colour = None):
         return Myrmidon_Backend.Image()
 
@@ -380,13 +434,66 @@ class Myrmidon_Backend(object):
         return tuple(col)
 
 
+    def load_atlas(self, images, max_size = 2048, padding = 1, cache_file = None):
+        return self.get_atlas_builder().build(images, max_size, padding, cache_file)
+
+    def get_atlas_builder(self):
+        if self.atlas_builder is None:
+            self.atlas_builder = self.AtlasBuilder(Game.atlas_page_size)
+        return self.atlas_builder
+
+    class AtlasBuilder(BaseAtlasBuilder):
+
+        def load_source(self, image):
+            if isinstance(image, str):
+                try:
+                    surface = pygame.image.load(image)
+                except:
+                    raise MyrmidonError("Couldn't load image from " + image)
+            else:
+                surface = image
+            return surface, surface.get_width(), surface.get_height()
+
+        def create_page(self, width, height):
+            # Atlases aren't mipmapped, smaller levels would blend neighbouring images together
+            tex = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, tex)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            Game.engine['gfx'].textures.append(tex)
+            return tex
+
+        def copy_to_page(self, texture, source, x, y):
+            data = pygame.image.tostring(source, "RGBA")
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexSubImage2D(GL_TEXTURE_2D, 0, x, y, source.get_width(), source.get_height(), GL_RGBA, GL_UNSIGNED_BYTE, data)
+
+        def make_image(self, texture, uvs, width, height, entry):
+            image = Myrmidon_Backend.Image()
+            if isinstance(entry["image"], str):
+                image.filename = entry["image"]
+            image.is_sequence_image = entry["sequence"]
+            image.set_texture_regions(texture, uvs, width, height)
+            image.in_atlas = True
+            return image
+
     class Image(object):
         surfaces = []
         surface = None
         width = 0
         height = 0
-
-        def __init__(self, image = None, sequence = False, width = None, height = None):
+        filename = None
+        is_sequence_image = False
+        # (left, top, right, bottom) texture coordinates of each frame if it's part of
+        # a larger texture, None if each frame uses all of its texture
+        uvs = None
+        # True if the texture is shared with other Images and should not be freed with this one
+        in_atlas = False
+
+        def __init__(self, image = None, sequence = False, width = None, height = None, atlas = None):
+            """The atlas argument can be set to True or False to put this image in a shared
+            texture or not, instead of following Game.auto_atlas."""
             self.surfaces = []
 
             if image == None:
@@ -400,6 +507,18 @@ class Myrmidon_Backend(object):
             else:
                 raw_surface = image
 
+            if Game.auto_atlas if atlas is None else atlas:
+                builder = Game.engine['gfx'].get_atlas_builder()
+                placed = builder.auto_place(raw_surface, raw_surface.get_width(), raw_surface.get_height())
+                if not placed is None:
+                    texture, x, y = placed
+                    self.is_sequence_image = sequence
+                    frame_size, uvs = frame_uvs((builder.page_size, builder.page_size), x, y,
+                        raw_surface.get_width(), raw_surface.get_height(), sequence, width, height)
+                    self.set_texture_regions(texture, uvs, frame_size[0], frame_size[1])
+                    self.in_atlas = True
+                    return
+
             self.width = (width if not width == None else raw_surface.get_width())
             self.height = (height if not height == None else raw_surface.get_height())
             self.surface = self.gl_image_from_surface(raw_surface, self.width, self.height)
@@ -407,6 +526,21 @@ class Myrmidon_Backend(object):
             Game.engine['gfx'].textures.append(self.surface)
             
 
+        def set_texture_regions(self, texture, uvs, width, height):
+            """Makes each frame of this image a region of a single texture.
+
+            Keyword arguments:
+            -- texture: The texture the frames are in.
+            -- uvs: List of the (left, top, right, bottom) texture coordinates of each frame.
+            -- width: Width of each frame in pixels.
+            -- height: Height of each frame in pixels.
+            """
+            self.width = width
+            self.height = height
+            self.uvs = uvs
+            self.surfaces = [texture] * len(uvs)
+            self.surface = texture
+
         def gl_image_from_surface(self, raw_surface, width, height):
             data = pygame.image.tostring(raw_surface, "RGBA")
 
@@ -420,6 +554,8 @@ class Myrmidon_Backend(object):
 
         
         def __del__(self):
+            if self.in_atlas:
+                return
             for surf in self.surfaces:
                 glDeleteTextures(surf)
                 Game.engine['gfx'].textures.remove(surf)
@@ -479,7 +615,7 @@ class Myrmidon_Backend(object):
             new_surface.blit(font_image, (0, 0))
 
             # Create an image from it
-            self.image = Myrmidon_Backend.Image(new_surface)
+            self.image = Myrmidon_Backend.Image(new_surface, atlas = False)
          
 
         # text
@@ -44,17 +44,32 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 from pygame.locals import *
 
-from myrmidon import Game, Entity, BaseImage, MyrmidonError
+from myrmidon import Game, Entity, LightEntity, BaseImage, MyrmidonError
 from myrmidon.consts import *
+from myrmidon.sprite_batch import SpriteBatch, SpriteRun
+from myrmidon.texture_atlas import AtlasBuilder as BaseAtlasBuilder, frame_uvs
 
 
 class Myrmidon_Backend(object):
 
     clear_colour = (0.0, 0.0, 0.0, 1.0)
+    # Which alter_* methods need calling when an Entity changes. Entity types that
+    # skip notifying the gfx engine, like LightEntity, check this first.
+    alter_hooks_required = ('image',)
 
-    z_order_dirty = True
-    entities_z_order_list = []
     last_image = None
+    # (image, frame) whose vertex and texture coordinate arrays are set
+    last_image_frame = None
+    atlas_builder = None
+    # When True, and NumPy is available, sprites are drawn in batches, each run of
+    # consecutive Entities that share a texture, blend mode and clip area going
+    # to the GPU in one call. Otherwise each Entity is drawn on its own.
+    batch_sprites = True
+    sprite_batch = None
+    # When True, Entities that share a z value are reordered so that ones with the
+    # same blend mode, clip area and texture are drawn together, cutting down on
+    # how often GL state has to change. Their order within a z value is otherwise kept.
+    sort_render_state = False
     if numpy_available:
         text_coords = numpy.array([1.0, 1.0, 0.0, 1.0, 1.0, 0.0, 0.0, 0.0])
     else:
@@ -90,25 +105,106 @@ class Myrmidon_Backend(object):
         pygame.display.flip()
 
     def draw_entities(self, entity_list):
-        if self.z_order_dirty == True:
-            self.entities_z_order_list.sort(
-                    reverse=True,
-                    key=lambda object:
-                    object.z if hasattr(object, "z") else 0
-                    )
-            self.z_order_dirty = False
-
         self.last_image = None
+        self.last_image_frame = None
 
         glEnableClientState(GL_VERTEX_ARRAY)
         glEnableClientState(GL_TEXTURE_COORD_ARRAY)
-        glTexCoordPointer(2, GL_FLOAT, 0, self.text_coords)
 
-        list(map(self.draw_single_entity, self.entities_z_order_list))
+        if self.sprite_batch is None:
+            self.sprite_batch = SpriteBatch(plain_draw_classes = (Entity, LightEntity))
+        entities = entity_list
+        if self.sort_render_state:
+            entities = self.sprite_batch.state_sorted(entities)
+
+        if self.batch_sprites and numpy_available:
+            self.draw_sprite_batch(entities)
+        else:
+            list(map(self.draw_single_entity, entities))
 
         glDisableClientState(GL_TEXTURE_COORD_ARRAY)
         glDisableClientState(GL_VERTEX_ARRAY)
 
+    def draw_sprite_batch(self, entity_list):
+        batch = self.sprite_batch
+        batch.clear()
+        for entity in entity_list:
+            if entity.drawing:
+                batch.add(entity)
+        if not batch.steps:
+            return
+
+        vertices = tex_coords = colours = None
+        if batch.sprites:
+            vertices, tex_coords, colours = batch.build()
+        glEnable(GL_TEXTURE_2D)
+        stats = Game.render_stats
+        arrays_set = False
+        bound_texture = None
+        # GL state is only changed when a run needs it to be different
+        blending = False
+        clip = None
+
+        for step in batch.steps:
+            if isinstance(step, SpriteRun):
+                if not arrays_set:
+                    glEnableClientState(GL_COLOR_ARRAY)
+                    glVertexPointer(2, GL_FLOAT, 0, vertices)
+                    glTexCoordPointer(2, GL_FLOAT, 0, tex_coords)
+                    glColorPointer(4, GL_FLOAT, 0, colours)
+                    arrays_set = True
+                if not step.clip == clip:
+                    if step.clip is None:
+                        glDisable(GL_SCISSOR_TEST)
+                    else:
+                        if clip is None:
+                            glEnable(GL_SCISSOR_TEST)
+                        # glScissor assumes origin as bottom-left rather than top-left which explains the fudging with the second param
+                        glScissor(int(step.clip[0][0]), Game.screen_resolution[1] - int(step.clip[0][1]) - int(step.clip[1][1]), int(step.clip[1][0]), int(step.clip[1][1]))
+                    clip = step.clip
+                    stats['state_changes'] += 1
+                if not bool(step.blend) == blending:
+                    blending = bool(step.blend)
+                    glBlendFunc(GL_SRC_ALPHA, GL_ONE if blending else GL_ONE_MINUS_SRC_ALPHA)
+                    stats['state_changes'] += 1
+                if not bound_texture == step.texture:
+                    glBindTexture(GL_TEXTURE_2D, step.texture)
+                    bound_texture = step.texture
+                    stats['texture_binds'] += 1
+                glDrawArrays(GL_QUADS, step.first * 4, step.count * 4)
+                stats['draw_calls'] += 1
+            else:
+                # Custom draw methods expect things how single entity drawing leaves them
+                blending, clip = self.reset_batch_state(blending, clip)
+                if arrays_set:
+                    glDisableClientState(GL_COLOR_ARRAY)
+                    arrays_set = False
+                glTexCoordPointer(2, GL_FLOAT, 0, self.text_coords)
+                glColor4f(1.0, 1.0, 1.0, 1.0)
+                self.last_image = None
+                self.last_image_frame = None
+                step.draw()
+                bound_texture = None
+
+        self.reset_batch_state(blending, clip)
+        if arrays_set:
+            glDisableClientState(GL_COLOR_ARRAY)
+            glColor4f(1.0, 1.0, 1.0, 1.0)
+        glTexCoordPointer(2, GL_FLOAT, 0, self.text_coords)
+        self.last_image = None
+        self.last_image_frame = None
+
+    def reset_batch_state(self, blending, clip):
+        """Puts the blend mode and clipping back to their defaults after drawing
+        sprite runs, returns the new (blending, clip) state."""
+        if blending:
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+            Game.render_stats['state_changes'] += 1
+        if not clip is None:
+            glDisable(GL_SCISSOR_TEST)
+            Game.render_stats['state_changes'] += 1
+        return False, None
+
     def draw_single_entity(self, entity):
         if not entity.drawing:
             return
@@ -129,6 +225,7 @@ class Myrmidon_Backend(object):
             if not entity.clip is None:
                 glEnable(GL_SCISSOR_TEST)
                 glScissor(int(entity.clip[0][0]), Game.screen_resolution[1] - int(entity.clip[0][1]) - int(entity.clip[1][1]), int(entity.clip[1][0]), int(entity.clip[1][1]))
+                Game.render_stats['state_changes'] += 2
 
             # glrotate works by you translating to the point around which you wish to rotate
             # and applying the rotation you can translate back to apply the real translation
@@ -157,16 +254,24 @@ class Myrmidon_Backend(object):
             # bending function
             if entity.blend:
                 glBlendFunc(GL_SRC_ALPHA, GL_ONE)
+                Game.render_stats['state_changes'] += 2
                                 
             # draw the triangle strip
             glEnable(GL_TEXTURE_2D)
             if not self.last_image == entity.image.surfaces[entity.image_seq]:
                 glBindTexture(GL_TEXTURE_2D, entity.image.surfaces[entity.image_seq])
-                glVertexPointer(3, GL_FLOAT, 0, entity.image.vertex_data)
                 self.last_image = entity.image.surfaces[entity.image_seq]
+                Game.render_stats['texture_binds'] += 1
+            # Images in an atlas share a texture but each have their own region of it
+            image_frame = (entity.image, entity.image_seq)
+            if not self.last_image_frame == image_frame:
+                glVertexPointer(3, GL_FLOAT, 0, entity.image.vertex_data)
+                glTexCoordPointer(2, GL_FLOAT, 0, entity.image.frame_tex_coords[entity.image_seq])
+                self.last_image_frame = image_frame
                                 
             glColor4f(entity.colour[0], entity.colour[1], entity.colour[2], entity.alpha)
             glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+            Game.render_stats['draw_calls'] += 1
 
             # Set blending back to default
             if entity.blend:
@@ -180,14 +285,44 @@ class Myrmidon_Backend(object):
 
         entity.draw()
 
-    def register_entity(self, entity):
-        self.entities_z_order_list.append(entity)
-        self.z_order_dirty = True
-        if not entity.image:
+    def draw_particles(self, emitter):
+        if not emitter.particle_count:
             return
+        # Every particle goes in one set of arrays and is drawn with a single call
+        vertices, tex_coords, colours = emitter.get_vertex_arrays()
+        if not emitter.image.uvs is None:
+            left, top, right, bottom = emitter.image.uvs[0]
+            tex_coords = tex_coords * (right - left, bottom - top) + (left, top)
+        glEnable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, emitter.image.surfaces[0])
+        if emitter.blend:
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE)
+            Game.render_stats['state_changes'] += 2
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, vertices)
+        glTexCoordPointer(2, GL_FLOAT, 0, tex_coords)
+        glColorPointer(4, GL_FLOAT, 0, colours)
+        glDrawArrays(GL_QUADS, 0, len(vertices))
+        Game.render_stats['texture_binds'] += 1
+        Game.render_stats['draw_calls'] += 1
+        glDisableClientState(GL_COLOR_ARRAY)
+
+        # Put things back how single entities expect them
+        glTexCoordPointer(2, GL_FLOAT, 0, self.text_coords)
+        glColor4f(1.0, 1.0, 1.0, 1.0)
+        if emitter.blend:
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        self.last_image = None
+        self.last_image_frame = None
+
+    def register_entity(self, entity):
+        pass
+
+    def register_entities(self, entities):
+        pass
 
     def remove_entity(self, entity):
-        self.entities_z_order_list.remove(entity)             
+        pass
 
     def alter_x(self, entity, x):
         pass
@@ -196,7 +331,7 @@ class Myrmidon_Backend(object):
         pass
 
     def alter_z(self, entity, z):
-        self.z_order_dirty = True
+        pass
 
     def alter_image(self, entity, image):
         if not entity.image:
@@ -240,6 +375,53 @@ class Myrmidon_Backend(object):
             col.append(a/255.0)
         return tuple(col)
 
+    def load_atlas(self, images, max_size = 2048, padding = 1, cache_file = None):
+        return self.get_atlas_builder().build(images, max_size, padding, cache_file)
+
+    def get_atlas_builder(self):
+        if self.atlas_builder is None:
+            self.atlas_builder = self.AtlasBuilder(Game.atlas_page_size)
+        return self.atlas_builder
+
+    class AtlasBuilder(BaseAtlasBuilder):
+
+        def load_source(self, image):
+            if isinstance(image, str):
+                try:
+                    surface = pygame.image.load(image).convert_alpha()
+                except:
+                    raise MyrmidonError("Couldn't load image from " + image)
+            else:
+                surface = image
+            return surface, surface.get_width(), surface.get_height()
+
+        def create_page(self, width, height):
+            # Atlases aren't mipmapped, smaller levels would blend neighbouring images together
+            tex = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, tex)
+            glTexEnvf(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+            Game.engine['gfx'].last_image = None
+            return tex
+
+        def copy_to_page(self, texture, source, x, y):
+            data = pygame.image.tostring(source, "RGBA", 0)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexSubImage2D(GL_TEXTURE_2D, 0, x, y, source.get_width(), source.get_height(), GL_RGBA, GL_UNSIGNED_BYTE, data)
+            Game.engine['gfx'].last_image = None
+
+        def make_image(self, texture, uvs, width, height, entry):
+            image = Myrmidon_Backend.Image(sequence = entry["sequence"])
+            if isinstance(entry["image"], str):
+                image.filename = entry["image"]
+            image.set_texture_regions(texture, uvs, width, height)
+            image.in_atlas = True
+            return image
+
     class Image(BaseImage):
                 
         surfaces = []
@@ -247,8 +429,12 @@ class Myrmidon_Backend(object):
         surface = None
 
         vertex_data = []
+        # Texture coordinates of each frame in the same order as the vertex data
+        frame_tex_coords = []
                 
-        def __init__(self, image = None, sequence = False, width = None, height = None, for_repeat = False):
+        def __init__(self, image = None, sequence = False, width = None, height = None, for_repeat = False, atlas = None):
+            """The atlas argument can be set to True or False to put this image in a shared
+            texture or not, instead of following Game.auto_atlas."""
             self.is_sequence_image = sequence
             self.surfaces = []
             self.surfaces_draw_lists = []
@@ -265,6 +451,17 @@ class Myrmidon_Backend(object):
             else:
                 raw_surface = image
 
+            if (Game.auto_atlas if atlas is None else atlas) and not for_repeat:
+                builder = Game.engine['gfx'].get_atlas_builder()
+                placed = builder.auto_place(raw_surface, raw_surface.get_width(), raw_surface.get_height())
+                if not placed is None:
+                    texture, x, y = placed
+                    frame_size, uvs = frame_uvs((builder.page_size, builder.page_size), x, y,
+                        raw_surface.get_width(), raw_surface.get_height(), sequence, width, height)
+                    self.set_texture_regions(texture, uvs, frame_size[0], frame_size[1])
+                    self.in_atlas = True
+                    return
+
             self.width = (width if not width == None else raw_surface.get_width())
 
             if sequence:
@@ -272,14 +469,24 @@ class Myrmidon_Backend(object):
                 rw = raw_surface.get_width()
                 rh = raw_surface.get_height()
 
-                for a in range(0, rh//self.height):
-                    for b in range(rw//self.width):
-                        surf = pygame.Surface((self.width, self.height), SRCALPHA, 32)
-                        surf.blit(raw_surface, (0,0), pygame.Rect((b*self.width, a*self.height), (self.width, self.height)))
-                        self.surfaces.append(self.gl_image_from_surface(surf, self.width, self.height, for_repeat))
-                        
-                self.surface = self.surfaces[:1]
-                                
+                if for_repeat:
+                    # Repeating wraps round the whole texture, so each frame needs its own
+                    for a in range(0, rh//self.height):
+                        for b in range(rw//self.width):
+                            surf = pygame.Surface((self.width, self.height), SRCALPHA, 32)
+                            surf.blit(raw_surface, (0,0), pygame.Rect((b*self.width, a*self.height), (self.width, self.height)))
+                            self.surfaces.append(self.gl_image_from_surface(surf, self.width, self.height, for_repeat))
+                    self.surface = self.surfaces[:1]
+                else:
+                    # The sheet goes up as one texture with each frame drawing its own region,
+                    # so changing frame doesn't change texture. Not mipmapped as smaller
+                    # levels would blend neighbouring frames together, and frame_uvs keeps
+                    # each frame half a texel in from its edges so filtering doesn't either.
+                    sheet = self.gl_image_from_surface(raw_surface, rw, rh, for_repeat, mipmap = False)
+                    frame_size, uvs = frame_uvs((rw, rh), 0, 0, rw, rh, True, self.width, self.height)
+                    self.set_texture_regions(sheet, uvs, frame_size[0], frame_size[1])
+                    return
+
             else:
                 self.height = (height if not height == None else raw_surface.get_height())
                 self.surface = self.gl_image_from_surface(raw_surface, self.width, self.height, for_repeat)
@@ -287,6 +494,22 @@ class Myrmidon_Backend(object):
 
             self.generate_vertex_data()
 
+        def set_texture_regions(self, texture, uvs, width, height):
+            """Makes each frame of this image a region of a single texture.
+
+            Keyword arguments:
+            -- texture: The texture the frames are in.
+            -- uvs: List of the (left, top, right, bottom) texture coordinates of each frame.
+            -- width: Width of each frame in pixels.
+            -- height: Height of each frame in pixels.
+            """
+            self.width = width
+            self.height = height
+            self.uvs = uvs
+            self.surfaces = [texture] * len(uvs)
+            self.surface = self.surfaces[:1] if self.is_sequence_image else texture
+            self.generate_vertex_data()
+
         def generate_vertex_data(self):
             if numpy_available:
                 self.vertex_data = numpy.array([float(self.width), float(self.height), 0.0,
@@ -298,8 +521,15 @@ class Myrmidon_Backend(object):
                                     0.0, float(self.height), 0.0,
                                     float(self.width), 0.0, 0.0,
                                     0.0, 0.0, 0.0]
+            if self.uvs is None:
+                self.frame_tex_coords = [Myrmidon_Backend.text_coords] * len(self.surfaces)
+                return
+            self.frame_tex_coords = []
+            for left, top, right, bottom in self.uvs:
+                tex_coords = [right, bottom, left, bottom, right, top, left, top]
+                self.frame_tex_coords.append(numpy.array(tex_coords) if numpy_available else tex_coords)
                 
-        def gl_image_from_surface(self, raw_surface, width, height, for_repeat):
+        def gl_image_from_surface(self, raw_surface, width, height, for_repeat, mipmap = True):
             data = pygame.image.tostring(raw_surface, "RGBA", 0)
 
             tex = glGenTextures(1)
@@ -311,10 +541,11 @@ class Myrmidon_Backend(object):
             else:
                 glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
                 glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
-            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_NEAREST)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_NEAREST if mipmap else GL_LINEAR)
             glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
             glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
-            gluBuild2DMipmaps(GL_TEXTURE_2D, 4, width, height, GL_RGBA, GL_UNSIGNED_BYTE, data)             
+            if mipmap:
+                gluBuild2DMipmaps(GL_TEXTURE_2D, 4, width, height, GL_RGBA, GL_UNSIGNED_BYTE, data)
                                 
             return tex
 
@@ -616,7 +847,9 @@ class Myrmidon_Backend(object):
             if not Game.engine['gfx'].last_image == self.image.surfaces[self.image_seq]:
                 glBindTexture(GL_TEXTURE_2D, self.image.surfaces[self.image_seq])
                 Game.engine['gfx'].last_image = self.image.surfaces[self.image_seq]
+                Game.engine['gfx'].last_image_frame = None
                 glVertexPointer(3, GL_FLOAT, 0, self.image.vertex_data)
+                glTexCoordPointer(2, GL_FLOAT, 0, self.image.frame_tex_coords[self.image_seq])
                        
             if self.shadow is not None:
                 glTranslatef(2, 2, 0.0)
@@ -679,7 +912,7 @@ class Myrmidon_Backend(object):
             new_surface = pygame.Surface((w, h), SRCALPHA, 32)
             new_surface.blit(font_image, (0, 0))
 
-            Game.engine['gfx'].text_texture_cache[self.font][self.text][1] = Myrmidon_Backend.Image(new_surface)
+            Game.engine['gfx'].text_texture_cache[self.font][self.text][1] = Myrmidon_Backend.Image(new_surface, atlas = False)
             self.image = Game.engine['gfx'].text_texture_cache[self.font][self.text][1]
             self.image.text_image_size = self.text_image_size
             return Game.engine['gfx'].text_texture_cache[self.font][self.text][1]
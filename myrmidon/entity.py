@@ -37,6 +37,7 @@ from myrmidon.consts import *
 from myrmidon.game import Game
 from myrmidon.base_entity import BaseEntity
 from myrmidon.module_loader import ModuleLoader
+from myrmidon.collision_shapes import BOUNDS_MARGIN, rectangle_shape
 
 EntityCollisionResult = namedtuple('EntityCollisionResult', ['result', 'entity'])
 
@@ -57,6 +58,10 @@ class Entity(BaseEntity):
     _centre_point = [-1, -1]
     _drawing = True
 
+    # Position before the last logic tick, used when drawing with a fixed timestep
+    _previous_x = None
+    _previous_y = None
+
     # Other properties (document)
     blend = False
     clip = None
@@ -65,6 +70,31 @@ class Entity(BaseEntity):
     flip_horizontal = False
     sleep_counter = 0
     
+    # Set to True in a subclass to have destroyed instances recycled when new ones
+    # are created instead of making new objects, which cuts down on garbage for types
+    # that are created and destroyed constantly, like bullets. Once recycled every
+    # attribute is back to its default, so don't keep hold of a destroyed pooled Entity.
+    pooled = False
+
+    # The most destroyed instances of a pooled class to keep for recycling.
+    pool_limit = 256
+
+    # Set to True in a subclass to keep x, y, rotation, scale, colour and alpha for every
+    # instance in NumPy arrays owned by Game. The properties still work as normal but
+    # the whole class can also be updated at once through Game.get_entity_store.
+    array_store = False
+
+    # Names of extra attributes to keep in the arrays for a class with array_store set.
+    # They start as 0.0 and are available as arrays on the store and as normal
+    # attributes on each instance, eg ('speed_x', 'speed_y').
+    array_store_fields = ()
+
+    # Can be defined as a classmethod taking the EntityArrayStore in a class with
+    # array_store set. It is called once a frame to update every instance together and
+    # instances are not executed individually after the first iteration of execute.
+    # Stopped instances are still in the store, see EntityArrayStore for skipping them.
+    batch_update = None
+
     # Entity relationships
     parent = None
     child = None
@@ -99,6 +129,17 @@ class Entity(BaseEntity):
     # Specifying None will just take the radius from the width of the image.
     collision_circle_radius = None
 
+    # Bit flags used by the collision pass the engine runs after every Entity has
+    # executed. collision_layer is which layers this Entity is on, 0 keeps it out
+    # of the pass entirely. collision_mask is which layers it collides with, two
+    # Entities are only tested against each other if both of their masks include
+    # one of the other's layers. Every overlapping pair has on_collision called on
+    # both Entities, once per frame.
+    # These are read when the Entity is created, call reset_collision_model if
+    # they are changed later.
+    collision_layer = 0
+    collision_mask = COLLISION_MASK_ALL
+
     # We use this to know if it's worth recalculating the corners for this
     # Entity as this can be a fairly costly procedure.
     _collision_rectangle_recalculate_corners = True
@@ -107,6 +148,14 @@ class Entity(BaseEntity):
     # recalculated once per frame if necessary but no more.
     _collision_rectangle_calculated_corners = {'ul' : (0.0, 0.0), 'ur' : (0.0, 0.0), 'll' : (0.0, 0.0), 'lr' : (0.0, 0.0)}
 
+    # The RectangleShape worked out from the corners, cleared whenever they are.
+    _collision_rectangle_shape = None
+
+    # If this Entity needs to be moved in the collision spatial hash before the
+    # next collision query. Entities start off dirty so no work is done when
+    # they move until the spatial hash has been created.
+    _collision_hash_dirty = True
+
     # Internal private properties
     _current_state = "execute"
     _previous_state = None
@@ -114,6 +163,23 @@ class Entity(BaseEntity):
     _state_generators = {}
     _is_text = False
     _executing = True
+    # Used by Game to manage the list of entities that can execute
+    _registration_order = 0
+    _active = False
+    _bucket = None
+    _wake_handle = None
+    # The EntityArrayStore holding this Entity's values if array_store is set
+    _store = None
+    _store_index = 0
+
+    def __new__(cls, *args, **kwargs):
+        if cls.pooled:
+            pool = Game.entity_pools.get(cls)
+            if pool:
+                Game.frame_stats['entities_recycled'] += 1
+                # Its attributes were cleared when it went into the pool
+                return pool.pop()
+        return BaseEntity.__new__(cls)
 
     def __init__(self, *args, **kwargs):
         if not Game.started:
@@ -137,6 +203,9 @@ class Entity(BaseEntity):
         for x in self._module_list:
             x._module_setup(self)
 
+        if self.collision_layer:
+            Game.collision_layer_update(self)
+
         if not Game.started:
             Game.started = True
             Game.run_game()
@@ -155,6 +224,16 @@ class Entity(BaseEntity):
         """
         pass
 
+    def on_collision(self, other):
+        """
+        Called by the collision pass at the end of Entity execution for every
+        Entity this one is overlapping, if collision_layer is set.
+
+        Keyword arguments:
+        -- other: The Entity being collided with.
+        """
+        pass
+
     def _iterate_generator(self):
         if not Game.started or not self._executing:
             return
@@ -232,7 +311,27 @@ class Entity(BaseEntity):
         constantly change the position of entity.
         Returns a tuple (x,y)"""
         centre = self.get_centre_point()
-        return self.x - (centre[0] * self.scale), self.y - (centre[1] * self.scale)
+        x, y = self.get_interpolated_position()
+        return x - (centre[0] * self.scale), y - (centre[1] * self.scale)
+
+    def get_interpolated_position(self):
+        """When Game.fixed_timestep is on this returns the position the
+        entity should be drawn at, blended between where it was before the
+        last logic tick and where it is now. Otherwise it returns the current
+        position as it is.
+        Returns a tuple (x,y)"""
+        if not Game.fixed_timestep or self._previous_x is None:
+            return self.x, self.y
+        alpha = Game.interpolation_alpha
+        return (self._previous_x + (self._x - self._previous_x) * alpha,
+                self._previous_y + (self._y - self._previous_y) * alpha)
+
+    def reset_interpolation(self):
+        """Stops the entity being drawn between its previous and current
+        position until the next logic tick. Call this after teleporting an
+        entity so it doesn't appear to slide across the screen."""
+        self._previous_x = self._x
+        self._previous_y = self._y
 
     def get_centre_point(self):
         """Returns the centre of the current image if the centre_point member
@@ -244,7 +343,7 @@ class Entity(BaseEntity):
 
     def is_alive(self):
         """Returns a boolean if the Entity is not destroyed yet."""
-        return self in Game.entity_list and self not in Game.entities_to_remove
+        return Game.entity_registry.get(self, False) is True
 
     def destroy(self, tree = False):
         """Kills this Entity, stopping it from executing and displaying and
@@ -323,7 +422,8 @@ class Entity(BaseEntity):
 
     def sleep(self, num_frames):
         """yield from this to sleep for a certain number of frames.
-        Sleeping entities will still execute."""
+        Sleeping entities are still counted as executing but are not
+        iterated at all until the frame they wake up on."""
         return int(num_frames)
     
 
@@ -356,22 +456,37 @@ class Entity(BaseEntity):
             y += self.collision_offset[1]
 
         # Rotate each point of the rectangle as the Entitiy is to calculate
-        # it's true position.
-        rot = Game.rotate_point(0, 0, self.rotation)
-        self._collision_rectangle_calculated_corners['ul'] = float(x + rot[0]), float(y + rot[1])
-        rot = Game.rotate_point(width, 0, self.rotation)
-        self._collision_rectangle_calculated_corners['ur'] = float(x + rot[0]), float(y + rot[1])
-        rot = Game.rotate_point(0, height, self.rotation)
-        self._collision_rectangle_calculated_corners['ll'] = float(x + rot[0]), float(y + rot[1])
-        rot = Game.rotate_point(width, height, self.rotation)
-        self._collision_rectangle_calculated_corners['lr'] = float(x + rot[0]), float(y + rot[1])
+        # it's true position. This is the same as Game.rotate_point but the
+        # rotation is only worked out once for all four corners.
+        rotation = math.radians(self.rotation)
+        cos_r = math.cos(rotation)
+        sin_r = math.sin(rotation)
+        corners = self._collision_rectangle_calculated_corners
+        corners['ul'] = float(x + (cos_r * 0 - sin_r * 0)), float(y + (sin_r * 0 + cos_r * 0))
+        corners['ur'] = float(x + (cos_r * width - sin_r * 0)), float(y + (sin_r * width + cos_r * 0))
+        corners['ll'] = float(x + (cos_r * 0 - sin_r * height)), float(y + (sin_r * 0 + cos_r * height))
+        corners['lr'] = float(x + (cos_r * width - sin_r * height)), float(y + (sin_r * width + cos_r * height))
 
         # Flag so we don't do this more than we need to.
         self._collision_rectangle_recalculate_corners = False
+        self._collision_rectangle_shape = None
 
         return self._collision_rectangle_calculated_corners
 
 
+    def collision_rectangle_calculate_shape(self):
+        """Returns the RectangleShape used by the rectangle collision methods.
+        Like the corners this is only worked out again when a relevant value
+        has changed, so it can be reused for every collision check in a frame."""
+        shape = self._collision_rectangle_shape
+        if shape is None or self._collision_rectangle_recalculate_corners:
+            corners = self.collision_rectangle_calculate_corners()
+            shape = self._collision_rectangle_shape = rectangle_shape(
+                corners, self.collision_rectangle_size(), self.x, self.y, self.rotation
+                )
+        return shape
+
+
     def collision_rectangle_size(self):
         """Returns the width and height of the collision rectangle as a two-part tuple.
         By default this is based on the image size, but can be overriden by setting
@@ -414,7 +529,42 @@ class Entity(BaseEntity):
         return point
 
 
-    def collide_with(self, entities_colliding):
+    def collision_calculate_bounds(self):
+        """Returns the axis aligned bounding box that encloses this Entity's collision
+        shape as a four-part tuple of (min_x, min_y, max_x, max_y). This is what
+        is used to work out which Entities are near each other when checking
+        collisions."""
+        if self.collision_type == COLLISION_TYPE_RECTANGLE:
+            corners = self.collision_rectangle_calculate_corners()
+            xs = (corners['ul'][0], corners['ur'][0], corners['ll'][0], corners['lr'][0])
+            ys = (corners['ul'][1], corners['ur'][1], corners['ll'][1], corners['lr'][1])
+            return (min(xs), min(ys), max(xs), max(ys))
+        elif self.collision_type == COLLISION_TYPE_CIRCLE:
+            radius = self.collision_circle_calculate_radius()
+            return (self.x - radius, self.y - radius, self.x + radius, self.y + radius)
+        point = self.collision_point_calculate_point()
+        return (point[0], point[1], point[0], point[1])
+
+
+    def collision_calculate_broadphase_bounds(self):
+        """Returns the box this Entity is stored under in the collision spatial hash,
+        as a four-part tuple of (min_x, min_y, max_x, max_y). For circles and points
+        this is their bounds. Rectangles check points and circles against an area
+        centred on their position rather than their corners, so that area is included
+        too."""
+        if self.collision_type == COLLISION_TYPE_RECTANGLE:
+            shape = self.collision_rectangle_calculate_shape()
+            boxes = (shape.bounds, shape.point_test_bounds, shape.circle_test_bounds)
+            bounds = (min(box[0] for box in boxes), min(box[1] for box in boxes),
+                      max(box[2] for box in boxes), max(box[3] for box in boxes))
+        else:
+            bounds = self.collision_calculate_bounds()
+        # Narrowphase tests allow for rounding errors, so the hash has to as well
+        return (bounds[0] - BOUNDS_MARGIN, bounds[1] - BOUNDS_MARGIN,
+                bounds[2] + BOUNDS_MARGIN, bounds[3] + BOUNDS_MARGIN)
+
+
+    def collide_with(self, entities_colliding, broadphase = False):
         """
         Checks collisions with an arbitrary list of Entities (or a single Entity)
         using the relevant algorithms depending on collision types specified.
@@ -423,10 +573,23 @@ class Entity(BaseEntity):
         was hit.
 
         Keyword arguments:
-        -- entities_colliding: List of Entities to check collisons against."""
+        -- entities_colliding: List of Entities to check collisons against. If using
+          the broadphase this can also be an Entity class type or class name.
+        -- broadphase: If True then only Entities close to this one are tested using
+          the collision spatial hash. This is much faster when checking against a
+          lot of Entities, though which one is returned if several are hit is not
+          based on the order they were passed in. (default False)"""
         if not self.collision_on:
             return EntityCollisionResult(result = False, entity = None)
 
+        # Myrmidon needs to be told we're doing a collision for optimisation reasons
+        Game.did_collision_check = True
+
+        if broadphase:
+            for check_object in Game.collision_candidates(self, entities_colliding):
+                return EntityCollisionResult(result = True, entity = check_object)
+            return EntityCollisionResult(result = False, entity = None)
+
         # If we haven't passed in an iterator we assume it's a single Entity object
         # and turn it into a list
         try:
@@ -434,9 +597,6 @@ class Entity(BaseEntity):
         except TypeError:
             entities_colliding = [entities_colliding]
 
-        # Myrmidon needs to be told we're doing a collision for optimisation reasons
-        Game.did_collision_check = True
-
         # Check collisions against every entity we've passed
         for check_object in entities_colliding:
             # Skip anything for that which has collisioned turned off
@@ -444,16 +604,7 @@ class Entity(BaseEntity):
             if not check_object.collision_on or check_object == self:
                 continue
 
-            # We dynamically call the correct method, passing the entities
-            # in as keyword arguments so the order does not matter. The argument
-            # names are the only thing we are bothered about.
-            if self.collision_type == check_object.collision_type:
-                params = {self.collision_type + '_a' : self, check_object.collision_type + '_b' : check_object}
-            else:
-                params = {self.collision_type : self, check_object.collision_type : check_object}
-            collision_result = Game.collision_methods[(self.collision_type, check_object.collision_type)](**params)
-
-            if collision_result:
+            if Game.check_collision(self, check_object):
                 return EntityCollisionResult(result = True, entity = check_object)
 
         # No collision
@@ -463,8 +614,14 @@ class Entity(BaseEntity):
     def reset_collision_model(self):
         """ During checking of collisions we may set some temporary values to
         avoid repeating calculations. This is called if we did any collision
-        checks to reset those."""
+        checks to reset those.
+        Call this if you change any collision related members such as collision_on,
+        collision_layer or collision_rectangle_width so the Entity can be found by
+        collision queries."""
         self._collision_rectangle_recalculate_corners = True
+        if not self._collision_hash_dirty:
+            Game.collision_hash_mark_dirty(self)
+        Game.collision_layer_update(self)
 
 
 
@@ -480,7 +637,10 @@ class Entity(BaseEntity):
     def x(self, value):
         self._x = value
         Game.engine['gfx'].alter_x(self, self._x)
+        Game.entity_position_version += 1
         self._collision_rectangle_recalculate_corners = True
+        if not self._collision_hash_dirty:
+            Game.collision_hash_mark_dirty(self)
 
     @x.deleter
     def x(self):
@@ -496,7 +656,10 @@ class Entity(BaseEntity):
     def y(self, value):
         self._y = value
         Game.engine['gfx'].alter_y(self, self._y)
+        Game.entity_position_version += 1
         self._collision_rectangle_recalculate_corners = True
+        if not self._collision_hash_dirty:
+            Game.collision_hash_mark_dirty(self)
 
     @y.deleter
     def y(self):
@@ -512,6 +675,7 @@ class Entity(BaseEntity):
     def z(self, value):
         if not self._z == value:
             self._z = value
+            Game.draw_order.alter_z(self, value)
             Game.engine['gfx'].alter_z(self, self._z)
 
     @z.deleter
@@ -526,13 +690,13 @@ class Entity(BaseEntity):
     @priority.setter
     def priority(self, value):
         if not self._priority == value:
-            Game.entity_priority_dirty = True
             self._priority = value
+            Game.entity_priority_changed(self)
 
     @priority.deleter
     def priority(self):
-        Game.entity_priority_dirty = True
         self._priority = 0
+        Game.entity_priority_changed(self)
 
     # texture image
     @property
@@ -545,6 +709,8 @@ class Entity(BaseEntity):
         self._image = value
         Game.engine['gfx'].alter_image(self, self._image)
         self._collision_rectangle_recalculate_corners = True
+        if not self._collision_hash_dirty:
+            Game.collision_hash_mark_dirty(self)
 
     @image.deleter
     def image(self):
@@ -608,6 +774,8 @@ class Entity(BaseEntity):
             self._scale = value
             Game.engine['gfx'].alter_scale(self, self._scale)
             self._collision_rectangle_recalculate_corners = True
+            if not self._collision_hash_dirty:
+                Game.collision_hash_mark_dirty(self)
 
     @scale.deleter
     def scale(self):
@@ -625,6 +793,8 @@ class Entity(BaseEntity):
             self._rotation = value
             Game.engine['gfx'].alter_rotation(self, self._rotation)
             self._collision_rectangle_recalculate_corners = True
+            if not self._collision_hash_dirty:
+                Game.collision_hash_mark_dirty(self)
 
     @rotation.deleter
     def rotation(self):
@@ -640,6 +810,8 @@ class Entity(BaseEntity):
     def centre_point(self, value):
         self._centre_point = value
         self._collision_rectangle_recalculate_corners = True
+        if not self._collision_hash_dirty:
+            Game.collision_hash_mark_dirty(self)
 
     @centre_point.deleter
     def centre_point(self):
@@ -0,0 +1,207 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+Structure of arrays storage for Entities. Entity classes that set array_store
+keep their position, rotation, scale, colour and alpha in NumPy arrays shared by
+every instance of the class, rather than on each instance. This means a whole
+class of Entities can be updated at once with NumPy operations.
+"""
+
+try:
+    import numpy
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+
+class EntityStoreField(object):
+    """
+    Put on Entity classes that use an array store in place of the attributes that
+    hold a value. Reads and writes go to the Entity's row in the arrays. Entities
+    that aren't in a store yet, or have been taken out of it, keep the value in
+    their instance dictionary instead.
+    """
+
+    def __init__(self, field, attribute, default):
+        self.field = field
+        self.attribute = attribute
+        self.default = default
+
+    def __get__(self, entity, owner):
+        if entity is None:
+            return self
+        store = entity._store
+        if store is None:
+            return entity.__dict__.get(self.attribute, self.default)
+        return store.get_value(self.field, entity._store_index)
+
+    def __set__(self, entity, value):
+        store = entity._store
+        if store is None:
+            entity.__dict__[self.attribute] = value
+        else:
+            store.set_value(self.field, entity._store_index, value)
+
+
+class EntityArrayStore(object):
+    """
+    Holds the arrays for every living instance of one Entity class. Inside a
+    batch_update the arrays are available as attributes named after the fields,
+    eg store.x, and are cut down to only the rows in use. They can be changed in
+    place and assigned to:
+
+        store.x += store.speed
+        store.alpha = numpy.maximum(store.alpha - 0.01, 0.0)
+
+    The Entity that a row belongs to is at the same position in store.entities.
+    Rows are not kept in creation order as destroyed Entities are replaced by the last one.
+    Don't keep hold of the arrays between frames as they are replaced when the store grows.
+
+    Every row is passed to batch_update, including Entities that have been stopped
+    with stop_executing. store.executing is 1.0 for rows that are executing and 0.0
+    for stopped ones, to multiply by or index with to leave stopped Entities alone:
+
+        store.x += store.speed * store.executing
+
+    Sleeping by yielding a number of frames isn't done as execute is not carried on.
+    """
+
+    # Field name, attribute on the Entity that holds it, default value. Fields that
+    # default to None hold NaN in the array while they are None.
+    base_fields = (
+        ("x", "_x", 0.0),
+        ("y", "_y", 0.0),
+        ("rotation", "_rotation", 0.0),
+        ("scale", "_scale", 1.0),
+        ("alpha", "_alpha", 1.0),
+        ("colour", "_colour", (1.0, 1.0, 1.0)),
+        ("previous_x", "_previous_x", None),
+        ("previous_y", "_previous_y", None),
+        ("executing", "_executing", True),
+        # Set for every row after a batch_update so collision shapes are worked out again
+        ("collision_recalculate", "_collision_rectangle_recalculate_corners", True),
+        )
+
+    def __init__(self, entity_class, capacity = 64):
+        """
+        Keyword arguments:
+        -- entity_class: The Entity class this is storing instances of. Any names in
+          its array_store_fields get an array each too.
+        -- capacity: How many Entities there is room for before the arrays need
+          to grow. (default 64)
+        """
+        self.entity_class = entity_class
+        self.fields = self.base_fields + tuple(
+            (name, name, 0.0) for name in entity_class.array_store_fields
+            )
+        self.defaults = dict((field, default) for field, attribute, default in self.fields)
+        self.arrays = {}
+        for field, attribute, default in self.fields:
+            if field == "colour":
+                self.arrays[field] = numpy.empty((capacity, 3))
+            else:
+                self.arrays[field] = numpy.empty(capacity)
+        self.capacity = capacity
+        self.count = 0
+        self.entities = []
+
+    def __len__(self):
+        return self.count
+
+    def __getattr__(self, name):
+        # Only called when normal lookup fails, so this is just for field names
+        arrays = self.__dict__.get("arrays")
+        if arrays is None or not name in arrays:
+            raise AttributeError(name)
+        return arrays[name][:self.count]
+
+    def __setattr__(self, name, value):
+        arrays = self.__dict__.get("arrays")
+        if not arrays is None and name in arrays:
+            arrays[name][:self.count] = value
+        else:
+            object.__setattr__(self, name, value)
+
+    def install_fields(self, entity_class):
+        """Replaces the attributes on an Entity class that hold stored values with
+        ones that read and write the arrays."""
+        for field, attribute, default in self.fields:
+            setattr(entity_class, attribute, EntityStoreField(field, attribute, default))
+
+    def get_value(self, field, index):
+        if field == "colour":
+            colour = self.arrays[field][index]
+            return (float(colour[0]), float(colour[1]), float(colour[2]))
+        value = float(self.arrays[field][index])
+        if value != value and self.defaults[field] is None:
+            return None
+        return value
+
+    def set_value(self, field, index, value):
+        # Entity properties reset themselves by setting None
+        if value is None:
+            value = self.defaults[field]
+        self.arrays[field][index] = numpy.nan if value is None else value
+
+    def add(self, entity):
+        """Gives an Entity a row in the arrays. Any values it was given before
+        it was added are moved into the arrays."""
+        if self.count == self.capacity:
+            self.grow(self.capacity * 2)
+        index = self.count
+        for field, attribute, default in self.fields:
+            self.set_value(field, index, entity.__dict__.pop(attribute, default))
+        self.entities.append(entity)
+        self.count += 1
+        entity._store = self
+        entity._store_index = index
+
+    def remove(self, entity):
+        """Takes an Entity's row out of the arrays, moving the last row into its place.
+        The Entity keeps its final values in its instance dictionary."""
+        index = entity._store_index
+        for field, attribute, default in self.fields:
+            entity.__dict__[attribute] = self.get_value(field, index)
+        entity._store = None
+        last = self.count - 1
+        if index != last:
+            for array in self.arrays.values():
+                array[index] = array[last]
+            moved = self.entities[last]
+            self.entities[index] = moved
+            moved._store_index = index
+        self.entities.pop()
+        self.count -= 1
+
+    def grow(self, capacity):
+        """Makes room for more Entities by replacing the arrays with larger copies."""
+        for field in list(self.arrays):
+            old = self.arrays[field]
+            new = numpy.empty((capacity,) + old.shape[1:])
+            new[:self.count] = old[:self.count]
+            self.arrays[field] = new
+        self.capacity = capacity
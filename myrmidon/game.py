@@ -31,9 +31,20 @@ This contains the primary Game object from where you manipulate
 and interact with the application.
 """
 
-import sys, os, math, copy, inspect, time
+import sys, os, math, copy, inspect, time, itertools
+from collections import OrderedDict
+from functools import partial
 from myrmidon.base_entity import BaseEntity
 from myrmidon.module_loader import ModuleLoader
+from myrmidon.spatial_hash import SpatialHash
+from myrmidon.position_grid import PositionGrid
+from myrmidon.timer_wheel import TimerWheel
+from myrmidon.profiler import EntityProfiler, FrameTimeline, timer as profiler_timer
+from myrmidon.entity_store import EntityArrayStore, numpy_available
+from myrmidon.collision_arrays import PackedGroup, collide_packed
+from myrmidon.collision_shapes import BOUNDS_MARGIN, project_corners, rectangle_shape
+from myrmidon.raycast import RaycastHit, grid_cells, ray_to_entity
+from myrmidon.draw_order import DrawOrder
 from myrmidon.consts import *
 
 
@@ -54,6 +65,12 @@ class Game(object):
     # unless you run Entity._iterate_generator manually.
     test_mode = False 
 
+    # Set to true before creating your first entity to run without a window.
+    # Dummy backend engines are used, nothing is drawn and no main loop is
+    # started. Instead advance the game yourself by calling Game.step, which
+    # runs as fast as possible without waiting for the frame rate.
+    headless = False
+
     # The framerate the game should be capped at.
     target_fps = 30
 
@@ -74,12 +91,96 @@ class Game(object):
     screen_size_adjustment_compatability_mode = False
     
     # The number of frames that have been executed, for counting reasons. Read-only.
+    # When using a fixed timestep this counts logic ticks rather than rendered frames.
     current_frame = 0
+
+    # Set to True to run Entity logic at a fixed rate of fixed_timestep_fps ticks per
+    # second regardless of how fast frames are being rendered. Several ticks may run
+    # before a frame is drawn or none at all, and Entities will be drawn at a position
+    # interpolated between the last two ticks so movement stays smooth.
+    fixed_timestep = False
+
+    # How many logic ticks per second to run when fixed_timestep is on. If None
+    # then target_fps is used.
+    fixed_timestep_fps = None
+
+    # The most logic ticks that will be run for a single rendered frame. If the game
+    # falls further behind than this then the extra time is dropped.
+    fixed_timestep_max_ticks = 5
+
+    # How much time in seconds the current tick represents. When using a fixed timestep
+    # this is always the length of a single tick. Read-only.
+    delta_time = 0.0
+
+    # When using a fixed timestep, how far between the previous tick and the
+    # current one (between 0 and 1) we are drawing at. Read-only.
+    interpolation_alpha = 1.0
+
+    # The currently running FrameTimeline, if any. Use start_timeline to create one.
+    # Read-only.
+    timeline = None
+
+    # The currently running EntityProfiler, if any. Use start_profiler to create one.
+    # Read-only.
+    profiler = None
+
+    # Counters describing the work done by the engine during the current logic tick,
+    # reset at the start of every tick. Read-only.
+    #  * entities_registered: Entities created.
+    #  * entities_activated: Entities put back in to the execution order after
+    #    waking up or being started.
+    #  * priority_moves: Entities moved to a new place in the execution order after
+    #    their priority changed. The order is never re-sorted as a whole.
+    #  * priority_buckets_added: New priority values that Entities have started using.
+    #  * entities_recycled: Entities created by reusing a destroyed pooled Entity.
+    frame_stats = {
+        'entities_registered' : 0,
+        'entities_recycled' : 0,
+        'entities_activated' : 0,
+        'priority_moves' : 0,
+        'priority_buckets_added' : 0,
+        }
+
+    # Counters describing the work done by the gfx engine drawing the last frame,
+    # reset before every frame is drawn. Not every gfx engine counts these. Read-only.
+    #  * texture_binds: Times a different texture was bound.
+    #  * state_changes: Times the blend mode or clip area was changed.
+    #  * draw_calls: Calls made to draw something.
+    render_stats = {
+        'texture_binds' : 0,
+        'state_changes' : 0,
+        'draw_calls' : 0,
+        }
     
     # Floats that represent how long it took for the previous frame to execute the
     # process logic and to render respectivly, in seconds. Read-only.
     frame_execution_time = 0.0
     frame_render_time = 0.0
+
+    # The size in pixels of each cell in the grid used to find Entities that are near
+    # each other when checking collisions. This should be around the size of a typical
+    # collidable Entity and must be set before the first collision query is made.
+    collision_hash_cell_size = 128.0
+
+    # The size in pixels of each cell in the grids used by query_radius, query_rectangle
+    # and nearest. This should be around the radius typically searched for.
+    position_grid_cell_size = 128.0
+
+    # When True, images loaded with load_image are packed into shared textures as they're
+    # loaded instead of each getting their own, so sprites can be drawn together.
+    # Images too big for atlas_page_size, repeating ones and text are left out.
+    auto_atlas = False
+    atlas_page_size = 2048
+
+    # Set to True to draw Entities at the same depth in order of their y position, so
+    # things lower down the screen are drawn in front, or to a list of the z values
+    # that should be drawn this way. Saves changing z every frame for top-down games.
+    draw_order_y_sort = False
+
+    # Names of the alter_* gfx engine methods that the running gfx engine needs
+    # calling, eg 'z' for alter_z. None if the gfx engine doesn't say, in which
+    # case all of them are assumed to be needed.
+    gfx_alter_hooks = None
         
     @classmethod
     def define_engine(cls, window=None, gfx=None, input=None, audio=None):
@@ -116,6 +217,51 @@ class Game(object):
         cls.engine['window'].change_resolution(resolution)
         cls.engine['gfx'].change_resolution(resolution)
     
+    @classmethod
+    def spawn_many(cls, entity_class, count, args_iterable = None):
+        """Creates a number of Entities of the same type in one go. They are
+        created and start executing just like creating them one at a time, but the
+        gfx engine is told about them all together once they've been made.
+        Returns a list of the new Entities.
+
+        Example usage:
+
+        Game.spawn_many(Shot, 100, ((x, 0) for x in range(100)))
+
+        Keyword arguments:
+        -- entity_class: The Entity class to create.
+        -- count: How many to create.
+        -- args_iterable: Something iterable giving a tuple of arguments to create each
+          Entity with. If it runs out before count is reached no more are created.
+          If None then no arguments are given. (default None)
+        """
+        if not cls.started:
+            raise MyrmidonError("Game.spawn_many called before the game was started. Create an Entity first.")
+        if args_iterable is None:
+            args_iterable = itertools.repeat(())
+        entities = []
+        cls.entity_batch_begin()
+        try:
+            for args in itertools.islice(args_iterable, count):
+                entities.append(entity_class(*args))
+        finally:
+            cls.entity_batch_end()
+        return entities
+
+    @classmethod
+    def queue_spawn(cls, entity_class, *args, **kwargs):
+        """Creates an Entity after every Entity has finished executing this frame,
+        rather than straight away. All Entities queued in a frame are created together
+        as if by spawn_many, which is much quicker when lots are made at once. The
+        Entity currently executing will still be the parent of the new one.
+        They first execute when they're created, then normally from the next frame.
+
+        Keyword arguments:
+        -- entity_class: The Entity class to create.
+        Any other arguments or keyword arguments are passed to the new Entity.
+        """
+        cls.entity_spawn_queue.append((cls.current_entity_executing, entity_class, args, kwargs))
+
     @classmethod
     def destroy_entities(cls, target, tree=False):
         """Kills Entity objects, stopping them from executing, displaying and
@@ -131,8 +277,10 @@ class Game(object):
         """
         entity_list = cls.get_entities(target, tree=tree)
         for entity in entity_list:
-            if (not entity in cls.entity_list) or (entity in cls.entities_to_remove):
+            # Skip anything not registered or already waiting to be removed
+            if not cls.entity_registry.get(entity, False):
                 continue
+            cls.entity_registry[entity] = False
             entity.on_exit()
             Game.entities_to_remove.append(entity)
 
@@ -151,7 +299,7 @@ class Game(object):
         """
         entity_list = cls.get_entities(target, tree=tree)
         for entity in entity_list:
-            entity._executing = False
+            cls.entity_set_executing(entity, False)
 
     @classmethod
     def start_entities_executing(cls, target, tree=False):
@@ -167,7 +315,7 @@ class Game(object):
         """
         entity_list = cls.get_entities(target, tree=tree)
         for entity in entity_list:
-            entity._executing = True
+            cls.entity_set_executing(entity, True)
 
     @classmethod
     def toggle_entities_executing(cls, target, tree=False):
@@ -184,7 +332,7 @@ class Game(object):
         """
         entity_list = cls.get_entities(target, tree=tree)
         for entity in entity_list:
-            entity._executing = not entity._executing
+            cls.entity_set_executing(entity, not entity._executing)
 
     @classmethod
     def hide_entities(cls, target, tree = False):
@@ -236,9 +384,21 @@ class Game(object):
         for entity in entity_list:
             entity.drawing = not entity.drawing
 
+    @classmethod
+    def get_entity_store(cls, entity_class):
+        """Returns the EntityArrayStore holding the arrays for an Entity class that
+        has array_store set, or None if no instances of it have been created yet.
+        Only instances of exactly that class are in it, subclasses get their own.
+
+        Keyword arguments:
+        -- entity_class: The Entity class to get the store for.
+        """
+        return cls.entity_stores.get(entity_class)
+
     @classmethod
     def get_entities(cls, target, tree = False):
         """This method returns a list of all Entities matching a type searched for.
+        Entities are returned in the order they were created.
 
         Keyword arguments:
         -- target: A number of different types can be passed in as the target of this method -
@@ -247,24 +407,243 @@ class Game(object):
           * A string containing the name of the class type searching for.
         -- tree: If True then all childen of matched Entities  will be added too. (default False)
         """
-        found_entity_list = []
         # We've entered a specific type as a string
         if isinstance(target, str):
-            for obj in cls.entity_list:
-                if obj.__class__.__name__ == target:
-                    cls.add_entity_to_list(obj, found_entity_list, tree=tree)
+            matched = cls.entity_name_index.get(target, ())
 
         # We've passed in a class type directly
         elif isinstance(target, type):
-            for obj in cls.entity_list:
-                if isinstance(obj, target):
-                    cls.add_entity_to_list(obj, found_entity_list, tree=tree)
+            matched = cls.entity_class_index.get(target, ())
 
         # We've passed in an Entity instance
         elif isinstance(target, BaseEntity):
-            cls.add_entity_to_list(target, found_entity_list, tree=tree)
+            matched = (target,)
+
+        else:
+            matched = ()
+
+        if not tree:
+            return list(matched)
 
-        return found_entity_list
+        found_entities = OrderedDict()
+        for obj in matched:
+            cls.add_entity_to_list(obj, found_entities, tree=tree)
+        return list(found_entities)
+
+    @classmethod
+    def position_grid(cls, target = None):
+        """Returns the PositionGrid holding the positions of every Entity matching
+        target, used by the position queries. Grids are built the first time one is
+        needed each frame and again whenever Entities have been created, destroyed
+        or moved since. LightEntity positions are plain attributes, so they are only
+        seen moving once per frame.
+
+        Keyword arguments:
+        -- target: Anything get_entities takes, or None for every Entity. (default None)
+        """
+        if cls.position_grids_frame != cls.current_frame:
+            cls.position_grids = {}
+            cls.position_grids_frame = cls.current_frame
+        state = (cls.entity_registration_count, len(cls.entities_to_remove), cls.entity_position_version)
+        cached = cls.position_grids.get(target)
+        if not cached is None and cached[0] == state:
+            return cached[1]
+
+        registry = cls.entity_registry
+        entities = cls.entity_list if target is None else cls.get_entities(target)
+        grid = PositionGrid(
+            [entity for entity in entities if registry.get(entity, True)],
+            cls.position_grid_cell_size
+            )
+        cls.position_grids[target] = (state, grid)
+        return grid
+
+    @classmethod
+    def query_radius(cls, point, radius, target = None, exclude = None):
+        """Returns a list of every Entity with a position within a distance of a
+        point, in no particular order. Entities exactly that distance away are included.
+
+        Keyword arguments:
+        -- point: Tuple containing the coordinates of the point to search around.
+        -- radius: How far from the point to search.
+        -- target: Optionally restricts what Entities will be returned, this can be
+          anything that get_entities takes. If None then any Entity can be. (default None)
+        -- exclude: An Entity to leave out of the results, typically the one searching. (default None)
+        """
+        return cls.position_grid(target).query_radius(point[0], point[1], radius, exclude = exclude)
+
+    @classmethod
+    def query_rectangle(cls, rectangle_origin, rectangle_size, target = None, exclude = None):
+        """Returns a list of every Entity with a position inside a rectangle, in no
+        particular order. Entities on the edges of the rectangle are included.
+
+        Keyword arguments:
+        -- rectangle_origin: Tuple containing the top left corner of the rectangle.
+        -- rectangle_size: Tuple containing the width and height of the rectangle.
+        -- target: Optionally restricts what Entities will be returned, this can be
+          anything that get_entities takes. If None then any Entity can be. (default None)
+        -- exclude: An Entity to leave out of the results, typically the one searching. (default None)
+        """
+        return cls.position_grid(target).query_rectangle(
+            rectangle_origin[0], rectangle_origin[1],
+            rectangle_origin[0] + rectangle_size[0], rectangle_origin[1] + rectangle_size[1],
+            exclude = exclude
+            )
+
+    @classmethod
+    def nearest(cls, point, target = None, k = 1, max_distance = None, exclude = None):
+        """Returns a list of up to k Entities closest to a point, nearest first.
+        Entities the same distance away are in the order they were created.
+
+        Keyword arguments:
+        -- point: Tuple containing the coordinates of the point to search around.
+        -- target: Optionally restricts what Entities will be returned, this can be
+          anything that get_entities takes. If None then any Entity can be. (default None)
+        -- k: The most Entities to return. (default 1)
+        -- max_distance: If given then Entities further away than this are never returned. (default None)
+        -- exclude: An Entity to leave out of the results, typically the one searching. (default None)
+        """
+        return cls.position_grid(target).nearest(
+            point[0], point[1], k = k, max_distance = max_distance, exclude = exclude
+            )
+
+    @classmethod
+    def collide_query(cls, entity, target = None):
+        """Returns a list of all Entities that are currently colliding with the
+        one given. Rather than testing against every Entity, only those that are
+        close enough to the one given are checked, making this much faster than
+        calling collide_with on the results of get_entities.
+        Entities that have collision_on set to False are never returned.
+
+        Keyword arguments:
+        -- entity: The Entity we want to find collisions for.
+        -- target: Optionally restricts what Entities will be returned. A number
+          of different types can be passed in -
+          * An Entity class type (not instanced object, will also match subclasses)
+          * A string containing the name of the class type searching for.
+          * A single Entity instance or a list of Entities.
+          If None then every colliding Entity will be returned. (default None)
+        """
+        return list(cls.collision_candidates(entity, target))
+
+    @classmethod
+    def raycast(cls, origin, direction, max_distance, mask = None, exclude = None, all_hits = False):
+        """Casts a ray against the collision shapes of every Entity with collision_on set,
+        walking through the cells of the collision spatial hash that it passes through
+        so only Entities near the ray are tested. Rays that start inside a shape hit
+        it at a distance of 0. Entities destroyed this frame are never hit.
+        Returns a RaycastHit namedtuple of 'entity', 'distance' along the ray and the
+        'point' that was hit for the first Entity hit, or None if nothing was. If
+        all_hits is True a list of RaycastHits for every Entity hit is returned instead,
+        sorted by distance.
+
+        Keyword arguments:
+        -- origin: Tuple containing the coordinates the ray starts from.
+        -- direction: Tuple containing the direction the ray goes in as a vector, it
+          does not need to be normalised.
+        -- max_distance: How far the ray goes.
+        -- mask: If given then only Entities with a collision_layer that shares a bit
+          with this are hit. (default None)
+        -- exclude: An Entity that the ray passes through, typically the one casting it. (default None)
+        -- all_hits: If True then every Entity hit is returned rather than just the
+          first. (default False)
+        """
+        length = math.sqrt(direction[0] * direction[0] + direction[1] * direction[1])
+        if not length:
+            raise MyrmidonError("A raycast needs a direction to go in.")
+        origin_x, origin_y = origin
+        direction_x = direction[0] / length
+        direction_y = direction[1] / length
+
+        cls.collision_hash_update()
+        cells = cls.collision_hash.cells
+        registry = cls.entity_registry
+        tested = set()
+        hits = []
+        first = None
+        for cell_x, cell_y, cell_distance in grid_cells(
+                origin_x, origin_y, direction_x, direction_y, max_distance, cls.collision_hash.cell_size):
+            # Nothing in this cell or those after it can be hit before the first hit
+            if not first is None and cell_distance > first.distance + BOUNDS_MARGIN:
+                break
+            bucket = cells.get((cell_x, cell_y))
+            if not bucket:
+                continue
+            for entity in bucket:
+                if entity in tested:
+                    continue
+                tested.add(entity)
+                if entity is exclude or (not mask is None and not entity.collision_layer & mask):
+                    continue
+                if not registry.get(entity, True):
+                    continue
+                distance = ray_to_entity(origin_x, origin_y, direction_x, direction_y, entity)
+                if distance is None or distance > max_distance:
+                    continue
+                hit = RaycastHit(
+                    entity = entity, distance = distance,
+                    point = (origin_x + direction_x * distance, origin_y + direction_y * distance)
+                    )
+                if all_hits:
+                    hits.append(hit)
+                elif first is None or distance < first.distance:
+                    first = hit
+
+        if all_hits:
+            hits.sort(key = lambda hit: hit.distance)
+            return hits
+        return first
+
+    @classmethod
+    def segment_cast(cls, point_a, point_b, mask = None, exclude = None, all_hits = False):
+        """Casts a ray from one point to another against the collision shapes of every
+        Entity with collision_on set. Works the same way as raycast and gives the same
+        results, with distances measured from the first point.
+
+        Keyword arguments:
+        -- point_a: Tuple containing the coordinates the segment starts from.
+        -- point_b: Tuple containing the coordinates the segment ends at.
+        -- mask: If given then only Entities with a collision_layer that shares a bit
+          with this are hit. (default None)
+        -- exclude: An Entity that the segment passes through, typically the one casting it. (default None)
+        -- all_hits: If True then every Entity hit is returned rather than just the
+          first. (default False)
+        """
+        direction = (point_b[0] - point_a[0], point_b[1] - point_a[1])
+        length = math.sqrt(direction[0] * direction[0] + direction[1] * direction[1])
+        if not length:
+            return [] if all_hits else None
+        return cls.raycast(point_a, direction, length, mask = mask, exclude = exclude, all_hits = all_hits)
+
+    @classmethod
+    def collide_groups(cls, group_a, group_b, return_entities = False):
+        """Finds every collision between two groups of Entities at once, such as all
+        bullets against all enemies. The collision shapes are packed into NumPy arrays
+        and tested together, giving the same results as calling check_collision on
+        every pair but much faster. An Entity is never counted as colliding with itself
+        and Entities with collision_on set to False are skipped. NumPy is required.
+
+        Returns a NumPy array of (index in group_a, index in group_b) rows, sorted by the
+        index in group_a, or a list of (Entity, Entity) tuples if return_entities is True.
+
+        Keyword arguments:
+        -- group_a: A list of Entities. Can also be anything get_entities takes, in which
+          case the indices are of the list that get_entities returns.
+        -- group_b: The Entities to check group_a against, given the same way.
+        -- return_entities: If True pairs of Entities are returned rather than indices.
+          (default False)
+        """
+        if not numpy_available:
+            raise MyrmidonError("NumPy is required for Game.collide_groups.")
+        groups = []
+        for group in (group_a, group_b):
+            if isinstance(group, (str, type, BaseEntity)):
+                group = cls.get_entities(group)
+            groups.append(list(group))
+        pairs = collide_packed(PackedGroup(groups[0]), PackedGroup(groups[1]))
+        if return_entities:
+            return [(groups[0][a], groups[1][b]) for a, b in pairs]
+        return pairs
 
     @classmethod
     def keyboard_key_down(cls, key_code):
@@ -309,6 +688,24 @@ class Game(object):
         """
         return cls.engine['gfx'].Image(image, sequence, width, height, **kwargs)
 
+    @classmethod
+    def load_atlas(cls, images, max_size = 2048, padding = 1, cache_file = None):
+        """Loads a list of images packed together into as few textures as possible and returns
+        a list of Image objects for them, in the same order. Entities using images that share
+        a texture can be drawn together without the gfx engine switching textures in between.
+
+        Keyword arguments:
+        images -- List of what to load. Each is either an image filename (or image data, the same
+          as load_image accepts) or a dict of the arguments that would be given to load_image for it,
+          eg {'image' : 'walk.png', 'sequence' : True, 'width' : 32}. (Required)
+        max_size -- The largest width and height of each texture. Images that don't all fit in
+          one are spread over as many as it takes. (default 2048)
+        padding -- Empty pixels kept between images so they don't bleed into each other. (default 1)
+        cache_file -- Path of a file to save where each image was packed to. On later runs, if the
+          images are the same sizes, the saved layout is used instead of packing them again. (default None)
+        """
+        return cls.engine['gfx'].load_atlas(images, max_size, padding, cache_file)
+
     @classmethod
     def load_font(cls, font = None, size = 20, **kwargs):
         """Creates and returns a Font object that we give to the write_text method to specify how to render
@@ -391,6 +788,23 @@ class Game(object):
         """
         return cls.engine['gfx'].Line(x, y, points, colour, line_width, closed)
 
+    @classmethod
+    def create_particle_emitter(cls, image, x = 0.0, y = 0.0, z = 0, **settings):
+        """Creates and returns a ParticleEmitter, an Entity that creates and moves lots
+        of particles using the given image. The particles are all drawn together by the
+        gfx engine so there can be many more of them than individual Entities. NumPy is required.
+
+        Keyword arguments:
+        -- image: The Image every particle is drawn with.
+        -- x: Where particles are created from. (default 0.0)
+        -- y: Where particles are created from. (default 0.0)
+        -- z: Depth the particles are drawn at. (default 0)
+        Any other keyword arguments change the emitter's settings, eg rate, life, speed,
+        direction, spread, gravity, spin, start_alpha, end_alpha. See ParticleEmitter.
+        """
+        from myrmidon.particles import ParticleEmitter
+        return ParticleEmitter(image, x, y, z, **settings)
+
     @classmethod
     def get_distance(cls, pointa, pointb):
         return math.sqrt((math.pow((pointb[1] - pointa[1]), 2) + math.pow((pointb[0] - pointa[0]), 2)))
@@ -764,14 +1178,89 @@ class Game(object):
             yield frame / total
 
     @classmethod
-    def call_in_future(cls, function, frames_in_future):
+    def start_profiler(cls, sample_every = 1):
+        """Starts timing how long each Entity takes to execute, added up by
+        Entity class and current state. Results can be looked at any time
+        through Game.profiler with get_stats, to_table or to_json.
+        Returns the EntityProfiler object. Starting it again clears out the results.
+
+        Keyword arguments:
+        -- sample_every: Only profile one frame in this many, which lowers
+          the overhead for long running games. (default 1)
+        """
+        cls.profiler = EntityProfiler(sample_every)
+        return cls.profiler
+
+    @classmethod
+    def stop_profiler(cls):
+        """Stops profiling Entity execution. Returns the EntityProfiler with the
+        final results in, or None if the profiler wasn't running."""
+        profiler = cls.profiler
+        cls.profiler = None
+        return profiler
+
+    @classmethod
+    def start_timeline(cls, max_frames = 300):
+        """Starts recording how long each phase of every frame takes, such as
+        input, Entity execution and drawing. Only the most recent frames are kept.
+        They can be looked at through Game.timeline or saved with to_chrome_trace.
+        Returns the FrameTimeline object.
+
+        Keyword arguments:
+        -- max_frames: How many recent frames to keep. (default 300)
+        """
+        cls.timeline = FrameTimeline(max_frames)
+        return cls.timeline
+
+    @classmethod
+    def stop_timeline(cls):
+        """Stops recording frame phases. Returns the FrameTimeline with the recorded
+        frames in, or None if it wasn't running."""
+        timeline = cls.timeline
+        cls.timeline = None
+        return timeline
+
+    @classmethod
+    def call_in_future(cls, function, frames_in_future, repeat = False):
         """Will call the passed function the number of frames in the future
         passed in. For instance, passing '30' for frames_in_future will cause Myrmidon
-        to automatically call the function after 30 frames of execution."""
-        time = cls.current_frame + frames_in_future
-        if not time in cls.scheduled_on_frame:
-            cls.scheduled_on_frame[time] = []
-        cls.scheduled_on_frame[time].append(function)
+        to automatically call the function after 30 frames of execution.
+        Returns a TimerHandle, calling cancel() on it will stop the function being called.
+
+        Keyword arguments:
+        -- function: The function to call, it is passed no arguments.
+        -- frames_in_future: How many frames to wait before calling it.
+        -- repeat: If True the function will keep being called every
+          frames_in_future frames until it is cancelled. (default False)
+        """
+        return cls.timer_wheel_frames.add(
+            function,
+            cls.current_frame + frames_in_future,
+            frames_in_future if repeat else None
+            )
+
+    @classmethod
+    def call_in_seconds(cls, function, seconds_in_future, repeat = False):
+        """Will call the passed function once the given number of seconds of
+        real time have passed. The function is called after entities have
+        executed on the first frame that the time has been reached.
+        Returns a TimerHandle, calling cancel() on it will stop the function being called.
+
+        Keyword arguments:
+        -- function: The function to call, it is passed no arguments.
+        -- seconds_in_future: How many seconds to wait before calling it.
+        -- repeat: If True the function will keep being called every
+          seconds_in_future seconds until it is cancelled. (default False)
+        """
+        now = cls.timer_milliseconds()
+        if cls.timer_wheel_time is None:
+            cls.timer_wheel_time = TimerWheel(now)
+        milliseconds = int(round(seconds_in_future * 1000))
+        return cls.timer_wheel_time.add(
+            function,
+            now + milliseconds,
+            milliseconds if repeat else None
+            )
 
         
     
@@ -781,6 +1270,8 @@ class Game(object):
 
     # Engine related
     started = False 
+    last_frame_timer = None
+    fixed_timestep_accumulator = 0.0
 
     engine_def = {
         "window" : "pygame",
@@ -808,13 +1299,81 @@ class Game(object):
 
     # Entity related
     first_registered_entity = None
+    # Every registered Entity is a key in the registry. The value is True while the Entity
+    # is alive and False once it's been destroyed and is waiting to be removed at the end
+    # of the frame. Destroyed pooled Entities waiting to be recycled stay in with a value of
+    # None, so they keep their place in the lists below and with the gfx engine. The lists
+    # are derived from the registry and are in the order Entities were created.
+    entity_registry = {}
     entity_list = []
     entity_draw_list = []
+    # Every registered Entity in the order they're drawn in, shared by the gfx engines
+    draw_order = DrawOrder()
+    # Lookups of class types and class names to ordered dicts (used as ordered sets)
+    # of the registered Entities of that type, so they can be found without searching
+    # through every Entity. Class types also contain instances of their subclasses.
+    entity_class_index = {}
+    entity_name_index = {}
     entities_to_remove = []
     remember_current_entity_executing = []
     current_entity_executing = None
-    entity_priority_dirty = True
+    entity_registration_count = 0
+
+    # Pooled Entity classes to lists of their destroyed instances ready to be recycled
+    entity_pools = {}
+
+    # Entity classes with array_store set to the EntityArrayStore of their instances
+    entity_stores = OrderedDict()
+
+    # While Entities are being created in a batch this is a list of the ones that need
+    # registering with the gfx engine at the end. Otherwise it's None.
+    entity_spawn_batch = None
+    entity_batch_depth = 0
+
+    # Entities waiting to be created by queue_spawn at the end of Entity execution, as
+    # tuples of (parent, class, args, kwargs)
+    entity_spawn_queue = []
+
+    # Entities that are able to execute, kept in buckets keyed by priority with each bucket
+    # in registration order. entity_priority_order holds the bucket priorities from highest
+    # to lowest. Stopped and sleeping Entities are taken out so the main loop never has to
+    # look at them. Removals are done lazily at the start of the next frame, as are moves
+    # between buckets when priorities change and putting back Entities that have woken up.
+    entity_priority_buckets = {}
+    entity_priority_order = []
+    entity_active_removed = {}
+    entity_active_added = []
+    entity_priority_moved = []
+    # Priority of the bucket being executed, or None when Entities aren't being executed.
+    # Entities created in a bucket that has already been executed this frame are kept in
+    # the late list and executed after every bucket, so every new Entity runs on the
+    # frame it was created on.
+    entity_executing_priority = None
+    entity_late_arrivals = []
+
+    # Timer wheel used to wake sleeping Entities up on the frame they should next execute
+    entity_wake_wheel = TimerWheel()
     did_collision_check = False
+
+    # Collision broadphase. The spatial hash is only created when collision queries
+    # are first made. After that any Entity that moves is put in the dirty OrderedDict
+    # (used as an ordered set) and rehashed before the next query.
+    collision_hash = None
+    collision_hash_dirty = OrderedDict()
+    # EntityArrayStores (an ordered set) whose Entities have all been changed by a
+    # batch_update. They're only put in the dirty set when the hash is next needed.
+    collision_stores_dirty = OrderedDict()
+
+    # Position query targets to the PositionGrid of matching Entities built for them this
+    # frame, as tuples of (state when built, grid). Emptied when the frame changes.
+    position_grids = {}
+    position_grids_frame = None
+    # Goes up whenever an Entity's position changes so grids know they're out of date.
+    entity_position_version = 0
+
+    # Entities with a collision_layer set (an ordered set) that are tested against
+    # each other by the collision pass after every Entity has executed.
+    collision_layer_entities = OrderedDict()
     
     # Global flag disables all entity execution, does not apply to any screen overlay entities.
     disable_entity_execution = False
@@ -826,12 +1385,30 @@ class Game(object):
     # we're running on is a mobile device of some kind. (Will also be True for tablets.)
     is_phone = False
 
-    # A dictionary of frame numbers to functions that need to be called when the game hits
-    # those frames. They're called after every entity has finished executing on the relevant frame.
-    scheduled_on_frame = {}
+    # Timer wheels holding functions that need to be called in the future. One counts in
+    # frames, the other in milliseconds of real time and is only created when first needed.
+    # They're advanced after every entity has finished executing on each frame.
+    timer_wheel_frames = TimerWheel()
+    timer_wheel_time = None
+
+    @classmethod
+    def timer_milliseconds(cls):
+        """Milliseconds of real time used by call_in_seconds. Taken from a monotonic
+        clock so that changes to the system clock don't fire or hold back timers."""
+        return int(profiler_timer() * 1000)
 
     @classmethod
     def init_engines(cls):
+        # Test and headless modes use dummy engines
+        if cls.test_mode or cls.headless:
+            from .backend_dummy import MyrmidonWindowDummy, MyrmidonGfxDummy, MyrmidonInputDummy, MyrmidonAudioDummy
+            cls.engine['window'] = MyrmidonWindowDummy()
+            cls.engine['gfx'] = MyrmidonGfxDummy()
+            cls.engine['input'] = MyrmidonInputDummy()
+            cls.engine['audio'] = MyrmidonAudioDummy()
+            cls.gfx_alter_hooks = getattr(cls.engine['gfx'], 'alter_hooks_required', None)
+            return
+
         # Attempt to dynamically import the required engines
         try:
             for backend_name in ['window', 'gfx', 'input', 'audio']:
@@ -848,14 +1425,7 @@ class Game(object):
             print("Error importing a backend engine.", detail)
             sys.exit()
 
-        # Test mode uses dummy engines
-        if cls.test_mode:
-            from .backend_dummy import MyrmidonWindowDummy, MyrmidonGfxDummy, MyrmidonInputDummy, MyrmidonAudioDummy
-            cls.engine['window'] = MyrmidonWindowDummy()
-            cls.engine['gfx'] = MyrmidonGfxDummy()
-            cls.engine['input'] = MyrmidonInputDummy()
-            cls.engine['audio'] = MyrmidonAudioDummy()
-            return
+        cls.gfx_alter_hooks = getattr(cls.engine['gfx'], 'alter_hooks_required', None)
 
     @classmethod
     def load_engine_plugins(cls, engine_object, backend_name):
@@ -901,29 +1471,140 @@ class Game(object):
         for x in cls._module_list:
             x._module_setup(cls)
 
+        # Headless games are advanced manually with Game.step
+        if cls.headless:
+            return
+
         cls.engine['window'].set_window_loop(cls.app_loop_callback, cls.target_fps)
         cls.engine['window'].open_window()
 
     @classmethod
     def app_loop_callback(cls, dt):
         # Start frame timer
-        frame_timer = time.time()
-        
+        frame_timer = profiler_timer()
+        timeline = cls.timeline
+        if not timeline is None:
+            timeline.begin_frame(cls.current_frame)
+
         cls.engine['window'].app_loop_tick()
+        if not timeline is None:
+            timeline.mark("window_tick")
+
+        # Work out how much time has passed since the last frame
+        if cls.last_frame_timer is None:
+            frame_delta = 1.0 / cls.target_fps
+        elif dt:
+            frame_delta = dt
+        else:
+            frame_delta = frame_timer - cls.last_frame_timer
+        cls.last_frame_timer = frame_timer
+
+        if cls.fixed_timestep:
+            # Run as many ticks as we need to catch up with the time that has passed,
+            # up to a limit. If we're too far behind the backlog is dropped rather
+            # than letting it build up.
+            tick_length = 1.0 / (cls.fixed_timestep_fps or cls.target_fps)
+            cls.delta_time = tick_length
+            cls.fixed_timestep_accumulator += min(frame_delta, tick_length * cls.fixed_timestep_max_ticks)
+            ticks = 0
+            while cls.fixed_timestep_accumulator >= tick_length:
+                if ticks == cls.fixed_timestep_max_ticks:
+                    cls.fixed_timestep_accumulator %= tick_length
+                    break
+                cls.interpolation_store_previous()
+                if not timeline is None:
+                    timeline.mark("interpolation")
+                cls.logic_tick()
+                cls.fixed_timestep_accumulator -= tick_length
+                ticks += 1
+            cls.interpolation_alpha = cls.fixed_timestep_accumulator / tick_length
+        else:
+            cls.delta_time = frame_delta
+            cls.interpolation_alpha = 1.0
+            cls.logic_tick()
+
+        # Save how long it took to execute
+        render_timer = profiler_timer()
+        cls.frame_execution_time = render_timer - frame_timer
+
+        # Pass off to the gfx engine to display entities
+        for stat in cls.render_stats:
+            cls.render_stats[stat] = 0
+        cls.engine['gfx'].update_screen_pre()
+        if not timeline is None:
+            timeline.mark("gfx_pre")
+        cls.engine['gfx'].draw_entities(cls.draw_order.entities(cls.draw_order_y_sort))
+        if not timeline is None:
+            timeline.mark("gfx_draw")
+        cls.engine['gfx'].update_screen_post()
+        if not timeline is None:
+            timeline.mark("gfx_post")
+
+        # Save how long it took to render
+        cls.frame_render_time = profiler_timer() - render_timer
+
+        # Hack - we assume a window backend will *either* return a non-zero fps value from the clock object
+        # *or* have provided a non-zero time delta value, depending on how the main loop is handled
+        clock_fps = int(cls.clock.get_fps())
+        cls.current_fps = clock_fps if dt == 0 else 1.0/dt
+
+        # Wait for next frame, hitting a particular fps
+        cls.clock.tick(cls.target_fps)
+        if not timeline is None:
+            timeline.mark("clock_wait")
+            timeline.end_frame()
+    
+    @classmethod
+    def step(cls, ticks = 1):
+        """
+        Advances the game by a number of logic ticks straight away, without
+        drawing anything or waiting to hit the frame rate. Intended for use
+        with Game.headless to run simulations as fast as possible.
+
+        Keyword arguments:
+        -- ticks: How many ticks of game logic to run. (default 1)
+        """
+        if not cls.started:
+            raise MyrmidonError("Game.step called before the game was started. Create an Entity first.")
+        cls.delta_time = 1.0 / (cls.fixed_timestep_fps or cls.target_fps)
+        cls.interpolation_alpha = 1.0
+        # Previous positions are only read when drawing with fixed_timestep on
+        store_previous = cls.fixed_timestep and not cls.headless
+        timeline = cls.timeline
+        for i in range(ticks):
+            if not timeline is None:
+                timeline.begin_frame(cls.current_frame)
+            if store_previous:
+                cls.interpolation_store_previous()
+                if not timeline is None:
+                    timeline.mark("interpolation")
+            cls.logic_tick()
+            if not timeline is None:
+                timeline.end_frame()
+
+    @classmethod
+    def logic_tick(cls):
+        """
+        Runs a single tick of game logic. Registers new Entities, processes
+        input, executes every Entity, calls scheduled functions and removes
+        destroyed Entities. Does no rendering.
+        """
+        timeline = cls.timeline
+        for stat in cls.frame_stats:
+            cls.frame_stats[stat] = 0
 
         # If we need to register something
         if cls.first_registered_entity:
             cls.entity_register(cls.first_registered_entity)
             cls.first_registered_entity = None
+        if not timeline is None:
+            timeline.mark("registration")
 
-        # Reorder Entities by execution priority if necessary
-        if cls.entity_priority_dirty == True:
-            cls.entity_list.sort(
-                reverse=True,
-                key=lambda object:
-                object.priority if hasattr(object, "priority") else 0
-                )
-            cls.entity_priority_dirty = False
+        # Bring in Entities that have been woken, started or changed priority and
+        # drop ones that stopped
+        cls.entity_active_update()
+        if not timeline is None:
+            timeline.mark("priority_update")
 
         # If we have an input engine enabled we pass off to it
         # to manage and process input events.
@@ -932,73 +1613,183 @@ class Game(object):
 
         if cls.debug and cls.keyboard_key_released(K_F11):
             from pudb import set_trace; set_trace()
+        if not timeline is None:
+            timeline.mark("input")
 
         # For each entity in priority order we iterate their
         # generators executing their code
         if not cls.disable_entity_execution:
-            for entity in cls.entity_list:
-                cls.current_entity_executing = entity
-                entity._iterate_generator()
-                if cls.disable_entity_execution:
-                    if not cls.screen_overlay is None:
-                        cls.current_entity_executing = cls.screen_overlay
-                        cls.screen_overlay._iterate_generator()
-                    break
+            cls.entity_execute_active()
         else:
             if not cls.screen_overlay is None:
                 cls.current_entity_executing = cls.screen_overlay
                 cls.screen_overlay._iterate_generator()
+        if not timeline is None:
+            timeline.mark("entity_execution")
+
+        # Create Entities that were queued up during execution
+        if cls.entity_spawn_queue:
+            cls.entity_spawn_queued()
+        if not timeline is None:
+            timeline.mark("spawn_queue")
+
+        # Tell Entities on collision layers about everything they're overlapping
+        if cls.collision_layer_entities and not cls.disable_entity_execution:
+            cls.collision_layer_pass()
+        if not timeline is None:
+            timeline.mark("collision_pass")
 
         # Handled scheduled timer functions
         cls.current_frame += 1
-        if cls.current_frame in cls.scheduled_on_frame:
-            for function in cls.scheduled_on_frame[cls.current_frame]:
-                function()
-            del(cls.scheduled_on_frame[cls.current_frame])
+        cls.entity_wake_wheel.advance(cls.current_frame)
+        cls.timer_wheel_frames.advance(cls.current_frame)
+        if not cls.timer_wheel_time is None:
+            cls.timer_wheel_time.advance(cls.timer_milliseconds())
+        if not timeline is None:
+            timeline.mark("scheduled_callbacks")
 
         # If we have marked any entities for removal we do that here
-        for x in cls.entities_to_remove:
-            if x in cls.entity_list:
-                if x.next_sibling:
-                    x.next_sibling.prev_sibling = None
-                if x.prev_sibling:
-                    x.prev_sibling.next_sibling = None
-                if x.parent and x.parent.child is x:
-                    x.parent.child = None
-                x.parent = None
-                cls.engine['gfx'].remove_entity(x)
-                cls.entity_list.remove(x)
-                cls.entity_draw_list.remove(x)
-        cls.entities_to_remove = [] 
+        if cls.entities_to_remove:
+            cls.entity_remove_marked()
+        if not timeline is None:
+            timeline.mark("removal")
 
-        # Save how long it took to execute
-        cls.frame_execution_time = time.time() - frame_timer
+    @classmethod
+    def entity_execute_active(cls):
+        """
+        Iterates every active Entity, highest priority bucket first. If the profiler
+        is running and this frame is being sampled each iteration is timed.
+        """
+        profiler = cls.profiler
+        if profiler is None or not profiler.should_sample(cls.current_frame):
+            cls.entity_execute_buckets(None)
+            if cls.entity_stores and not cls.disable_entity_execution:
+                cls.entity_stores_update(None)
+            return
+        start = profiler_timer()
+        cls.entity_execute_buckets(profiler)
+        if cls.entity_stores and not cls.disable_entity_execution:
+            cls.entity_stores_update(profiler)
+        profiler.record_frame(profiler_timer() - start)
 
-        # Pass off to the gfx engine to display entities
-        cls.engine['gfx'].update_screen_pre()
-        cls.engine['gfx'].draw_entities(cls.entity_draw_list)
-        cls.engine['gfx'].update_screen_post()
+    @classmethod
+    def entity_stores_update(cls, profiler):
+        """
+        Calls batch_update once on each Entity class that has one, with the store
+        holding its instances. As the arrays are changed directly every Entity
+        in the store is treated as having moved afterwards. This is done for the
+        whole store at once, the collision hash only looks at each Entity if it's used.
+        """
+        cls.current_entity_executing = None
+        for entity_class, store in list(cls.entity_stores.items()):
+            if entity_class.batch_update is None or not store.count:
+                continue
+            if profiler is None:
+                entity_class.batch_update(store)
+            else:
+                start = profiler_timer()
+                entity_class.batch_update(store)
+                profiler.record(entity_class, "batch_update", profiler_timer() - start)
+            cls.entity_position_version += 1
+            store.collision_recalculate = 1.0
+            if not cls.collision_hash is None:
+                cls.collision_stores_dirty[store] = None
 
-        # Save how long it took to render
-        cls.frame_render_time = time.time() - cls.frame_execution_time - frame_timer
+    @classmethod
+    def entity_execute_buckets(cls, profiler):
+        buckets = cls.entity_priority_buckets
+        order = cls.entity_priority_order
+        cls.entity_late_arrivals = []
+        position = 0
+        while True:
+            if position < len(order):
+                priority = order[position]
+                bucket = buckets[priority]
+            elif cls.entity_late_arrivals:
+                # Anything these create is late too, so keep going until there are none
+                priority = float('-inf')
+                bucket = cls.entity_late_arrivals
+                cls.entity_late_arrivals = []
+            else:
+                break
+            cls.entity_executing_priority = priority
+            for entity in bucket:
+                cls.current_entity_executing = entity
+                if profiler is None:
+                    entity._iterate_generator()
+                else:
+                    state = entity._current_state
+                    start = profiler_timer()
+                    entity._iterate_generator()
+                    profiler.record(type(entity), state, profiler_timer() - start)
+                if entity.sleep_counter and entity._executing and entity._wake_handle is None:
+                    cls.entity_sleep(entity)
+                if cls.disable_entity_execution:
+                    cls.entity_executing_priority = None
+                    cls.entity_late_arrivals = []
+                    if not cls.screen_overlay is None:
+                        cls.current_entity_executing = cls.screen_overlay
+                        cls.screen_overlay._iterate_generator()
+                    return
+            # Entities registered part way through can add buckets anywhere in the order.
+            # Ones after this bucket are executed when it's reached and ones before it
+            # have gone in the late list.
+            position += 1
+            while position < len(order) and order[position] >= priority:
+                position += 1
+        cls.entity_executing_priority = None
 
-        # Hack - we assume a window backend will *either* return a non-zero fps value from the clock object
-        # *or* have provided a non-zero time delta value, depending on how the main loop is handled
-        clock_fps = int(cls.clock.get_fps())
-        cls.current_fps = clock_fps if dt == 0 else 1.0/dt
+    @classmethod
+    def interpolation_store_previous(cls):
+        """
+        Used by the fixed timestep loop to remember where every Entity was before
+        a tick runs, so they can be drawn between that and their new position.
+        """
+        for entity in cls.entity_list:
+            if entity._store is None:
+                entity._previous_x = entity._x
+                entity._previous_y = entity._y
+        for store in cls.entity_stores.values():
+            store.previous_x = store.x
+            store.previous_y = store.y
 
-        # Wait for next frame, hitting a particular fps
-        cls.clock.tick(cls.target_fps)
-    
     @classmethod
     def entity_register(cls, entity):
         """ 
         Registers an entity with Myrmidon so it will be executed.
         """
+        # Recycled pooled Entities were never taken out of the gfx engine
+        recycled = entity in cls.entity_registry
+        cls.entity_registry[entity] = True
+        entity._registration_order = cls.entity_registration_count
+        cls.entity_registration_count += 1
         cls.entity_list.append(entity)
         cls.entity_draw_list.append(entity)
-        cls.engine['gfx'].register_entity(entity)
-        cls.entity_priority_dirty = True
+        cls.draw_order.add(entity)
+        if entity.array_store:
+            cls.entity_store_add(entity)
+        # Newest so always goes on the end of its bucket, straight away so that it
+        # can execute this frame. Classes updated in a batch are never executed one by one.
+        if entity.batch_update is None:
+            entity._active = True
+            entity._bucket = entity._priority
+            cls.entity_priority_bucket(entity._priority).append(entity)
+            executing_priority = cls.entity_executing_priority
+            if not executing_priority is None and entity._priority > executing_priority:
+                cls.entity_late_arrivals.append(entity)
+        cls.frame_stats['entities_registered'] += 1
+        cls.entity_index_add(entity)
+        if recycled:
+            # Attributes were reset, apart from being hidden while it was parked
+            del entity._drawing
+            cls.engine['gfx'].alter_z(entity, entity.z)
+            cls.engine['gfx'].alter_display(entity, entity.drawing)
+        elif not cls.entity_spawn_batch is None:
+            cls.entity_spawn_batch.append(entity)
+        else:
+            cls.engine['gfx'].register_entity(entity)
+        if not cls.collision_hash is None:
+            cls.collision_hash_dirty[entity] = None
 
         # Handle relationships
         if cls.current_entity_executing != None:
@@ -1010,20 +1801,337 @@ class Game(object):
             entity.next_sibling = entity.parent.child
             entity.parent.child = entity
     
+    @classmethod
+    def entity_batch_begin(cls):
+        """
+        Starts holding back gfx registration of new Entities so they can all be
+        registered at once by entity_batch_end. Batches can be nested, only the
+        outermost one registers anything.
+        """
+        cls.entity_batch_depth += 1
+        if cls.entity_spawn_batch is None:
+            cls.entity_spawn_batch = []
+
+    @classmethod
+    def entity_batch_end(cls):
+        cls.entity_batch_depth -= 1
+        if cls.entity_batch_depth:
+            return
+        batch = cls.entity_spawn_batch
+        cls.entity_spawn_batch = None
+        if batch:
+            cls.engine['gfx'].register_entities(batch)
+
+    @classmethod
+    def entity_spawn_queued(cls):
+        """
+        Creates every Entity that was queued with queue_spawn as a single batch.
+        Anything queued while doing this waits until next frame.
+        """
+        queue = cls.entity_spawn_queue
+        cls.entity_spawn_queue = []
+        remember_executing = cls.current_entity_executing
+        cls.entity_batch_begin()
+        try:
+            for parent, entity_class, args, kwargs in queue:
+                if not cls.entity_registry.get(parent, False):
+                    parent = None
+                cls.current_entity_executing = parent
+                entity_class(*args, **kwargs)
+        finally:
+            cls.current_entity_executing = remember_executing
+            cls.entity_batch_end()
+
+    @classmethod
+    def entity_set_executing(cls, entity, executing):
+        """
+        Starts or stops an Entity executing, moving it in or out of the active list.
+        Stopping a sleeping Entity takes it off the wake schedule, remembering how
+        long it had left to sleep in sleep_counter so it carries on when started.
+        """
+        entity._executing = executing
+        if executing:
+            if cls.entity_registry.get(entity, False) and entity._wake_handle is None:
+                cls.entity_activate(entity)
+        else:
+            cls.entity_deactivate(entity)
+            if not entity._wake_handle is None:
+                entity.sleep_counter = max(0, entity._wake_handle.deadline - cls.current_frame)
+                entity._wake_handle.cancel()
+                entity._wake_handle = None
+
+    @classmethod
+    def entity_activate(cls, entity):
+        if entity._active or not entity.batch_update is None:
+            return
+        entity._active = True
+        if entity._bucket is None:
+            cls.entity_active_added.append(entity)
+
+    @classmethod
+    def entity_deactivate(cls, entity):
+        if entity._active:
+            entity._active = False
+            if not entity._bucket is None:
+                cls.entity_active_removed[entity._bucket] = None
+
+    @classmethod
+    def entity_priority_changed(cls, entity):
+        """
+        Called when an Entity's priority is altered so it can be moved to the
+        right bucket at the start of the next frame.
+        """
+        if cls.entity_registry.get(entity, False):
+            cls.entity_priority_moved.append(entity)
+
+    @classmethod
+    def entity_priority_bucket(cls, priority):
+        """
+        Returns the list of active Entities with the given priority, creating it
+        if it doesn't exist yet.
+        """
+        bucket = cls.entity_priority_buckets.get(priority)
+        if bucket is None:
+            bucket = cls.entity_priority_buckets[priority] = []
+            order = cls.entity_priority_order
+            position = 0
+            while position < len(order) and order[position] > priority:
+                position += 1
+            order.insert(position, priority)
+            cls.frame_stats['priority_buckets_added'] += 1
+        return bucket
+
+    @classmethod
+    def entity_bucket_insert(cls, entity):
+        """
+        Puts an Entity into the bucket for its priority, keeping the bucket in
+        registration order.
+        """
+        bucket = cls.entity_priority_bucket(entity._priority)
+        order = entity._registration_order
+        entity._bucket = entity._priority
+        if not bucket or bucket[-1]._registration_order < order:
+            bucket.append(entity)
+            return
+        low, high = 0, len(bucket)
+        while low < high:
+            middle = (low + high) // 2
+            if bucket[middle]._registration_order < order:
+                low = middle + 1
+            else:
+                high = middle
+        bucket.insert(low, entity)
+
+    @classmethod
+    def entity_active_update(cls):
+        """
+        Brings the priority buckets up to date with Entities that were activated,
+        deactivated or had their priority changed since they were last used.
+        """
+        stats = cls.frame_stats
+        if cls.entity_priority_moved:
+            for entity in cls.entity_priority_moved:
+                if entity._bucket is None or entity._bucket == entity._priority:
+                    continue
+                cls.entity_active_removed[entity._bucket] = None
+                if entity._active:
+                    cls.entity_bucket_insert(entity)
+                else:
+                    entity._bucket = None
+                stats['priority_moves'] += 1
+            cls.entity_priority_moved = []
+        if cls.entity_active_added:
+            for entity in cls.entity_active_added:
+                if entity._active and entity._bucket is None:
+                    cls.entity_bucket_insert(entity)
+                    stats['entities_activated'] += 1
+            cls.entity_active_added = []
+        if cls.entity_active_removed:
+            cls.entity_active_compact()
+
+    @classmethod
+    def entity_active_compact(cls):
+        """
+        Takes Entities that have been deactivated out of their buckets, removing
+        any buckets that end up empty.
+        """
+        if cls.entity_active_removed:
+            buckets = cls.entity_priority_buckets
+            for priority in cls.entity_active_removed:
+                bucket = buckets.get(priority)
+                if bucket is None:
+                    continue
+                active_bucket = []
+                for entity in bucket:
+                    if not entity._bucket == priority:
+                        continue
+                    if entity._active:
+                        active_bucket.append(entity)
+                    else:
+                        entity._bucket = None
+                if active_bucket:
+                    bucket[:] = active_bucket
+                else:
+                    del buckets[priority]
+                    cls.entity_priority_order.remove(priority)
+            cls.entity_active_removed = {}
+
+    @classmethod
+    def entity_sleep(cls, entity):
+        """
+        Parks an Entity that has yielded a number of frames to sleep for. It's taken
+        out of the active list and put back on the frame it should next execute on.
+        """
+        cls.entity_deactivate(entity)
+        entity._wake_handle = cls.entity_wake_wheel.add(
+            partial(cls.entity_wake, entity),
+            cls.current_frame + entity.sleep_counter + 1
+            )
+
+    @classmethod
+    def entity_wake(cls, entity):
+        entity._wake_handle = None
+        entity.sleep_counter = 0
+        if entity._executing and cls.entity_registry.get(entity, False):
+            cls.entity_activate(entity)
+
+    @classmethod
+    def entity_store_add(cls, entity):
+        """
+        Puts an Entity into the array store for its class, creating the store
+        the first time an instance is registered.
+        """
+        entity_class = type(entity)
+        store = cls.entity_stores.get(entity_class)
+        if store is None:
+            if not numpy_available:
+                raise MyrmidonError("NumPy is required for Entity classes with array_store set.")
+            store = cls.entity_stores[entity_class] = EntityArrayStore(entity_class)
+            store.install_fields(entity_class)
+        store.add(entity)
+
+    @classmethod
+    def entity_pool_release(cls, entity):
+        """
+        Puts a destroyed pooled Entity in its class's pool to be recycled. Clearing
+        its attributes drops its state generators, which would otherwise keep it alive
+        through a reference cycle, so it's ready to be reused as if newly created. It
+        stays registered with the gfx engine, hidden, but leaves the draw order and
+        Entity lists until it's reused. Returns False if the pool is already full.
+        """
+        pool = cls.entity_pools.get(type(entity))
+        if pool is None:
+            pool = cls.entity_pools[type(entity)] = []
+        if len(pool) >= entity.pool_limit:
+            return False
+        cls.draw_order.remove(entity)
+        entity.__dict__.clear()
+        entity.drawing = False
+        pool.append(entity)
+        return True
+
+    @classmethod
+    def entity_remove_marked(cls):
+        """
+        Removes every Entity that has been destroyed this frame. Entities are taken
+        out of the registry one at a time but the derived lists are rebuilt in
+        a single pass afterwards rather than searched through for each one.
+        """
+        registry = cls.entity_registry
+        pooled = []
+        for x in cls.entities_to_remove:
+            if not registry.get(x) is False:
+                continue
+            if x.next_sibling:
+                x.next_sibling.prev_sibling = None
+            if x.prev_sibling:
+                x.prev_sibling.next_sibling = None
+            if x.parent and x.parent.child is x:
+                x.parent.child = None
+            x.parent = None
+            cls.entity_deactivate(x)
+            if not x._wake_handle is None:
+                x._wake_handle.cancel()
+                x._wake_handle = None
+            if not cls.collision_hash is None:
+                cls.collision_hash.remove(x)
+                cls.collision_hash_dirty.pop(x, None)
+            cls.collision_layer_entities.pop(x, None)
+            cls.entity_index_remove(x)
+            if not x._store is None:
+                x._store.remove(x)
+            if x.pooled:
+                pooled.append(x)
+            else:
+                del registry[x]
+                cls.draw_order.remove(x)
+                cls.engine['gfx'].remove_entity(x)
+        cls.entities_to_remove = []
+
+        # Pooled Entities must be out of the execution order before they can be reused
+        if pooled:
+            cls.entity_active_compact()
+            for x in pooled:
+                if cls.entity_pool_release(x):
+                    registry[x] = None
+                else:
+                    del registry[x]
+                    cls.draw_order.remove(x)
+                    cls.engine['gfx'].remove_entity(x)
+
+        # Slice assignment so anything holding a reference to the lists sees the change.
+        # Pooled Entities waiting to be reused are None in the registry.
+        cls.entity_list[:] = [x for x in cls.entity_list if not registry.get(x) is None]
+        cls.entity_draw_list[:] = [x for x in cls.entity_draw_list if not registry.get(x) is None]
+
+    @classmethod
+    def entity_index_add(cls, entity):
+        """Adds an Entity to the class type and class name lookups used by get_entities."""
+        for entity_class in type(entity).__mro__:
+            if entity_class is object:
+                continue
+            index = cls.entity_class_index.get(entity_class)
+            if index is None:
+                index = cls.entity_class_index[entity_class] = OrderedDict()
+            index[entity] = None
+
+        class_name = type(entity).__name__
+        index = cls.entity_name_index.get(class_name)
+        if index is None:
+            index = cls.entity_name_index[class_name] = OrderedDict()
+        index[entity] = None
+
+    @classmethod
+    def entity_index_remove(cls, entity):
+        """Removes an Entity from the class type and class name lookups."""
+        for entity_class in type(entity).__mro__:
+            index = cls.entity_class_index.get(entity_class)
+            if index is None:
+                continue
+            index.pop(entity, None)
+            if not index:
+                del cls.entity_class_index[entity_class]
+
+        class_name = type(entity).__name__
+        index = cls.entity_name_index.get(class_name)
+        if not index is None:
+            index.pop(entity, None)
+            if not index:
+                del cls.entity_name_index[class_name]
+
     @classmethod
     def add_entity_to_list(cls, entity, entity_list, tree = False):
         """Used by the get_entities method to add a single Entity object to
-        a list, if it doesn't already exist in the list, along with a tree of
+        an ordered set, if it doesn't already exist in it, along with a tree of
         children if applicable.
 
         Keyword arguments:
-        -- entity: An Entity obj to add to the given list.
-        -- entity_list: The list to add to.
+        -- entity: An Entity obj to add to the given ordered set.
+        -- entity_list: An OrderedDict used as an ordered set to add to.
         -- tree: If we want to also add all the children of the Entity to the
           list. (default False)
         """
-        if not entity in entity_list:
-            entity_list.append(entity)
+        entity_list[entity] = None
 
         if tree:
             next_child = entity.child
@@ -1032,6 +2140,177 @@ class Game(object):
                     cls.add_entity_to_list(next_child, entity_list, tree = tree)
                 next_child = next_child.next_sibling
 
+    @classmethod
+    def collision_hash_mark_dirty(cls, entity):
+        """Called by Entities when their position or shape changes so they will be
+        moved within the collision spatial hash before the next collision query."""
+        entity._collision_hash_dirty = True
+        if not cls.collision_hash is None:
+            cls.collision_hash_dirty[entity] = None
+
+    @classmethod
+    def collision_hash_update(cls):
+        """Brings the collision spatial hash up to date, creating it if this is
+        the first time it's been needed. Only Entities that have changed since
+        the last update are rehashed. Pooled Entities waiting to be recycled are
+        never hashed."""
+        registry = cls.entity_registry
+        if cls.collision_hash is None:
+            cls.collision_hash = SpatialHash(cls.collision_hash_cell_size)
+            cls.collision_hash_dirty = OrderedDict.fromkeys(cls.entity_list)
+            cls.collision_stores_dirty = OrderedDict()
+
+        if cls.collision_stores_dirty:
+            for store in cls.collision_stores_dirty:
+                for entity in store.entities:
+                    cls.collision_hash_dirty[entity] = None
+            cls.collision_stores_dirty = OrderedDict()
+
+        if not cls.collision_hash_dirty:
+            return
+
+        dirty = cls.collision_hash_dirty
+        cls.collision_hash_dirty = OrderedDict()
+        for entity in dirty:
+            entity._collision_hash_dirty = False
+            if entity.collision_on and not registry.get(entity, True) is None:
+                cls.collision_hash.update(entity, entity.collision_calculate_broadphase_bounds())
+            else:
+                cls.collision_hash.remove(entity)
+
+    @classmethod
+    def collision_layer_update(cls, entity):
+        """Adds an Entity to or removes it from the collision pass depending on
+        whether it currently has a collision_layer set. Destroyed Entities are never added."""
+        if entity.collision_layer and cls.entity_registry.get(entity, True):
+            cls.collision_layer_entities[entity] = None
+        else:
+            cls.collision_layer_entities.pop(entity, None)
+
+    @classmethod
+    def collision_layer_pairs(cls):
+        """Returns a list of (Entity, Entity) tuples for every pair of Entities on
+        collision layers that are colliding. Each pair is only tested and returned
+        once, with the Entity that joined the collision pass first on the left.
+        Pairs are only tested if the collision_mask of each includes a layer of the other."""
+        entities = [
+            entity for entity in cls.collision_layer_entities
+            if entity.collision_on and cls.entity_registry.get(entity, True)
+            ]
+        if len(entities) < 2:
+            return []
+
+        cls.collision_hash_update()
+        object_bounds = cls.collision_hash.object_bounds
+        order = dict((entity, i) for i, entity in enumerate(entities))
+        pairs = []
+        for i, entity in enumerate(entities):
+            layer = entity.collision_layer
+            mask = entity.collision_mask
+            for check_object in cls.collision_hash.query(object_bounds[entity]):
+                # Anything earlier in the list has already been tested against this one
+                if order.get(check_object, -1) <= i:
+                    continue
+                if not (layer & check_object.collision_mask and check_object.collision_layer & mask):
+                    continue
+                if cls.check_collision(entity, check_object):
+                    pairs.append((entity, check_object))
+        return pairs
+
+    @classmethod
+    def collision_layer_pass(cls):
+        """Runs once a frame after Entity execution. Finds every colliding pair of
+        Entities on collision layers and calls on_collision on both of them.
+        All of the pairs are found before any callbacks are made, pairs that include
+        an Entity destroyed by an earlier callback this frame are skipped."""
+        registry = cls.entity_registry
+        for entity_a, entity_b in cls.collision_layer_pairs():
+            if not registry.get(entity_a, True) or not registry.get(entity_b, True):
+                continue
+            cls.current_entity_executing = entity_a
+            entity_a.on_collision(entity_b)
+            if not registry.get(entity_b, True):
+                continue
+            cls.current_entity_executing = entity_b
+            entity_b.on_collision(entity_a)
+        cls.current_entity_executing = None
+
+    @classmethod
+    def collision_candidates(cls, entity, target = None):
+        """A generator that yields Entities colliding with the one given, using the
+        spatial hash to only run the narrowphase tests on those that are nearby.
+        See collide_query for a description of the arguments."""
+        if not entity.collision_on:
+            return
+
+        cls.collision_hash_update()
+
+        # Work out how we're filtering the results
+        match_name = match_type = match_set = None
+        if isinstance(target, str):
+            match_name = target
+        elif isinstance(target, type):
+            match_type = target
+        elif isinstance(target, BaseEntity):
+            match_set = (target,)
+        elif not target is None:
+            match_set = set(target)
+
+        if entity in cls.collision_hash:
+            bounds = cls.collision_hash.object_bounds[entity]
+        else:
+            bounds = entity.collision_calculate_broadphase_bounds()
+
+        for check_object in cls.collision_hash.query(bounds):
+            if check_object is entity or not check_object.collision_on:
+                continue
+            if not match_name is None and not check_object.__class__.__name__ == match_name:
+                continue
+            if not match_type is None and not isinstance(check_object, match_type):
+                continue
+            if not match_set is None and not check_object in match_set:
+                continue
+            if cls.check_collision(entity, check_object):
+                yield check_object
+
+    @classmethod
+    def check_collision(cls, entity_a, entity_b):
+        """
+        Runs the relevant collision method for the collision types of the two
+        Entities given. Returns True/False on collision.
+
+        Keyword arguments:
+        -- entity_a: The first Entity we are checking.
+        -- entity_b: The Entity we are checking the first one against.
+        """
+        # Each pair of types maps to the method to call and whether the Entities
+        # need to be swapped around to match the order of its arguments.
+        method, swap = cls.collision_dispatch[(entity_a.collision_type, entity_b.collision_type)]
+        if swap:
+            return method(entity_b, entity_a)
+        return method(entity_a, entity_b)
+
+    @classmethod
+    def collision_rectangle_shape(cls, rectangle):
+        """
+        Returns the RectangleShape holding the cached values the rectangle collision
+        methods need. Objects that don't cache their own through a
+        collision_rectangle_calculate_shape method have it built from their corners.
+
+        Keyword arguments:
+        -- rectangle: The Entity that is a rectangle.
+        """
+        calculate_shape = getattr(rectangle, "collision_rectangle_calculate_shape", None)
+        if calculate_shape is None:
+            return rectangle_shape(
+                rectangle.collision_rectangle_calculate_corners(),
+                rectangle.collision_rectangle_size(),
+                rectangle.x,
+                rectangle.y,
+                rectangle.rotation
+                )
+        return calculate_shape()
+
     @classmethod
     def collision_rectangle_to_rectangle(cls, rectangle_a, rectangle_b):
         """ 
@@ -1043,63 +2322,31 @@ class Game(object):
         -- rectangle_a: The first Entity we are checking.
         -- rectangle_b: The Entity we are checking the first one against.
         """
-        # retrieve loctaions of box corners
-        check_object_a = rectangle_a.collision_rectangle_calculate_corners()
-        check_object_b = rectangle_b.collision_rectangle_calculate_corners()
-
-        # Step 1 is calculating the 4 axis of our two objects
-        # we will use them check the collisions
-        axis = [(0,0), (0,0), (0,0), (0,0)]
-
-        axis[0] = (check_object_a['ur'][0] - check_object_a['ul'][0],
-                   check_object_a['ur'][1] - check_object_a['ul'][1])
-
-        axis[1] = (check_object_a['ur'][0] - check_object_a['lr'][0],
-                   check_object_a['ur'][1] - check_object_a['lr'][1])
-
-        axis[2] = (check_object_b['ul'][0] - check_object_b['ll'][0],
-                   check_object_b['ul'][1] - check_object_b['ll'][1])
-
-        axis[3] = (check_object_b['ul'][0] - check_object_b['ur'][0],
-                   check_object_b['ul'][1] - check_object_b['ur'][1])
-
-        # We will need to determine a collision for each of the 4 axis
-        # If any of the axis do ~not~ collide then we determine that no
-        # collision has occured.
-        for single_axis in axis:
-            # Step 2 is projecting the vectors of each corner of each rectangle
-            # on to the axis. This is to determine the min/max projected vectors
-            # of each rectangle.
-            corner_vector_projection = {rectangle_a: dict(check_object_a), rectangle_b: dict(check_object_b)}
-            rectangle_bounds = {rectangle_a: {'min' : None, 'max' : None}, rectangle_b: {'min' : None, 'max' : None}}
-
-            for object_ in corner_vector_projection:
-                for corner_name in corner_vector_projection[object_]:
-                    projection = (
-                        (
-                            (corner_vector_projection[object_][corner_name][0] * single_axis[0]) 
-                                + (corner_vector_projection[object_][corner_name][1] * single_axis[1])
-                        ) / (
-                            (single_axis[0] * single_axis[0]) + (single_axis[1] * single_axis[1])
-                        )
-                    )
-                    corner_vector_projection[object_][corner_name] = ((projection * single_axis[0]) * single_axis[0]) \
-                        + ((projection * single_axis[1]) * single_axis[1])
-
-                    # Step 3 is working out what the min and max location of each corner
-                    # projected on the axis is for each rectangle.
-                    if rectangle_bounds[object_]['min'] is None \
-                            or corner_vector_projection[object_][corner_name] < rectangle_bounds[object_]['min']:
-                        rectangle_bounds[object_]['min'] = corner_vector_projection[object_][corner_name]
-
-                    if rectangle_bounds[object_]['max'] is None \
-                            or corner_vector_projection[object_][corner_name] > rectangle_bounds[object_]['max']:
-                        rectangle_bounds[object_]['max'] = corner_vector_projection[object_][corner_name]
-
-            # Step 4 is determining if the min and max corner projections of each rectangle on the axis overlap
-            # If they don't then we can conclude that no collision has occured.
-            if not (rectangle_bounds[rectangle_b]['min'] <= rectangle_bounds[rectangle_a]['max'] \
-                    and rectangle_bounds[rectangle_b]['max'] >= rectangle_bounds[rectangle_a]['min']):
+        shape_a = cls.collision_rectangle_shape(rectangle_a)
+        shape_b = cls.collision_rectangle_shape(rectangle_b)
+
+        # Rectangles with bounding boxes that don't touch can't be colliding,
+        # this rules out most pairs before doing any projecting.
+        bounds_a = shape_a.bounds
+        bounds_b = shape_b.bounds
+        if bounds_a[0] > bounds_b[2] + BOUNDS_MARGIN or bounds_b[0] > bounds_a[2] + BOUNDS_MARGIN \
+           or bounds_a[1] > bounds_b[3] + BOUNDS_MARGIN or bounds_b[1] > bounds_a[3] + BOUNDS_MARGIN:
+            return False
+
+        # Each rectangle provides two of the four axes, along with the min/max of
+        # its own corners projected on to them, so only the other rectangle's
+        # corners need projecting. If any of the axis do ~not~ overlap then we
+        # determine that no collision has occured.
+        corners_b = shape_b.corners
+        for axis_x, axis_y, length_squared, min_a, max_a in shape_a.first_axes:
+            min_b, max_b = project_corners(corners_b, axis_x, axis_y, length_squared)
+            if not (min_b <= max_a and max_b >= min_a):
+                return False
+
+        corners_a = shape_a.corners
+        for axis_x, axis_y, length_squared, min_b, max_b in shape_b.second_axes:
+            min_a, max_a = project_corners(corners_a, axis_x, axis_y, length_squared)
+            if not (min_b <= max_a and max_b >= min_a):
                 return False
 
         # If we have got this far then we can assume that a collision has occured.
@@ -1116,22 +2363,28 @@ class Game(object):
         -- point: The Entity that is a point.
         -- rectangle: The Entity this is a rectangle.
         """
-        # Get all usable values
-        check_object_a = point.collision_point_calculate_point()
-        check_object_b = rectangle.collision_rectangle_calculate_corners()
-        check_object_b_size = rectangle.collision_rectangle_size()
+        point_x, point_y = point.collision_point_calculate_point()
+        shape = cls.collision_rectangle_shape(rectangle)
+
+        # Points outside of the area the rectangle covers can be ignored straight away
+        bounds = shape.point_test_bounds
+        if point_x < bounds[0] - BOUNDS_MARGIN or point_x > bounds[2] + BOUNDS_MARGIN \
+           or point_y < bounds[1] - BOUNDS_MARGIN or point_y > bounds[3] + BOUNDS_MARGIN:
+            return False
 
         # rotate the point by -rectangle_angle around the centre of the rectangle
-        rotated_point = Game.rotate_point_about_point(
-            check_object_a[0],
-            check_object_a[1],
-            -rectangle.rotation,
-            rectangle.x,
-            rectangle.y
-            )
+        cos_r, sin_r = shape.reverse_rotation
+        offset_x = point_x - rectangle.x
+        offset_y = point_y - rectangle.y
+        rotated_x = (cos_r * offset_x - sin_r * offset_y) + rectangle.x
+        rotated_y = (sin_r * offset_x + cos_r * offset_y) + rectangle.y
 
         # Check that point is within the rectangle
-        return Game.point_in_rectangle(rotated_point, check_object_b['ul'], check_object_b_size)
+        left = shape.corners[0]
+        top = shape.corners[1]
+        width, height = shape.size
+        return (rotated_x > left and rotated_x < (left + width) and
+                rotated_y > top and rotated_y < (top + height))
 
     @classmethod
     def collision_circle_to_rectangle(cls, circle, rectangle):
@@ -1144,37 +2397,41 @@ class Game(object):
         -- circle: The Entity that is a circle.
         -- rectangle: The Entity this is a rectangle.
         """
-        check_object_a = circle
-        check_object_b = rectangle
-        check_object_a_radius = check_object_a.collision_circle_calculate_radius()
-        check_object_b_corners = check_object_b.collision_rectangle_calculate_corners()
-        check_object_b_size = check_object_b.collision_rectangle_size()
+        radius = circle.collision_circle_calculate_radius()
+        shape = cls.collision_rectangle_shape(rectangle)
+        circle_x = circle.x
+        circle_y = circle.y
+
+        # Circles too far away from the area the rectangle covers can be ignored straight away
+        bounds = shape.circle_test_bounds
+        reach = radius + BOUNDS_MARGIN
+        if circle_x < bounds[0] - reach or circle_x > bounds[2] + reach \
+           or circle_y < bounds[1] - reach or circle_y > bounds[3] + reach:
+            return False
 
         # rotate the cicle by -rectangle_angle around the centre of the rectangle
-        rotated_ciricle = Game.rotate_point_about_point(
-            check_object_a.x,
-            check_object_a.y,
-            -check_object_b.rotation,
-            check_object_b.x,
-            check_object_b.y
-            )
-
-        half_width = check_object_b_size[0] / 2
-        half_height = check_object_b_size[1] / 2
-
-        circle_distance = (abs(rotated_ciricle[0] - check_object_b.x), abs(rotated_ciricle[1] - check_object_b.y))
-
-        if circle_distance[0] > (half_width + check_object_a_radius) or \
-           circle_distance[1] > (half_height + check_object_a_radius):
+        cos_r, sin_r = shape.reverse_rotation
+        x = rectangle.x
+        y = rectangle.y
+        offset_x = circle_x - x
+        offset_y = circle_y - y
+        distance_x = abs(((cos_r * offset_x - sin_r * offset_y) + x) - x)
+        distance_y = abs(((sin_r * offset_x + cos_r * offset_y) + y) - y)
+
+        half_width = shape.size[0] / 2
+        half_height = shape.size[1] / 2
+
+        if distance_x > (half_width + radius) or \
+           distance_y > (half_height + radius):
             return False
 
-        if circle_distance[0] <= half_width or \
-           circle_distance[1] <= half_height:
+        if distance_x <= half_width or \
+           distance_y <= half_height:
             return True
 
-        corner_distance_sq = ((circle_distance[0] - half_width) ** 2) + ((circle_distance[1] - half_height) ** 2)
+        corner_distance_sq = ((distance_x - half_width) ** 2) + ((distance_y - half_height) ** 2)
 
-        return (corner_distance_sq <= (check_object_a_radius**2))
+        return (corner_distance_sq <= (radius**2))
 
     @classmethod
     def collision_circle_to_circle(cls, circle_a, circle_b):
@@ -1186,13 +2443,11 @@ class Game(object):
         -- circle_a: The first Entity.
         -- circle_b: The Entity we are checking against.
         """
-        check_object_a = circle_a
-        check_object_b = circle_b
-        check_object_a_radius = check_object_a.collision_circle_calculate_radius()
-        check_object_b_radius = check_object_b.collision_circle_calculate_radius()
+        radius_a = circle_a.collision_circle_calculate_radius()
+        radius_b = circle_b.collision_circle_calculate_radius()
 
         # Outside of each others radius
-        if check_object_a.get_distance_squared((check_object_b.x, check_object_b.y)) > (check_object_a_radius + check_object_b_radius)**2:
+        if math.pow(circle_b.y - circle_a.y, 2) + math.pow(circle_b.x - circle_a.x, 2) > (radius_a + radius_b)**2:
             return False
 
         return True
@@ -1208,13 +2463,11 @@ class Game(object):
         -- point: The Entity that is a point.
         -- circle: The Entity this is a circle.
         """
-        check_object_a = point
-        check_object_b = circle
-        check_object_a_point = check_object_a.collision_point_calculate_point()
-        check_object_b_radius = check_object_b.collision_circle_calculate_radius()
+        point_x, point_y = point.collision_point_calculate_point()
+        radius = circle.collision_circle_calculate_radius()
 
         # Outside of each others radius
-        if cls.get_distance(check_object_a_point, (check_object_b.x,check_object_b.y)) > check_object_b_radius:
+        if math.sqrt(math.pow(circle.y - point_y, 2) + math.pow(circle.x - point_x, 2)) > radius:
             return False
 
         return True
@@ -1251,6 +2504,20 @@ Game.collision_methods = {
         (COLLISION_TYPE_POINT, COLLISION_TYPE_POINT) : Game.collision_point_to_point
         }
 
+# check_collision uses this to call the methods with positional arguments. The
+# flag says if the pair of Entities is the opposite way round to the arguments.
+Game.collision_dispatch = {
+        (COLLISION_TYPE_RECTANGLE, COLLISION_TYPE_RECTANGLE) : (Game.collision_rectangle_to_rectangle, False),
+        (COLLISION_TYPE_POINT, COLLISION_TYPE_RECTANGLE) : (Game.collision_point_to_rectangle, False),
+        (COLLISION_TYPE_RECTANGLE, COLLISION_TYPE_POINT) : (Game.collision_point_to_rectangle, True),
+        (COLLISION_TYPE_CIRCLE, COLLISION_TYPE_RECTANGLE) : (Game.collision_circle_to_rectangle, False),
+        (COLLISION_TYPE_RECTANGLE, COLLISION_TYPE_CIRCLE) : (Game.collision_circle_to_rectangle, True),
+        (COLLISION_TYPE_CIRCLE, COLLISION_TYPE_CIRCLE) : (Game.collision_circle_to_circle, False),
+        (COLLISION_TYPE_POINT, COLLISION_TYPE_CIRCLE) : (Game.collision_point_to_circle, False),
+        (COLLISION_TYPE_CIRCLE, COLLISION_TYPE_POINT) : (Game.collision_point_to_circle, True),
+        (COLLISION_TYPE_POINT, COLLISION_TYPE_POINT) : (Game.collision_point_to_point, False)
+        }
+
 
 class MyrmidonError(Exception):
     def __init__(self, value):
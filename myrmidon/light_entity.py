@@ -0,0 +1,268 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+An open source, actor based framework for fast game development for Python.
+
+This file contains LightEntity, a cut down Entity for when there are very
+many simple objects. It uses __slots__ instead of an instance dictionary and
+stores most properties directly rather than through properties.
+"""
+
+from myrmidon.game import Game, MyrmidonError
+from myrmidon.base_entity import BaseEntity
+
+
+class LightEntity(BaseEntity):
+    """A smaller and faster Entity for simple objects that there are lots of,
+    like particles or decorations. Instances have no __dict__ so new attributes
+    have to be declared in a __slots__ tuple in the subclass.
+
+    Compared to Entity it has some limitations -
+      * There are no states other than execute.
+      * It can't collide, collision_on is always False.
+      * It can't be pooled or use an array store and modules are not loaded for it.
+      * It can't be the first Entity created.
+      * x, y, rotation, scale, colour, alpha and the other drawing attributes are
+        plain attributes. Setting them doesn't tell the gfx engine, so this can only
+        be used with gfx engines that don't need to know. Position queries only see
+        them move once per frame.
+    z, image, priority and drawing are still properties, and the gfx engine is
+    only told about changes to z, image and drawing if it says it needs to know.
+    """
+
+    __slots__ = (
+        'x', 'y', '_z', '_priority', '_image', 'image_seq', 'colour', 'alpha',
+        'scale', 'rotation', 'centre_point', '_drawing',
+        'blend', 'clip', 'normal_draw', 'flip_vertical', 'flip_horizontal',
+        'parent', 'child', 'prev_sibling', 'next_sibling',
+        'sleep_counter', '_executing', '_generator',
+        '_previous_x', '_previous_y',
+        '_registration_order', '_active', '_bucket', '_wake_handle',
+        '_collision_hash_dirty',
+        )
+
+    # Never changes, there are no other states
+    _current_state = "execute"
+
+    collision_on = False
+    pooled = False
+    array_store = False
+    batch_update = None
+    _store = None
+    _module_list = ()
+
+    def __init__(self, *args, **kwargs):
+        if not Game.started:
+            raise MyrmidonError("A LightEntity can't be the first Entity created.")
+        hooks = Game.gfx_alter_hooks
+        if not hooks is None:
+            unsupported = set(hooks) - set(("z", "image", "display"))
+            if unsupported:
+                raise MyrmidonError(
+                    "The gfx engine needs to be told when %s change, which LightEntity doesn't do." % ", ".join(sorted(unsupported))
+                    )
+
+        self.x = 0.0
+        self.y = 0.0
+        self._z = 0
+        self._priority = 0
+        self._image = None
+        self.image_seq = 0
+        self.colour = (1.0, 1.0, 1.0)
+        self.alpha = 1.0
+        self.scale = 1.0
+        self.rotation = 0.0
+        self.centre_point = (-1, -1)
+        self._drawing = True
+        self.blend = False
+        self.clip = None
+        self.normal_draw = True
+        self.flip_vertical = False
+        self.flip_horizontal = False
+        self.parent = None
+        self.child = None
+        self.prev_sibling = None
+        self.next_sibling = None
+        self.sleep_counter = 0
+        self._executing = True
+        self._previous_x = None
+        self._previous_y = None
+        self._wake_handle = None
+        self._collision_hash_dirty = True
+
+        Game.entity_register(self)
+
+        self._generator = self.execute(*args, **kwargs)
+        Game.remember_current_entity_executing.append(Game.current_entity_executing)
+        Game.current_entity_executing = self
+        self._iterate_generator()
+        Game.current_entity_executing = Game.remember_current_entity_executing.pop()
+
+    def execute(self):
+        """
+        Where the logic for this entity goes, as with Entity.
+        """
+        while True:
+            yield
+
+    def on_exit(self):
+        """
+        Called automatically when the entity has finished executing or is destroyed.
+        """
+        pass
+
+    def _iterate_generator(self):
+        if not self._executing:
+            return
+        if self.sleep_counter:
+            self.sleep_counter -= 1
+            return
+        try:
+            return_val = next(self._generator)
+            if isinstance(return_val, int):
+                self.sleep_counter = return_val
+        except StopIteration:
+            self.destroy()
+
+    def draw(self):
+        """
+        Override this to add custom drawing routines to your entity.
+        """
+        pass
+
+    def get_screen_draw_position(self):
+        """Returns a tuple (x,y) of where the entity will be drawn."""
+        centre = self.get_centre_point()
+        x, y = self.get_interpolated_position()
+        return x - (centre[0] * self.scale), y - (centre[1] * self.scale)
+
+    def get_interpolated_position(self):
+        """Works the same as Entity.get_interpolated_position.
+        Returns a tuple (x,y)"""
+        if not Game.fixed_timestep or self._previous_x is None:
+            return self.x, self.y
+        alpha = Game.interpolation_alpha
+        return (self._previous_x + (self.x - self._previous_x) * alpha,
+                self._previous_y + (self.y - self._previous_y) * alpha)
+
+    def reset_interpolation(self):
+        """Works the same as Entity.reset_interpolation."""
+        self._previous_x = self.x
+        self._previous_y = self.y
+
+    def get_centre_point(self):
+        """Returns the centre of the current image if the centre_point member
+        has not been explicitly set."""
+        if -1 in self.centre_point and self._image is not None:
+            return self._image.width / 2, self._image.height / 2
+        return self.centre_point
+
+    def is_alive(self):
+        """Returns a boolean if the entity is not destroyed yet."""
+        return Game.entity_registry.get(self, False) is True
+
+    def destroy(self, tree = False):
+        """Kills this entity, stopping it from executing and displaying.
+
+        Keyword arguments:
+        -- tree: If True then all children of this entity (and their children
+          etc) will be destroyed too. (default False)
+        """
+        Game.destroy_entities(self, tree = tree)
+
+    def stop_executing(self, tree = False):
+        """Stops this entity executing code. Can be started again with start_executing."""
+        Game.stop_entities_executing(self, tree = tree)
+
+    def start_executing(self, tree = False):
+        """Starts this entity executing code if previously stopped."""
+        Game.start_entities_executing(self, tree = tree)
+
+    def hide(self, tree = False):
+        """Stops this entity being drawn."""
+        Game.hide_entities(self, tree = tree)
+
+    def show(self, tree = False):
+        """Draws this entity again if previously hidden."""
+        Game.show_entities(self, tree = tree)
+
+    def sleep(self, num_frames):
+        """yield from this to sleep for a certain number of frames."""
+        return int(num_frames)
+
+    # The engine reads these when storing positions for interpolation
+    @property
+    def _x(self):
+        return self.x
+
+    @property
+    def _y(self):
+        return self.y
+
+    @property
+    def z(self):
+        return self._z
+
+    @z.setter
+    def z(self, value):
+        self._z = value
+        Game.draw_order.alter_z(self, value)
+        hooks = Game.gfx_alter_hooks
+        if hooks is None or "z" in hooks:
+            Game.engine['gfx'].alter_z(self, value)
+
+    @property
+    def image(self):
+        return self._image
+
+    @image.setter
+    def image(self, value):
+        self._image = value
+        hooks = Game.gfx_alter_hooks
+        if hooks is None or "image" in hooks:
+            Game.engine['gfx'].alter_image(self, value)
+
+    @property
+    def drawing(self):
+        return self._drawing
+
+    @drawing.setter
+    def drawing(self, value):
+        self._drawing = value
+        hooks = Game.gfx_alter_hooks
+        if hooks is None or "display" in hooks:
+            Game.engine['gfx'].alter_display(self, value)
+
+    @property
+    def priority(self):
+        return self._priority
+
+    @priority.setter
+    def priority(self, value):
+        if not self._priority == value:
+            self._priority = value
+            Game.entity_priority_changed(self)
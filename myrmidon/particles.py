@@ -0,0 +1,239 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+Particle effects. A ParticleEmitter is a single Entity that keeps the state of
+all of its particles in NumPy arrays. They are moved all together once a frame
+and the gfx engine draws them all in one go, instead of needing an Entity each.
+"""
+
+import math
+
+try:
+    import numpy
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+from myrmidon.game import Game, MyrmidonError
+from myrmidon.entity import Entity
+
+
+class ParticleEmitter(Entity):
+    """
+    Creates particles at its position and moves them until they die. Create these
+    with Game.create_particle_emitter. All of the settings below can be changed
+    at any time and affect particles created after that.
+
+    If execute is overridden in a subclass update_particles must be called once a frame.
+    """
+
+    # How many particles to create each frame. Fractions build up between frames.
+    rate = 0.0
+    # The most particles that can be alive at once. Can't be changed after creation.
+    max_particles = 10000
+    # How many frames each particle lives for, picked randomly between the two
+    life = (30, 60)
+    # How fast particles move when they are created, picked randomly between the two
+    speed = (1.0, 3.0)
+    # The angle in degrees particles are sent in and how far either side of it they can go
+    direction = 0.0
+    spread = 360.0
+    # Added to the velocity of every particle each frame
+    gravity = (0.0, 0.0)
+    # How many degrees a frame particles rotate, picked randomly between the two
+    spin = (0.0, 0.0)
+    # Particles change between these values over their life
+    start_scale = 1.0
+    end_scale = 1.0
+    start_alpha = 1.0
+    end_alpha = 0.0
+    start_colour = (1.0, 1.0, 1.0)
+    end_colour = (1.0, 1.0, 1.0)
+    # If True the emitter destroys itself when it has no particles and a rate of 0
+    destroy_when_empty = False
+
+    # Names of the settings above that can be passed to configure
+    settings = ("rate", "max_particles", "life", "speed", "direction", "spread", "gravity",
+                "spin", "start_scale", "end_scale", "start_alpha", "end_alpha",
+                "start_colour", "end_colour", "destroy_when_empty")
+
+    # Drawn by the gfx engine in draw rather than as a single image
+    normal_draw = False
+
+    # Particle state arrays, in the order they are kept in
+    particle_fields = ("x", "y", "velocity_x", "velocity_y", "life", "max_life", "rotation", "spin")
+
+    # Texture coordinates of the four corners of a particle quad, clockwise from the top left
+    corner_tex_coords = ((0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0))
+
+    def execute(self, image, x = 0.0, y = 0.0, z = 0, **settings):
+        if not numpy_available:
+            raise MyrmidonError("NumPy is required for particle emitters.")
+        self.image = image
+        self.x = x
+        self.y = y
+        self.z = z
+        self.configure(**settings)
+        self.particle_count = 0
+        self.spawn_remainder = 0.0
+        self.particles = numpy.zeros((len(self.particle_fields), self.max_particles), numpy.float32)
+        # Reused every frame when drawing
+        self.vertex_positions = numpy.zeros((self.max_particles, 4, 2), numpy.float32)
+        self.vertex_tex_coords = numpy.empty((self.max_particles, 4, 2), numpy.float32)
+        self.vertex_tex_coords[:] = self.corner_tex_coords
+        self.vertex_colours = numpy.zeros((self.max_particles, 4, 4), numpy.float32)
+        self.particle_colours = numpy.zeros((self.max_particles, 4), numpy.float32)
+        while True:
+            self.update_particles()
+            yield
+
+    def configure(self, **settings):
+        """Changes any number of the emitter settings at once, eg configure(rate = 5, life = (10, 20))."""
+        for name in settings:
+            if not name in self.settings:
+                raise MyrmidonError("Unknown particle emitter setting " + name)
+            setattr(self, name, settings[name])
+
+    def get_particles(self, field):
+        """Returns the array of one field for every living particle. It can be
+        changed in place to alter particles.
+
+        Keyword arguments:
+        -- field: One of the names in particle_fields.
+        """
+        return self.particles[self.particle_fields.index(field), :self.particle_count]
+
+    def emit(self, count, x = None, y = None):
+        """Creates a number of particles straight away. Particles over max_particles are
+        not created. Returns how many were made.
+
+        Keyword arguments:
+        -- count: How many particles to make.
+        -- x: Where to create them, defaults to the emitter's position. (default None)
+        -- y: Where to create them, defaults to the emitter's position. (default None)
+        """
+        start = self.particle_count
+        count = min(int(count), self.max_particles - start)
+        if count <= 0:
+            return 0
+        end = start + count
+        x_pos, y_pos, velocity_x, velocity_y, life, max_life, rotation, spin = self.particles[:, start:end]
+        x_pos[:] = self.x if x is None else x
+        y_pos[:] = self.y if y is None else y
+        angle = numpy.radians(self.direction + numpy.random.uniform(-self.spread / 2.0, self.spread / 2.0, count))
+        speed = numpy.random.uniform(self.speed[0], self.speed[1], count)
+        velocity_x[:] = numpy.cos(angle) * speed
+        velocity_y[:] = numpy.sin(angle) * speed
+        life[:] = numpy.random.randint(int(self.life[0]), int(self.life[1]) + 1, count)
+        max_life[:] = life
+        rotation[:] = 0.0
+        spin[:] = numpy.random.uniform(self.spin[0], self.spin[1], count)
+        self.particle_count = end
+        return count
+
+    def update_particles(self):
+        """Moves every particle on by a frame, removes dead ones and creates new ones
+        depending on the rate."""
+        count = self.particle_count
+        if count:
+            particles = self.particles
+            life = particles[4, :count]
+            life -= 1.0
+            alive = life > 0.0
+            if not alive.all():
+                # Dead particles are removed by shuffling the living ones down
+                count = int(numpy.count_nonzero(alive))
+                particles[:, :count] = particles[:, :self.particle_count][:, alive]
+                self.particle_count = count
+            x_pos, y_pos, velocity_x, velocity_y, life, max_life, rotation, spin = particles[:, :count]
+            x_pos += velocity_x
+            y_pos += velocity_y
+            velocity_x += self.gravity[0]
+            velocity_y += self.gravity[1]
+            rotation += spin
+
+        self.spawn_remainder += self.rate
+        spawn = int(self.spawn_remainder)
+        if spawn:
+            self.spawn_remainder -= spawn
+            self.emit(spawn)
+
+        if self.destroy_when_empty and not self.particle_count and not self.rate:
+            self.destroy()
+
+    def get_vertex_arrays(self):
+        """Used by gfx engines to draw the particles. Returns three float32 arrays for
+        every corner of every particle quad, four corners to a particle going clockwise
+        from the top left - screen positions (x, y), texture coordinates (u, v)
+        and colours (r, g, b, a). The arrays are reused so are only valid until
+        this is next called."""
+        count = self.particle_count
+        x_pos, y_pos, velocity_x, velocity_y, life, max_life, rotation, spin = self.particles[:, :count]
+
+        # How far through its life each particle is, from 0 to 1
+        age = life / max_life
+        numpy.subtract(1.0, age, out = age)
+
+        # Offsets from the particle centre to its corners, rotated and scaled
+        half_width = float(self.image.width) / 2.0 if self.image else 0.0
+        half_height = float(self.image.height) / 2.0 if self.image else 0.0
+        scale = self.start_scale + (self.end_scale - self.start_scale) * age
+        positions = self.vertex_positions[:count]
+        if rotation.any():
+            radians = numpy.radians(rotation)
+            cos_r = numpy.cos(radians) * scale
+            sin_r = numpy.sin(radians) * scale
+            across_x = cos_r * half_width
+            across_y = sin_r * half_width
+            down_x = sin_r * -half_height
+            down_y = cos_r * half_height
+        else:
+            across_x = scale * half_width
+            across_y = 0.0
+            down_x = 0.0
+            down_y = scale * half_height
+        positions[:, 0, 0] = x_pos - across_x - down_x
+        positions[:, 0, 1] = y_pos - across_y - down_y
+        positions[:, 1, 0] = x_pos + across_x - down_x
+        positions[:, 1, 1] = y_pos + across_y - down_y
+        positions[:, 2, 0] = x_pos + across_x + down_x
+        positions[:, 2, 1] = y_pos + across_y + down_y
+        positions[:, 3, 0] = x_pos - across_x + down_x
+        positions[:, 3, 1] = y_pos - across_y + down_y
+
+        particle_colours = self.particle_colours[:count]
+        for i in range(3):
+            start = self.start_colour[i]
+            particle_colours[:, i] = start + (self.end_colour[i] - start) * age
+        particle_colours[:, 3] = (self.start_alpha + (self.end_alpha - self.start_alpha) * age) * self.alpha
+        colours = self.vertex_colours[:count]
+        colours[:] = particle_colours[:, None, :]
+
+        return positions.reshape(-1, 2), self.vertex_tex_coords[:count].reshape(-1, 2), colours.reshape(-1, 4)
+
+    def draw(self):
+        Game.engine['gfx'].draw_particles(self)
@@ -0,0 +1,196 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+
+A snapshot of where a set of objects are, bucketed into a uniform grid so
+that finding everything within a radius or rectangle, or the nearest
+objects to a point, only needs to look at the cells around that point.
+The grid does not follow objects as they move, it's cheap enough to build
+that it is simply thrown away and built again when it's out of date.
+"""
+
+import math
+import heapq
+
+
+class PositionGrid(object):
+
+    def __init__(self, objects, cell_size = 128.0):
+        """
+        Keyword arguments:
+        -- objects: Iterable of objects with x and y attributes to store.
+        -- cell_size: The width and height of each grid cell in pixels. Queries are
+         quickest when this is around the radius typically searched for. (default 128.0)
+        """
+        self.cell_size = size = float(cell_size)
+        # Cell coordinate tuple to a list of (x, y, order, object) tuples, where
+        # order is how many objects were stored before this one
+        self.cells = cells = {}
+        self.count = 0
+        for obj in objects:
+            x = obj.x
+            y = obj.y
+            cell = (int(math.floor(x / size)), int(math.floor(y / size)))
+            bucket = cells.get(cell)
+            if bucket is None:
+                bucket = cells[cell] = []
+            bucket.append((x, y, self.count, obj))
+            self.count += 1
+        # Range of cells that have anything in them, so searches never look further
+        if cells:
+            self.cell_extent = (
+                min(cell[0] for cell in cells), min(cell[1] for cell in cells),
+                max(cell[0] for cell in cells), max(cell[1] for cell in cells)
+                )
+        else:
+            self.cell_extent = None
+
+    def __len__(self):
+        return self.count
+
+    def cell_range(self, min_x, min_y, max_x, max_y):
+        """Returns the occupied cells that an area covers as a four-part tuple of
+        (min_x, min_y, max_x, max_y) in cell coordinates, or None if there are none."""
+        extent = self.cell_extent
+        if extent is None:
+            return None
+        size = self.cell_size
+        cell_range = (
+            max(int(math.floor(min_x / size)), extent[0]), max(int(math.floor(min_y / size)), extent[1]),
+            min(int(math.floor(max_x / size)), extent[2]), min(int(math.floor(max_y / size)), extent[3])
+            )
+        if cell_range[0] > cell_range[2] or cell_range[1] > cell_range[3]:
+            return None
+        return cell_range
+
+    def query_rectangle(self, min_x, min_y, max_x, max_y, exclude = None):
+        """Returns a list of all objects within a rectangle, including its edges.
+
+        Keyword arguments:
+        -- min_x, min_y, max_x, max_y: The edges of the rectangle.
+        -- exclude: An object to leave out of the results. (default None)
+        """
+        found = []
+        cell_range = self.cell_range(min_x, min_y, max_x, max_y)
+        if cell_range is None:
+            return found
+        cells = self.cells
+        for cell_x in range(cell_range[0], cell_range[2] + 1):
+            for cell_y in range(cell_range[1], cell_range[3] + 1):
+                bucket = cells.get((cell_x, cell_y))
+                if not bucket:
+                    continue
+                for x, y, order, obj in bucket:
+                    if x >= min_x and x <= max_x and y >= min_y and y <= max_y and not obj is exclude:
+                        found.append(obj)
+        return found
+
+    def query_radius(self, point_x, point_y, radius, exclude = None):
+        """Returns a list of all objects within a distance of a point, including
+        those exactly that distance away.
+
+        Keyword arguments:
+        -- point_x, point_y: The point to search around.
+        -- radius: How far from the point to search.
+        -- exclude: An object to leave out of the results. (default None)
+        """
+        found = []
+        cell_range = self.cell_range(point_x - radius, point_y - radius, point_x + radius, point_y + radius)
+        if cell_range is None:
+            return found
+        cells = self.cells
+        radius_sq = radius * radius
+        for cell_x in range(cell_range[0], cell_range[2] + 1):
+            for cell_y in range(cell_range[1], cell_range[3] + 1):
+                bucket = cells.get((cell_x, cell_y))
+                if not bucket:
+                    continue
+                for x, y, order, obj in bucket:
+                    dx = x - point_x
+                    dy = y - point_y
+                    if dx * dx + dy * dy <= radius_sq and not obj is exclude:
+                        found.append(obj)
+        return found
+
+    def nearest(self, point_x, point_y, k = 1, max_distance = None, exclude = None):
+        """Returns a list of up to k objects closest to a point, nearest first.
+        Objects the same distance away are in the order they were stored.
+
+        Keyword arguments:
+        -- point_x, point_y: The point to search around.
+        -- k: The most objects to return. (default 1)
+        -- max_distance: If given then objects further away than this are never
+         returned. (default None)
+        -- exclude: An object to leave out of the results. (default None)
+        """
+        extent = self.cell_extent
+        if extent is None or k < 1:
+            return []
+        size = self.cell_size
+        cells = self.cells
+        home_x = int(math.floor(point_x / size))
+        home_y = int(math.floor(point_y / size))
+        limit_sq = None if max_distance is None else max_distance * max_distance
+
+        # The best k found so far as (-distance squared, -order, object), so the
+        # first item in the heap is the furthest away of them. Searches work outwards
+        # from the point's cell a ring of cells at a time.
+        best = []
+        ring = max(0, extent[0] - home_x, extent[1] - home_y, home_x - extent[2], home_y - extent[3])
+        last_ring = max(home_x - extent[0], home_y - extent[1], extent[2] - home_x, extent[3] - home_y)
+        while ring <= last_ring:
+            # Anything not looked at yet is at least this far away
+            reach = (ring - 1) * size
+            if ring > 0 and len(best) == k and -best[0][0] < reach * reach:
+                break
+            if not limit_sq is None and ring > 0 and reach * reach > limit_sq:
+                break
+            for cell_x in range(max(home_x - ring, extent[0]), min(home_x + ring, extent[2]) + 1):
+                if abs(cell_x - home_x) == ring:
+                    cell_ys = range(max(home_y - ring, extent[1]), min(home_y + ring, extent[3]) + 1)
+                else:
+                    cell_ys = [cell_y for cell_y in (home_y - ring, home_y + ring) if extent[1] <= cell_y <= extent[3]]
+                for cell_y in cell_ys:
+                    bucket = cells.get((cell_x, cell_y))
+                    if not bucket:
+                        continue
+                    for x, y, order, obj in bucket:
+                        if obj is exclude:
+                            continue
+                        dx = x - point_x
+                        dy = y - point_y
+                        distance_sq = dx * dx + dy * dy
+                        if not limit_sq is None and distance_sq > limit_sq:
+                            continue
+                        entry = (-distance_sq, -order, obj)
+                        if len(best) < k:
+                            heapq.heappush(best, entry)
+                        elif entry > best[0]:
+                            heapq.heapreplace(best, entry)
+            ring += 1
+        best.sort(reverse = True)
+        return [entry[2] for entry in best]
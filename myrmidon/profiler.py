@@ -0,0 +1,272 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+Opt-in profiling tools. EntityProfiler adds up the time spent iterating
+each Entity by the Entity's class and the state it was in, so it's
+possible to see which kinds of Entity are taking up the frame.
+FrameTimeline records how long each phase of recent frames took and can
+save them out for viewing in a trace viewer such as chrome://tracing.
+"""
+
+import json, time
+from collections import deque
+
+# Highest resolution clock available
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class EntityProfiler(object):
+
+    def __init__(self, sample_every = 1):
+        """
+        Keyword arguments:
+        -- sample_every: Only frames that are a multiple of this number are
+         profiled, to lower the overhead of profiling. Reported times per
+         frame only take sampled frames into account. (default 1)
+        """
+        self.sample_every = max(1, int(sample_every))
+        self.reset()
+
+    def reset(self):
+        """Throws away everything that has been recorded so far."""
+        # (class, state) to a list of [calls, total time, max time]
+        self.entries = {}
+        self.frames_sampled = 0
+        self.total_time = 0.0
+
+    def should_sample(self, frame):
+        """Returns True if the given frame number should be profiled."""
+        return frame % self.sample_every == 0
+
+    def record(self, entity_class, state, elapsed):
+        """Adds a single iteration of an Entity to the totals.
+
+        Keyword arguments:
+        -- entity_class: The class of the Entity that was iterated.
+        -- state: The name of the state that the Entity was in.
+        -- elapsed: How long the iteration took in seconds.
+        """
+        entry = self.entries.get((entity_class, state))
+        if entry is None:
+            self.entries[(entity_class, state)] = [1, elapsed, elapsed]
+            return
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed > entry[2]:
+            entry[2] = elapsed
+
+    def record_frame(self, elapsed):
+        """Called once per profiled frame with how long executing every
+        Entity took altogether."""
+        self.frames_sampled += 1
+        self.total_time += elapsed
+
+    def get_stats(self, target = None, state = None):
+        """Returns a list of dictionaries, one per class and state combination,
+        ordered by the total time spent from most to least. Each contains
+        'class', 'state', 'calls', 'total_time', 'mean_time', 'max_time',
+        'time_per_frame' and 'percent'. Times are in seconds.
+
+        Keyword arguments:
+        -- target: Only return stats for this Entity class (including subclasses)
+          or class name. (default None)
+        -- state: Only return stats for this state name. (default None)
+        """
+        stats = []
+        frames = max(1, self.frames_sampled)
+        for (entity_class, entity_state), (calls, total, longest) in self.entries.items():
+            if not state is None and not entity_state == state:
+                continue
+            if isinstance(target, str):
+                if not entity_class.__name__ == target:
+                    continue
+            elif not target is None and not issubclass(entity_class, target):
+                continue
+            stats.append({
+                'class' : entity_class.__name__,
+                'state' : entity_state,
+                'calls' : calls,
+                'total_time' : total,
+                'mean_time' : total / calls,
+                'max_time' : longest,
+                'time_per_frame' : total / frames,
+                'percent' : (total / self.total_time * 100.0) if self.total_time else 0.0,
+                })
+        stats.sort(key = lambda entry: entry['total_time'], reverse = True)
+        return stats
+
+    def to_json(self, filename = None):
+        """Returns a JSON report of everything recorded, optionally also writing
+        it to a file.
+
+        Keyword arguments:
+        -- filename: Path of a file to save the report to. (default None)
+        """
+        report = json.dumps({
+            'sample_every' : self.sample_every,
+            'frames_sampled' : self.frames_sampled,
+            'total_time' : self.total_time,
+            'entries' : self.get_stats(),
+            }, indent = 2)
+        if not filename is None:
+            with open(filename, "w") as report_file:
+                report_file.write(report)
+        return report
+
+    def to_table(self, limit = None):
+        """Returns a plain text table of everything recorded, most expensive first.
+
+        Keyword arguments:
+        -- limit: Only include this many rows. (default None)
+        """
+        stats = self.get_stats()
+        if not limit is None:
+            stats = stats[:limit]
+        rows = [("Class", "State", "Calls", "Total ms", "Mean us", "Max us", "ms/frame", "%")]
+        for entry in stats:
+            rows.append((
+                entry['class'],
+                entry['state'],
+                str(entry['calls']),
+                "%.3f" % (entry['total_time'] * 1000.0),
+                "%.2f" % (entry['mean_time'] * 1000000.0),
+                "%.2f" % (entry['max_time'] * 1000000.0),
+                "%.3f" % (entry['time_per_frame'] * 1000.0),
+                "%.1f" % entry['percent'],
+                ))
+        widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+        lines = []
+        for row in rows:
+            lines.append("  ".join(
+                value.ljust(widths[column]) if column < 2 else value.rjust(widths[column])
+                for column, value in enumerate(row)
+                ))
+        lines.insert(1, "-" * len(lines[0]))
+        lines.append("%d frames sampled, %.3f ms executing entities" % (self.frames_sampled, self.total_time * 1000.0))
+        return "\n".join(lines)
+
+
+class FrameTimeline(object):
+
+    def __init__(self, max_frames = 300):
+        """
+        Keyword arguments:
+        -- max_frames: How many of the most recent frames to keep. Older
+         frames are thrown away. (default 300)
+        """
+        self.max_frames = max_frames
+        # Each frame is a tuple of (frame number, start time, end time, spans)
+        # where spans is a list of (phase name, start time, end time) tuples.
+        self.frames = deque(maxlen = max_frames)
+        self.current_frame = None
+        self.last_mark = None
+
+    def begin_frame(self, frame_number):
+        """Starts recording a new frame."""
+        self.last_mark = timer()
+        self.current_frame = (frame_number, self.last_mark, [])
+
+    def mark(self, phase):
+        """Records a span named after the phase that has just finished, from the
+        end of the previous phase (or the start of the frame) to now. Does nothing
+        if a frame hasn't been started."""
+        if self.current_frame is None:
+            return
+        now = timer()
+        self.current_frame[2].append((phase, self.last_mark, now))
+        self.last_mark = now
+
+    def end_frame(self):
+        """Finishes recording the current frame and adds it to the buffer. The
+        frame is counted as ending when its last phase did."""
+        if self.current_frame is None:
+            return
+        frame_number, start, spans = self.current_frame
+        self.frames.append((frame_number, start, self.last_mark, spans))
+        self.current_frame = None
+
+    def clear(self):
+        """Throws away every recorded frame."""
+        self.frames.clear()
+        self.current_frame = None
+
+    def get_frames(self):
+        """Returns a list of recorded frames, oldest first, as dictionaries containing
+        'frame', 'duration' and 'phases'. Phases is a list of (name, duration)
+        tuples in the order they happened. Times are in seconds."""
+        return [
+            {
+                'frame' : frame_number,
+                'duration' : end - start,
+                'phases' : [(phase, span_end - span_start) for phase, span_start, span_end in spans],
+            }
+            for frame_number, start, end, spans in self.frames
+            ]
+
+    def slowest_frames(self, count = 10):
+        """Returns the longest frames in the buffer, in the same format as get_frames.
+
+        Keyword arguments:
+        -- count: The number of frames to return. (default 10)
+        """
+        frames = self.get_frames()
+        frames.sort(key = lambda frame: frame['duration'], reverse = True)
+        return frames[:count]
+
+    def to_chrome_trace(self, filename = None):
+        """Returns every recorded frame in the Chrome trace event JSON format, optionally
+        also writing it to a file. Load it in chrome://tracing or a compatible viewer.
+
+        Keyword arguments:
+        -- filename: Path of a file to save the trace to. (default None)
+        """
+        events = []
+        for frame_number, start, end, spans in self.frames:
+            events.append({
+                'name' : "frame %d" % frame_number,
+                'cat' : "frame",
+                'ph' : "X",
+                'ts' : start * 1000000.0,
+                'dur' : (end - start) * 1000000.0,
+                'pid' : 1,
+                'tid' : 1,
+                })
+            for phase, span_start, span_end in spans:
+                events.append({
+                    'name' : phase,
+                    'cat' : "phase",
+                    'ph' : "X",
+                    'ts' : span_start * 1000000.0,
+                    'dur' : (span_end - span_start) * 1000000.0,
+                    'pid' : 1,
+                    'tid' : 1,
+                    })
+        trace = json.dumps({'traceEvents' : events, 'displayTimeUnit' : "ms"})
+        if not filename is None:
+            with open(filename, "w") as trace_file:
+                trace_file.write(trace)
+        return trace
@@ -0,0 +1,210 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+
+Casting rays through the collision spatial hash. The cells a ray passes
+through are walked in order from its origin, so only objects in those cells
+are tested, and the tests are against the same rectangle, circle and point
+shapes that Entities are collided as.
+"""
+
+import math
+from collections import namedtuple
+from myrmidon.consts import *
+from myrmidon.collision_shapes import BOUNDS_MARGIN
+
+
+# The Entity hit, how far along the ray it was hit and the (x, y) point of the hit
+RaycastHit = namedtuple('RaycastHit', ['entity', 'distance', 'point'])
+
+
+def grid_cells(origin_x, origin_y, direction_x, direction_y, length, cell_size):
+    """A generator that yields each cell of a grid that a ray passes through, in
+    order, as three-part tuples of (cell_x, cell_y, distance) where distance is
+    how far along the ray it enters that cell. When the ray goes exactly through
+    the corner of a cell both of the cells beside the corner are yielded.
+
+    Keyword arguments:
+    -- origin_x, origin_y: Where the ray starts.
+    -- direction_x, direction_y: The direction of the ray, must be normalised.
+    -- length: How far the ray goes.
+    -- cell_size: The width and height of each cell.
+    """
+    cell_x = int(math.floor(origin_x / cell_size))
+    cell_y = int(math.floor(origin_y / cell_size))
+    # For each axis, which way the ray steps through cells, how far along the ray
+    # the next cell boundary is and how far along the ray each cell is
+    if direction_x > 0:
+        step_x = 1
+        next_x = ((cell_x + 1) * cell_size - origin_x) / direction_x
+        delta_x = cell_size / direction_x
+    elif direction_x < 0:
+        step_x = -1
+        next_x = (cell_x * cell_size - origin_x) / direction_x
+        delta_x = -cell_size / direction_x
+    else:
+        step_x = 0
+        next_x = delta_x = float('inf')
+    if direction_y > 0:
+        step_y = 1
+        next_y = ((cell_y + 1) * cell_size - origin_y) / direction_y
+        delta_y = cell_size / direction_y
+    elif direction_y < 0:
+        step_y = -1
+        next_y = (cell_y * cell_size - origin_y) / direction_y
+        delta_y = -cell_size / direction_y
+    else:
+        step_y = 0
+        next_y = delta_y = float('inf')
+
+    distance = 0.0
+    while True:
+        yield cell_x, cell_y, distance
+        if next_x < next_y - BOUNDS_MARGIN:
+            distance = next_x
+            cell_x += step_x
+            next_x += delta_x
+        elif next_y < next_x - BOUNDS_MARGIN:
+            distance = next_y
+            cell_y += step_y
+            next_y += delta_y
+        else:
+            # Going through a corner, so visit the cells either side of it too
+            distance = min(next_x, next_y)
+            if distance > length:
+                return
+            yield cell_x + step_x, cell_y, distance
+            yield cell_x, cell_y + step_y, distance
+            cell_x += step_x
+            cell_y += step_y
+            next_x += delta_x
+            next_y += delta_y
+        if distance > length:
+            return
+
+
+def ray_to_circle(origin_x, origin_y, direction_x, direction_y, centre_x, centre_y, radius):
+    """Returns how far along a ray it first touches a circle, 0.0 if it starts inside
+    it, or None if it never does. Rays only go forwards from their origin.
+
+    Keyword arguments:
+    -- origin_x, origin_y: Where the ray starts.
+    -- direction_x, direction_y: The direction of the ray, must be normalised.
+    -- centre_x, centre_y: The centre of the circle.
+    -- radius: The radius of the circle.
+    """
+    offset_x = origin_x - centre_x
+    offset_y = origin_y - centre_y
+    c = offset_x * offset_x + offset_y * offset_y - radius * radius
+    if c <= 0:
+        return 0.0
+    b = offset_x * direction_x + offset_y * direction_y
+    if b > 0:
+        return None
+    discriminant = b * b - c
+    if discriminant < 0:
+        return None
+    return -b - math.sqrt(discriminant)
+
+
+def ray_to_rectangle(origin_x, origin_y, direction_x, direction_y, corners):
+    """Returns how far along a ray it first touches a rotated rectangle, 0.0 if it
+    starts inside it, or None if it never does. Rays only go forwards from their origin.
+
+    Keyword arguments:
+    -- origin_x, origin_y: Where the ray starts.
+    -- direction_x, direction_y: The direction of the ray, must be normalised.
+    -- corners: The rectangle's corners flattened into
+      (ul_x, ul_y, ur_x, ur_y, ll_x, ll_y, lr_x, lr_y) as stored in RectangleShape.
+    """
+    # Work in the rectangle's own space where the top edge and left edge are
+    # the axes and the rectangle covers 0 to 1 along each of them.
+    near = 0.0
+    far = float('inf')
+    for end in (2, 4):
+        edge_x = corners[end] - corners[0]
+        edge_y = corners[end + 1] - corners[1]
+        length_squared = edge_x * edge_x + edge_y * edge_y
+        if not length_squared:
+            return None
+        start = ((origin_x - corners[0]) * edge_x + (origin_y - corners[1]) * edge_y) / length_squared
+        speed = (direction_x * edge_x + direction_y * edge_y) / length_squared
+        if speed == 0:
+            if start < 0 or start > 1:
+                return None
+            continue
+        enter = -start / speed
+        leave = (1 - start) / speed
+        if enter > leave:
+            enter, leave = leave, enter
+        if enter > near:
+            near = enter
+        if leave < far:
+            far = leave
+        if near > far:
+            return None
+    return near
+
+
+def ray_to_point(origin_x, origin_y, direction_x, direction_y, point_x, point_y):
+    """Returns how far along a ray a point is if the ray goes through it, or
+    None if it doesn't. Rays only go forwards from their origin.
+
+    Keyword arguments:
+    -- origin_x, origin_y: Where the ray starts.
+    -- direction_x, direction_y: The direction of the ray, must be normalised.
+    -- point_x, point_y: The point.
+    """
+    offset_x = point_x - origin_x
+    offset_y = point_y - origin_y
+    along = offset_x * direction_x + offset_y * direction_y
+    if along < 0 or abs(offset_x * direction_y - offset_y * direction_x) > BOUNDS_MARGIN:
+        return None
+    return along
+
+
+def ray_to_entity(origin_x, origin_y, direction_x, direction_y, entity):
+    """Returns how far along a ray it first touches an Entity's collision shape,
+    or None if it never does.
+
+    Keyword arguments:
+    -- origin_x, origin_y: Where the ray starts.
+    -- direction_x, direction_y: The direction of the ray, must be normalised.
+    -- entity: The Entity to test against.
+    """
+    if entity.collision_type == COLLISION_TYPE_RECTANGLE:
+        return ray_to_rectangle(
+            origin_x, origin_y, direction_x, direction_y,
+            entity.collision_rectangle_calculate_shape().corners
+            )
+    elif entity.collision_type == COLLISION_TYPE_CIRCLE:
+        return ray_to_circle(
+            origin_x, origin_y, direction_x, direction_y,
+            entity.x, entity.y, entity.collision_circle_calculate_radius()
+            )
+    point = entity.collision_point_calculate_point()
+    return ray_to_point(origin_x, origin_y, direction_x, direction_y, point[0], point[1])
@@ -0,0 +1,144 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+A uniform grid spatial hash. Objects are stored in every cell that
+their axis aligned bounding box touches, so finding everything near
+a position only needs to look at a handful of cells rather than
+every object in the game.
+"""
+
+import math
+from collections import OrderedDict
+
+
+class SpatialHash(object):
+
+    def __init__(self, cell_size = 128.0):
+        """
+        Keyword arguments:
+        -- cell_size: The width and height of each grid cell in pixels.
+         Ideally this should be around the size of a typical object being
+         stored. (default 128.0)
+        """
+        self.cell_size = float(cell_size)
+        # Cell coordinate tuple to an OrderedDict of objects in that cell, used
+        # as an ordered set so query results are consistent between runs.
+        self.cells = {}
+        # Object to the (min_x, min_y, max_x, max_y) cell range it occupies
+        self.object_cells = {}
+        # Object to the bounding box it was last stored with
+        self.object_bounds = {}
+
+    def __len__(self):
+        return len(self.object_bounds)
+
+    def __contains__(self, obj):
+        return obj in self.object_bounds
+
+    def cell_range(self, bounds):
+        """Returns the range of cells that a bounding box covers as a four-part
+        tuple of (min_x, min_y, max_x, max_y) in cell coordinates.
+
+        Keyword arguments:
+        -- bounds: Bounding box given as (min_x, min_y, max_x, max_y).
+        """
+        size = self.cell_size
+        return (int(math.floor(bounds[0] / size)), int(math.floor(bounds[1] / size)),
+                int(math.floor(bounds[2] / size)), int(math.floor(bounds[3] / size)))
+
+    def update(self, obj, bounds):
+        """Inserts an object into the hash or moves it if it's already in there.
+        Objects that stay within the same cells are not moved.
+
+        Keyword arguments:
+        -- obj: The object being stored.
+        -- bounds: The object's bounding box given as (min_x, min_y, max_x, max_y).
+        """
+        self.object_bounds[obj] = bounds
+        new_range = self.cell_range(bounds)
+        old_range = self.object_cells.get(obj)
+        if old_range == new_range:
+            return
+        if not old_range is None:
+            self._remove_from_cells(obj, old_range)
+        self.object_cells[obj] = new_range
+        cells = self.cells
+        for cell_x in range(new_range[0], new_range[2] + 1):
+            for cell_y in range(new_range[1], new_range[3] + 1):
+                bucket = cells.get((cell_x, cell_y))
+                if bucket is None:
+                    bucket = cells[(cell_x, cell_y)] = OrderedDict()
+                bucket[obj] = None
+
+    def remove(self, obj):
+        """Takes an object out of the hash. Silently does nothing if the object
+        is not being stored."""
+        old_range = self.object_cells.pop(obj, None)
+        if old_range is None:
+            return
+        del self.object_bounds[obj]
+        self._remove_from_cells(obj, old_range)
+
+    def query(self, bounds):
+        """Returns a list of all objects whose bounding boxes overlap the given one.
+
+        Keyword arguments:
+        -- bounds: Bounding box to check given as (min_x, min_y, max_x, max_y).
+        """
+        found = OrderedDict()
+        cells = self.cells
+        object_bounds = self.object_bounds
+        min_x, min_y, max_x, max_y = bounds
+        cell_range = self.cell_range(bounds)
+        for cell_x in range(cell_range[0], cell_range[2] + 1):
+            for cell_y in range(cell_range[1], cell_range[3] + 1):
+                bucket = cells.get((cell_x, cell_y))
+                if not bucket:
+                    continue
+                for obj in bucket:
+                    if obj in found:
+                        continue
+                    obj_bounds = object_bounds[obj]
+                    if obj_bounds[0] <= max_x and obj_bounds[2] >= min_x \
+                            and obj_bounds[1] <= max_y and obj_bounds[3] >= min_y:
+                        found[obj] = None
+        return list(found)
+
+    def clear(self):
+        """Removes every object from the hash."""
+        self.cells = {}
+        self.object_cells = {}
+        self.object_bounds = {}
+
+    def _remove_from_cells(self, obj, cell_range):
+        cells = self.cells
+        for cell_x in range(cell_range[0], cell_range[2] + 1):
+            for cell_y in range(cell_range[1], cell_range[3] + 1):
+                bucket = cells[(cell_x, cell_y)]
+                del bucket[obj]
+                if not bucket:
+                    del cells[(cell_x, cell_y)]
@@ -0,0 +1,229 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+
+Batching of sprites for gfx engines that would otherwise make a handful of
+calls for every Entity drawn. Entities are gathered in draw order, runs of
+consecutive ones sharing a texture, blend mode and clip area are grouped
+together and the corners of every sprite's quad are worked out at once
+with NumPy so each run can be drawn with a single call.
+"""
+
+import itertools
+
+try:
+    import numpy
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+
+class SpriteRun(object):
+    """Consecutive sprites in a batch that can all be drawn in one go."""
+
+    __slots__ = ('texture', 'blend', 'clip', 'first', 'count')
+
+    def __init__(self, texture, blend, clip, first):
+        self.texture = texture
+        self.blend = blend
+        self.clip = clip
+        # Index of the first sprite in the run and how many there are
+        self.first = first
+        self.count = 0
+
+
+class SpriteBatch(object):
+
+    # Texture coordinates (left, top, right, bottom) of images that use all of their texture
+    whole_texture = (0.0, 0.0, 1.0, 1.0)
+
+    def __init__(self, plain_draw_classes = ()):
+        """
+        Keyword arguments:
+        -- plain_draw_classes: Entity classes whose draw method does nothing. Entities
+         that don't override it from one of these never have draw called. (default ())
+        """
+        self.plain_draws = set(self.draw_function(cls) for cls in plain_draw_classes)
+        # Entity classes to whether they have a draw method that needs calling
+        self.custom_draw_classes = {}
+        self.clear()
+
+    def clear(self):
+        """Empties the batch ready to collect the next frame's sprites."""
+        self.sprites = []
+        # SpriteRuns and Entities with custom draw methods, in the order they are to be drawn
+        self.steps = []
+        self.run = None
+
+    @staticmethod
+    def draw_function(cls):
+        draw = cls.draw
+        return getattr(draw, '__func__', draw)
+
+    def has_custom_draw(self, entity):
+        """Returns True if the Entity overrides draw with something that needs calling."""
+        cls = entity.__class__
+        custom = self.custom_draw_classes.get(cls)
+        if custom is None:
+            custom = self.custom_draw_classes[cls] = not self.draw_function(cls) in self.plain_draws
+        return custom
+
+    def is_sprite(self, entity):
+        """Returns True if the Entity's image is drawn as a sprite."""
+        return not (entity.normal_draw == False or not entity.image or entity.alpha <= 0.0)
+
+    def state_sorted(self, entity_list):
+        """Returns the drawing Entities from a z ordered list with those sharing a z
+        value reordered so ones with the same render state are next to each other,
+        sorted by blend mode, then clip area, then texture. The sort is stable and
+        Entities with their own draw method, or that aren't sprites, are never moved,
+        so sprites are only reordered between them.
+
+        Keyword arguments:
+        -- entity_list: The Entities in the order they would be drawn.
+        """
+        # Textures and clip areas are numbered in the order they're first seen so
+        # that keys can be compared whatever type they are
+        textures = {}
+        clips = []
+        result = []
+        segment = []
+        last_z = None
+        for entity in entity_list:
+            if not entity.drawing:
+                continue
+            z = entity.z
+            if not z == last_z:
+                self.add_sorted_segment(segment, result)
+                last_z = z
+            if self.has_custom_draw(entity) or not self.is_sprite(entity):
+                self.add_sorted_segment(segment, result)
+                result.append(entity)
+                continue
+            texture = entity.image.surfaces[entity.image_seq]
+            texture_key = textures.get(texture)
+            if texture_key is None:
+                texture_key = textures[texture] = len(textures)
+            clip = entity.clip
+            clip_key = -1
+            if not clip is None:
+                for i, seen_clip in enumerate(clips):
+                    if seen_clip == clip:
+                        clip_key = i
+                        break
+                else:
+                    clip_key = len(clips)
+                    clips.append(clip)
+            segment.append(((1 if entity.blend else 0, clip_key, texture_key), entity))
+        self.add_sorted_segment(segment, result)
+        return result
+
+    def add_sorted_segment(self, segment, result):
+        if len(segment) > 1:
+            segment.sort(key = lambda item: item[0])
+        result.extend(entity for key, entity in segment)
+        del segment[:]
+
+    def add(self, entity):
+        """Adds an Entity to the end of the batch. Its image is drawn as a sprite unless
+        it is not drawing normally, has no image or is fully transparent, and if it has
+        its own draw method that is called afterwards.
+
+        Keyword arguments:
+        -- entity: The Entity to draw.
+        """
+        image = entity.image
+        alpha = entity.alpha
+        # Same test as is_sprite, without looking the values up twice
+        if not (entity.normal_draw == False or not image or alpha <= 0.0):
+            texture = image.surfaces[entity.image_seq]
+            blend = entity.blend
+            clip = entity.clip
+            run = self.run
+            if run is None or not run.texture == texture or not run.blend == blend or not run.clip == clip:
+                run = self.run = SpriteRun(texture, blend, clip, len(self.sprites))
+                self.steps.append(run)
+            run.count += 1
+            draw_x, draw_y = entity.get_screen_draw_position()
+            centre = entity.get_centre_point()
+            colour = entity.colour
+            uvs = image.uvs
+            uv = self.whole_texture if uvs is None else uvs[entity.image_seq]
+            self.sprites.append((
+                draw_x, draw_y, centre[0], centre[1], entity.scale, entity.rotation,
+                -1.0 if entity.flip_horizontal else 1.0, -1.0 if entity.flip_vertical else 1.0,
+                image.width, image.height, colour[0], colour[1], colour[2], alpha,
+                uv[0], uv[1], uv[2], uv[3]
+                ))
+        if self.has_custom_draw(entity):
+            self.steps.append(entity)
+            self.run = None
+
+    def build(self):
+        """Returns three float32 arrays for every corner of every sprite quad in the
+        batch, four corners to a sprite going clockwise from the top left of the image -
+        screen positions (x, y), texture coordinates (u, v) and colours (r, g, b, a).
+        Sprites are transformed the same way as drawing them one at a time does, scaled
+        from their draw position then flipped and rotated about their centre point."""
+        count = len(self.sprites)
+        values = numpy.fromiter(itertools.chain.from_iterable(self.sprites), numpy.float64, count * 18)
+        (draw_x, draw_y, centre_x, centre_y, scale, rotation, flip_x, flip_y, width, height,
+         red, green, blue, alpha, uv_left, uv_top, uv_right, uv_bottom) = values.reshape(count, 18).T
+
+        # Corners relative to the centre point in image space, then flipped and scaled
+        left = (-centre_x * flip_x * scale)[:, None]
+        right = ((width - centre_x) * flip_x * scale)[:, None]
+        top = (-centre_y * flip_y * scale)[:, None]
+        bottom = ((height - centre_y) * flip_y * scale)[:, None]
+        offset_x = numpy.hstack((left, right, right, left))
+        offset_y = numpy.hstack((top, top, bottom, bottom))
+
+        # Rotated about the centre point, which is where on screen things turn around
+        pivot_x = (draw_x + centre_x * scale)[:, None]
+        pivot_y = (draw_y + centre_y * scale)[:, None]
+        positions = numpy.empty((count, 4, 2), numpy.float32)
+        if rotation.any():
+            radians = numpy.radians(rotation)
+            cos_r = numpy.cos(radians)[:, None]
+            sin_r = numpy.sin(radians)[:, None]
+            positions[:, :, 0] = pivot_x + cos_r * offset_x - sin_r * offset_y
+            positions[:, :, 1] = pivot_y + sin_r * offset_x + cos_r * offset_y
+        else:
+            positions[:, :, 0] = pivot_x + offset_x
+            positions[:, :, 1] = pivot_y + offset_y
+
+        colours = numpy.empty((count, 4, 4), numpy.float32)
+        colours[:] = numpy.column_stack((red, green, blue, alpha))[:, None, :]
+
+        # Each image's region of its texture, so sprites from an atlas show the right part
+        tex_coords = numpy.empty((count, 4, 2), numpy.float32)
+        tex_coords[:, 0::3, 0] = uv_left[:, None]
+        tex_coords[:, 1:3, 0] = uv_right[:, None]
+        tex_coords[:, 0:2, 1] = uv_top[:, None]
+        tex_coords[:, 2:4, 1] = uv_bottom[:, None]
+
+        return positions.reshape(-1, 2), tex_coords.reshape(-1, 2), colours.reshape(-1, 4)
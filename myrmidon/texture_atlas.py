@@ -0,0 +1,378 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+Packing of many images into a few large textures, known as atlases. Sprites
+whose images share an atlas can be drawn one after another without binding
+a new texture in between, each image just drawing its own rectangle of the
+atlas. Nothing here knows about graphics, each gfx engine supplies an
+AtlasBuilder subclass that loads images and creates and fills textures.
+"""
+
+import json
+
+from myrmidon.game import MyrmidonError
+
+
+# Bumped whenever the layout cache format changes so old files are ignored
+ATLAS_CACHE_VERSION = 1
+
+
+def next_power_of_two(value):
+    size = 1
+    while size < value:
+        size *= 2
+    return size
+
+
+class SkylinePacker(object):
+
+    def __init__(self, width, height, padding = 1):
+        """
+        Keyword arguments:
+        -- width: Width of the area being packed into in pixels.
+        -- height: Height of the area being packed into in pixels.
+        -- padding: Empty pixels kept between packed rectangles so neighbours don't
+         bleed into each other when the texture is filtered. (default 1)
+        """
+        self.width = width
+        self.height = height
+        self.padding = padding
+        # The top edge of everything packed so far as [x, y, width] lists going
+        # left to right, y being the first free row along that stretch
+        self.skyline = [[0, 0, width]]
+
+    def insert(self, width, height):
+        """Finds room for a rectangle, placing it as high up as possible. Returns the
+        (x, y) position of its top left corner, or None if there's no room left.
+
+        Keyword arguments:
+        -- width: Width of the rectangle in pixels.
+        -- height: Height of the rectangle in pixels.
+        """
+        skyline = self.skyline
+        best = None
+        for i, segment in enumerate(skyline):
+            x = segment[0]
+            if x + width > self.width:
+                break
+            y = self.resting_height(i, width + self.padding)
+            if y + height > self.height:
+                continue
+            if best is None or y + height < best[2] + best[3]:
+                best = (i, x, y, height)
+        if best is None:
+            return None
+        i, x, y, height = best
+        self.raise_skyline(i, x, min(width + self.padding, self.width - x), y + height + self.padding)
+        return (x, y)
+
+    def resting_height(self, index, width):
+        """Returns the highest row a rectangle starting at a skyline segment would sit
+        on, which is the lowest point of every segment underneath it."""
+        skyline = self.skyline
+        x = skyline[index][0]
+        end = min(x + width, self.width)
+        y = 0
+        while index < len(skyline) and skyline[index][0] < end:
+            y = max(y, skyline[index][1])
+            index += 1
+        return y
+
+    def raise_skyline(self, index, x, width, y):
+        skyline = self.skyline
+        end = x + width
+        # Segments now completely underneath go, a partly covered one is cut short
+        while index < len(skyline) and skyline[index][0] < end:
+            segment = skyline[index]
+            segment_end = segment[0] + segment[2]
+            if segment_end <= end:
+                del skyline[index]
+            else:
+                segment[2] = segment_end - end
+                segment[0] = end
+                break
+        skyline.insert(index, [x, y, width])
+        # Join up neighbours at the same height
+        i = max(index - 1, 0)
+        while i < len(skyline) - 1 and i <= index + 1:
+            if skyline[i][1] == skyline[i + 1][1]:
+                skyline[i][2] += skyline[i + 1][2]
+                del skyline[i + 1]
+            else:
+                i += 1
+
+
+def pack_pages(sizes, max_size = 2048, padding = 1):
+    """Packs rectangles into as few textures as possible. If they all fit in one the
+    smallest power of two sized texture they fit in is used, otherwise as many textures
+    of the maximum size as are needed. Returns a two-part tuple of a list of the (width,
+    height) of each texture and a list of the (texture_index, x, y) position of each rectangle.
+
+    Keyword arguments:
+    -- sizes: List of (width, height) of the rectangles to pack.
+    -- max_size: Largest width and height a texture can have. (default 2048)
+    -- padding: Empty pixels to keep between rectangles. (default 1)
+    """
+    if not sizes:
+        return [], []
+    for width, height in sizes:
+        if width > max_size or height > max_size:
+            raise MyrmidonError("Image of size " + str((width, height)) + " is too large to go in an atlas of size " + str(max_size))
+    # Tallest first packs a skyline most tightly
+    order = sorted(range(len(sizes)), key = lambda i: (-sizes[i][1], -sizes[i][0]))
+    area = sum((width + padding) * (height + padding) for width, height in sizes)
+    page_width = min(next_power_of_two(max(width for width, height in sizes)), max_size)
+    page_height = min(next_power_of_two(max(height for width, height in sizes)), max_size)
+    while page_width * page_height < area and (page_width < max_size or page_height < max_size):
+        if page_width <= page_height and page_width < max_size or page_height >= max_size:
+            page_width *= 2
+        else:
+            page_height *= 2
+
+    placements = [None] * len(sizes)
+    while True:
+        packer = SkylinePacker(page_width, page_height, padding)
+        for i in order:
+            position = packer.insert(*sizes[i])
+            if position is None:
+                break
+            placements[i] = (0, position[0], position[1])
+        else:
+            return [(page_width, page_height)], placements
+        if page_width >= max_size and page_height >= max_size:
+            break
+        if page_width <= page_height and page_width < max_size or page_height >= max_size:
+            page_width *= 2
+        else:
+            page_height *= 2
+
+    # Doesn't fit in one, so fill as many full size textures as it takes
+    packers = []
+    for i in order:
+        for page, packer in enumerate(packers):
+            position = packer.insert(*sizes[i])
+            if not position is None:
+                break
+        else:
+            page = len(packers)
+            packers.append(SkylinePacker(max_size, max_size, padding))
+            position = packers[page].insert(*sizes[i])
+        placements[i] = (page, position[0], position[1])
+    return [(max_size, max_size)] * len(packers), placements
+
+
+def load_layout(cache_file, sources, max_size, padding):
+    """Returns a layout saved by save_layout as a two-part tuple of the same form
+    that pack_pages returns, or None if there isn't one saved or it was made for
+    different images or settings.
+
+    Keyword arguments:
+    -- cache_file: The path of the file the layout was saved to.
+    -- sources: List of (name, width, height) of each image in the atlas. Names
+     are usually filenames, and None for images given as image data.
+    -- max_size: Largest width and height a texture can have.
+    -- padding: Empty pixels kept between images.
+    """
+    try:
+        with open(cache_file, "r") as cache:
+            saved = json.load(cache)
+        if not saved.get("version") == ATLAS_CACHE_VERSION or not saved["max_size"] == max_size \
+                or not saved["padding"] == padding or not saved["sources"] == [list(x) for x in sources]:
+            return None
+        return [tuple(x) for x in saved["pages"]], [tuple(x) for x in saved["placements"]]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_layout(cache_file, sources, max_size, padding, layout):
+    """Writes a layout made by pack_pages to a file so it can be loaded again by
+    load_layout instead of packing everything every time.
+
+    Keyword arguments:
+    -- cache_file: The path of the file to save the layout to.
+    -- sources: List of (name, width, height) of each image in the atlas.
+    -- max_size: Largest width and height a texture can have.
+    -- padding: Empty pixels kept between images.
+    -- layout: The two-part tuple returned by pack_pages.
+    """
+    with open(cache_file, "w") as cache:
+        json.dump({
+            "version" : ATLAS_CACHE_VERSION,
+            "max_size" : max_size,
+            "padding" : padding,
+            "sources" : [list(x) for x in sources],
+            "pages" : [list(x) for x in layout[0]],
+            "placements" : [list(x) for x in layout[1]],
+            }, cache)
+
+
+def frame_uvs(page_size, x, y, width, height, sequence = False, frame_width = None, frame_height = None, inset = 0.5):
+    """Returns a two-part tuple of the (width, height) of each frame of an image and
+    a list of the (left, top, right, bottom) texture coordinates of each frame.
+
+    Keyword arguments:
+    -- page_size: (width, height) of the texture the image is in.
+    -- x: Position of the left of the image in the texture in pixels.
+    -- y: Position of the top of the image in the texture in pixels.
+    -- width: Width of the image in pixels.
+    -- height: Height of the image in pixels.
+    -- sequence: If the image is a sheet of frames laid out left to right then top
+     to bottom, the same as load_image expects. (default False)
+    -- frame_width: The width of each frame if this is a sequence. (default None)
+    -- frame_height: The height of each frame if this is a sequence. Defaults to the
+     frame width, the same as load_image. (default None)
+    -- inset: How many texels the coordinates of each frame of a sequence are moved
+     in by on every side. Frames are packed against each other with no padding, so
+     without this filtering at their edges picks up the neighbouring frames. (default 0.5)
+    """
+    page_width = float(page_size[0])
+    page_height = float(page_size[1])
+    if not sequence:
+        return (width, height), [(x / page_width, y / page_height, (x + width) / page_width, (y + height) / page_height)]
+    if frame_width is None:
+        frame_width = width
+    if frame_height is None:
+        frame_height = frame_width
+    uvs = []
+    for row in range(height // frame_height):
+        top = y + row * frame_height
+        for column in range(width // frame_width):
+            left = x + column * frame_width
+            uvs.append(((left + inset) / page_width, (top + inset) / page_height,
+                        (left + frame_width - inset) / page_width, (top + frame_height - inset) / page_height))
+    return (frame_width, frame_height), uvs
+
+
+class AtlasBuilder(object):
+    """Builds atlases for a gfx engine. Engines subclass this, filling in the methods
+    that load images and create and fill textures, and use it both for Game.load_atlas
+    and to put images in shared textures as they're loaded when Game.auto_atlas is on."""
+
+    def __init__(self, page_size = 2048, padding = 1):
+        """
+        Keyword arguments:
+        -- page_size: Width and height of the textures images loaded one at a time
+         are packed into. (default 2048)
+        -- padding: Empty pixels kept between images. (default 1)
+        """
+        self.page_size = page_size
+        self.padding = padding
+        # (texture, SkylinePacker) of each texture images loaded one at a time are put in
+        self.auto_pages = []
+
+    def load_source(self, image):
+        """Returns a three-part tuple of (source, width, height) for an image filename
+        or already loaded image data, where source is whatever copy_to_page takes."""
+        raise NotImplementedError
+
+    def create_page(self, width, height):
+        """Returns a new empty texture of the given size."""
+        raise NotImplementedError
+
+    def copy_to_page(self, texture, source, x, y):
+        """Copies an image returned by load_source into a texture at a position."""
+        raise NotImplementedError
+
+    def make_image(self, texture, uvs, width, height, entry):
+        """Returns an Image object that draws regions of an atlas texture.
+
+        Keyword arguments:
+        -- texture: The texture the image is in.
+        -- uvs: List of (left, top, right, bottom) texture coordinates of each frame.
+        -- width: Width of each frame in pixels.
+        -- height: Height of each frame in pixels.
+        -- entry: Dict of the load_image arguments the image was given with.
+        """
+        raise NotImplementedError
+
+    def atlas_entry(self, image):
+        """Returns a dict of load_image arguments from an item passed to Game.load_atlas."""
+        if isinstance(image, dict):
+            if not "image" in image:
+                raise MyrmidonError("Atlas entries given as a dict need an 'image' value.")
+            entry = {"sequence" : False, "width" : None, "height" : None}
+            entry.update(image)
+            return entry
+        return {"image" : image, "sequence" : False, "width" : None, "height" : None}
+
+    def build(self, images, max_size = 2048, padding = 1, cache_file = None):
+        """Packs images into as few textures as possible and returns a list of Image
+        objects for them, in the same order they were given in.
+
+        Keyword arguments:
+        -- images: List of image filenames or image data, or dicts of the arguments
+         that would be given to load_image for each.
+        -- max_size: Largest width and height of each texture. (default 2048)
+        -- padding: Empty pixels kept between images. (default 1)
+        -- cache_file: Path of a file to save the layout to, and load it from if
+         it's already there and was made for the same images. (default None)
+        """
+        entries = [self.atlas_entry(image) for image in images]
+        loaded = [self.load_source(entry["image"]) for entry in entries]
+        sources = [(entry["image"] if isinstance(entry["image"], str) else None, width, height)
+                   for entry, (source, width, height) in zip(entries, loaded)]
+        layout = None
+        if not cache_file is None:
+            layout = load_layout(cache_file, sources, max_size, padding)
+        if layout is None:
+            layout = pack_pages([(width, height) for name, width, height in sources], max_size, padding)
+            if not cache_file is None:
+                save_layout(cache_file, sources, max_size, padding, layout)
+
+        page_sizes, placements = layout
+        pages = [self.create_page(width, height) for width, height in page_sizes]
+        result = []
+        for entry, (source, width, height), (page, x, y) in zip(entries, loaded, placements):
+            self.copy_to_page(pages[page], source, x, y)
+            frame_size, uvs = frame_uvs(
+                page_sizes[page], x, y, width, height, entry["sequence"], entry["width"], entry["height"])
+            result.append(self.make_image(pages[page], uvs, frame_size[0], frame_size[1], entry))
+        return result
+
+    def auto_place(self, source, width, height):
+        """Puts a single image in the first shared texture with room for it, creating
+        a new texture if none have any. Returns a three-part tuple of (texture, x, y),
+        or None if the image is too large to go in one.
+
+        Keyword arguments:
+        -- source: The image, as returned by load_source.
+        -- width: Width of the image in pixels.
+        -- height: Height of the image in pixels.
+        """
+        if width > self.page_size or height > self.page_size:
+            return None
+        for texture, packer in self.auto_pages:
+            position = packer.insert(width, height)
+            if not position is None:
+                break
+        else:
+            texture = self.create_page(self.page_size, self.page_size)
+            packer = SkylinePacker(self.page_size, self.page_size, self.padding)
+            self.auto_pages.append((texture, packer))
+            position = packer.insert(width, height)
+        self.copy_to_page(texture, source, position[0], position[1])
+        return (texture, position[0], position[1])
@@ -0,0 +1,202 @@
+"""
+Myrmidon
+Copyright (c) 2010 Fiona Burrows
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+
+---------------------
+
+A hierarchical timer wheel, used for scheduling functions to be called
+at some point in the future. Timers are dropped into a slot depending on
+how far away their deadline is, and far away timers are cascaded down into
+finer grained slots as time catches up with them. Adding, cancelling and
+firing a timer take the same time no matter how many are pending.
+"""
+
+from collections import OrderedDict
+
+
+class TimerHandle(object):
+    """Returned when scheduling a timer, can be used to cancel it."""
+
+    def __init__(self, wheel, callback, deadline, interval = None):
+        self.wheel = wheel
+        self.callback = callback
+        self.deadline = deadline
+        # Repeating timers are rescheduled this far into the future each time they fire
+        self.interval = interval
+        self.cancelled = False
+        # The slot this handle is currently stored in, an OrderedDict used as an
+        # ordered set so timers due together fire in the order they were added,
+        # and the level of the wheel that it's in, None when in the overflow list
+        self.slot = None
+        self.level = None
+
+    @property
+    def active(self):
+        """True if this timer is still waiting to be fired."""
+        return not self.slot is None
+
+    def cancel(self):
+        """Stops this timer from ever being fired. Does nothing if it has
+        already been cancelled or has fired."""
+        self.cancelled = True
+        self.wheel.remove(self)
+
+
+class TimerWheel(object):
+
+    def __init__(self, current = 0, slot_bits = 8, levels = 4):
+        """
+        Keyword arguments:
+        -- current: The time the wheel starts at. Time is an integer in
+         whatever unit the wheel is being advanced in. (default 0)
+        -- slot_bits: Each level of the wheel has 2 ** slot_bits slots. (default 8)
+        -- levels: How many levels the wheel has. Timers further away than
+         2 ** (slot_bits * levels) are kept in an overflow list. (default 4)
+        """
+        self.current = current
+        self.slot_bits = slot_bits
+        self.slot_mask = (1 << slot_bits) - 1
+        self.levels = [[OrderedDict() for i in range(1 << slot_bits)] for level in range(levels)]
+        self.overflow = OrderedDict()
+        self.pending = 0
+        # How many timers are in the lowest level, lets us skip past empty slots
+        self.pending_level_0 = 0
+
+    def __len__(self):
+        return self.pending
+
+    def add(self, callback, deadline, interval = None):
+        """Schedules a function to be called when the wheel reaches a
+        particular time and returns a TimerHandle for it. Deadlines that
+        have already passed will be fired next time the wheel is advanced.
+
+        Keyword arguments:
+        -- callback: The function to call, it is passed no arguments.
+        -- deadline: The time to call the function at.
+        -- interval: If given the timer will repeat, being called again
+         this long after each time it fires. (default None)
+        """
+        handle = TimerHandle(self, callback, deadline, interval)
+        self._insert(handle)
+        self.pending += 1
+        return handle
+
+    def remove(self, handle):
+        """Takes a timer off the wheel without firing it."""
+        if handle.slot is None:
+            return
+        del handle.slot[handle]
+        if handle.level == 0:
+            self.pending_level_0 -= 1
+        handle.slot = None
+        self.pending -= 1
+
+    def advance(self, to_time):
+        """Moves the wheel forward to the given time, firing every timer
+        whose deadline has been reached along the way in deadline order.
+
+        Keyword arguments:
+        -- to_time: The time to advance to.
+        """
+        level_0 = self.levels[0]
+        mask = self.slot_mask
+        while self.current < to_time:
+            if not self.pending:
+                self.current = to_time
+                return
+            if not self.pending_level_0:
+                # Nothing can fire before the next cascade so jump straight to it
+                self.current = min(to_time - 1, self.current | mask)
+            self.current += 1
+            index = self.current & mask
+            if not index:
+                self._cascade()
+            slot = level_0[index]
+            if not slot:
+                continue
+            level_0[index] = OrderedDict()
+            for handle in slot:
+                handle.slot = None
+                self.pending -= 1
+                self.pending_level_0 -= 1
+            for handle in slot:
+                if handle.cancelled:
+                    continue
+                handle.callback()
+                if not handle.interval is None and not handle.cancelled and handle.slot is None:
+                    handle.deadline += max(1, handle.interval)
+                    self._insert(handle)
+                    self.pending += 1
+
+    def clear(self):
+        """Removes every pending timer."""
+        for level in self.levels:
+            for slot in level:
+                for handle in slot:
+                    handle.slot = None
+                slot.clear()
+        for handle in self.overflow:
+            handle.slot = None
+        self.overflow.clear()
+        self.pending = 0
+        self.pending_level_0 = 0
+
+    def _insert(self, handle, cascading = False):
+        # Timers can only be added for the next tick onwards, unless they're
+        # being cascaded down before the current tick's slot is fired.
+        deadline = max(handle.deadline, self.current if cascading else self.current + 1)
+        delta = deadline - self.current
+        bits = self.slot_bits
+        for level_num, level in enumerate(self.levels):
+            if delta < 1 << (bits * (level_num + 1)):
+                slot = level[(deadline >> (bits * level_num)) & self.slot_mask]
+                break
+        else:
+            level_num = None
+            slot = self.overflow
+        if level_num == 0:
+            self.pending_level_0 += 1
+        slot[handle] = None
+        handle.slot = slot
+        handle.level = level_num
+
+    def _cascade(self):
+        # Called when the lowest level wraps around. Timers in the next level
+        # up that are now close enough are moved down, and so on up the levels.
+        bits = self.slot_bits
+        for level_num in range(1, len(self.levels)):
+            index = (self.current >> (bits * level_num)) & self.slot_mask
+            self._reinsert(self.levels[level_num], index)
+            if index:
+                return
+        slot = self.overflow
+        self.overflow = OrderedDict()
+        for handle in slot:
+            self._insert(handle, True)
+
+    def _reinsert(self, level, index):
+        slot = level[index]
+        level[index] = OrderedDict()
+        for handle in slot:
+            self._insert(handle, True)
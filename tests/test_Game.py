@@ -6,21 +6,34 @@ except ImportError:
 import importlib
 import myrmidon.game
 import myrmidon.entity
+import myrmidon.timer_wheel
+import myrmidon.light_entity
+import myrmidon.particles
+
+try:
+    reload
+except NameError:
+    from importlib import reload
 
 
 Game = myrmidon.game.Game
 Entity = myrmidon.entity.Entity
+LightEntity = myrmidon.light_entity.LightEntity
 
 
 def reimport():
-    global Game, Entity
+    global Game, Entity, LightEntity
     reload(myrmidon.game)
     Game = myrmidon.game.Game
     reload(myrmidon.entity)
     Entity = myrmidon.entity.Entity
+    reload(myrmidon.light_entity)
+    LightEntity = myrmidon.light_entity.LightEntity
+    reload(myrmidon.particles)
 
 
-class EntityListTest(unittest.TestCase):
+class MockEngineTestCase(unittest.TestCase):
+    """Base for tests that need a running game using mocked engines."""
 
     # methods to declare new entity classes using the current version of Entity
     def declare_EntMain(self):
@@ -76,7 +89,24 @@ class EntityListTest(unittest.TestCase):
     def tearDownClass(cls):
         # clear class-level state again, undoing all the changes we made
         reimport()
-        
+
+
+class HeadlessTestCase(unittest.TestCase):
+    """Base for tests that step a headless game with Game.step. The first Entity
+    has been created, so the game has started, and is kept as self.first."""
+
+    def setUp(self):
+        reimport()
+        Game.headless = True
+        self.first = Entity()
+
+    @classmethod
+    def tearDownClass(cls):
+        reimport()
+
+
+class EntityListTest(MockEngineTestCase):
+
     def test_get_entities_returns_entities_of_type(self):
         EntA = self.declare_EntA()
         EntB = self.declare_EntB()
@@ -122,6 +152,47 @@ class EntityListTest(unittest.TestCase):
         self.assertFalse(b in result)
         self.assertTrue(c in result)
         
+    def test_get_entities_named_type_does_not_match_subclasses(self):
+        EntA = self.declare_EntA()
+        class EntC(EntA):
+            pass
+        a = EntA()
+        c = EntC()
+        self.assertEqual([a], Game.get_entities('EntA'))
+        self.assertEqual([a, c], Game.get_entities(EntA))
+
+    def test_get_entities_does_not_return_removed_entities(self):
+        EntA = self.declare_EntA()
+        a = EntA()
+        b = EntA()
+        a.destroy()
+        Game.app_loop_callback(0)
+        self.assertEqual([b], Game.get_entities(EntA))
+        self.assertEqual([], Game.get_entities('EntB'))
+
+    def test_destroyed_entities_are_not_alive_and_removed_at_end_of_frame(self):
+        EntA = self.declare_EntA()
+        a = EntA()
+        b = EntA()
+        self.assertTrue(a.is_alive())
+        a.destroy()
+        self.assertFalse(a.is_alive())
+        self.assertTrue(a in Game.entity_list)
+        Game.app_loop_callback(0)
+        self.assertFalse(a in Game.entity_list)
+        self.assertFalse(a in Game.entity_draw_list)
+        self.assertTrue(b in Game.entity_list)
+        self.assertTrue(b.is_alive())
+
+    def test_destroying_twice_only_exits_once(self):
+        EntA = self.declare_EntA()
+        a = EntA()
+        a.on_exit = mock.Mock()
+        a.destroy()
+        a.destroy()
+        self.assertEqual(1, a.on_exit.call_count)
+        self.assertEqual([a], Game.entities_to_remove)
+
     def test_get_entities_returns_entities_with_descendants(self):
     
         class EntRoot(Entity):
@@ -151,6 +222,2011 @@ class EntityListTest(unittest.TestCase):
         self.assertFalse(a in result)
    
     
+class CollideQueryTest(MockEngineTestCase):
+
+    def declare_Box(self):
+        class Box(Entity):
+            collision_on = True
+            collision_rectangle_width = 10
+            collision_rectangle_height = 10
+            def execute(self, x, y):
+                self.x = x
+                self.y = y
+                while True:
+                    yield
+        return Box
+
+    def test_returns_overlapping_entities_only(self):
+        Box = self.declare_Box()
+        a = Box(0, 0)
+        b = Box(5, 5)
+        c = Box(500, 500)
+        self.assertEqual([b], Game.collide_query(a))
+
+    def test_filters_by_target_class(self):
+        Box = self.declare_Box()
+        class OtherBox(Box):
+            pass
+        a = Box(0, 0)
+        b = Box(5, 5)
+        c = OtherBox(2, 2)
+        self.assertEqual([c], Game.collide_query(a, OtherBox))
+        self.assertEqual([c], Game.collide_query(a, 'OtherBox'))
+
+    def test_finds_entities_after_they_move(self):
+        Box = self.declare_Box()
+        a = Box(0, 0)
+        b = Box(500, 500)
+        self.assertEqual([], Game.collide_query(a))
+        b.x, b.y = 3, 3
+        self.assertEqual([b], Game.collide_query(a))
+        b.x = 1000
+        self.assertEqual([], Game.collide_query(a))
+
+    def test_ignores_entities_with_collision_off(self):
+        Box = self.declare_Box()
+        a = Box(0, 0)
+        b = Box(5, 5)
+        b.collision_on = False
+        b.reset_collision_model()
+        self.assertEqual([], Game.collide_query(a))
+
+    def test_collide_with_broadphase_matches_brute_force(self):
+        Box = self.declare_Box()
+        a = Box(0, 0)
+        boxes = [Box(x * 7, 3) for x in range(20)]
+        hit = a.collide_with(boxes, broadphase = True)
+        self.assertTrue(hit.result)
+        self.assertTrue(a.collide_with(hit.entity).result)
+        a.x = -1000
+        self.assertFalse(a.collide_with(boxes, broadphase = True).result)
+        self.assertFalse(a.collide_with(Box, broadphase = True).result)
+
+    def test_finds_circles_touching_rectangle_hit_area(self):
+        Box = self.declare_Box()
+        class Ball(Entity):
+            collision_on = True
+            collision_type = "circle"
+            collision_circle_radius = 2
+            def execute(self, x, y):
+                self.x = x
+                self.y = y
+                while True:
+                    yield
+        box = Box(0, 0)
+        ball = Ball(-6, 0)
+        self.assertTrue(ball.collide_with(box).result)
+        self.assertTrue(ball.collide_with([box], broadphase = True).result)
+        self.assertEqual([box], Game.collide_query(ball))
+        self.assertEqual([ball], Game.collide_query(box))
+
+    def test_destroyed_entities_are_removed_from_hash(self):
+        Box = self.declare_Box()
+        a = Box(0, 0)
+        b = Box(5, 5)
+        self.assertEqual([b], Game.collide_query(a))
+        b.destroy()
+        Game.app_loop_callback(0)
+        self.assertEqual([], Game.collide_query(a))
+
+
+class FixedTimestepTest(MockEngineTestCase):
+
+    def declare_Mover(self):
+        class Mover(Entity):
+            ticks = 0
+            def execute(self):
+                while True:
+                    self.ticks += 1
+                    self.x += 10.0
+                    yield
+        return Mover
+
+    def setUp(self):
+        super(FixedTimestepTest, self).setUp()
+        Game.fixed_timestep = True
+        Game.fixed_timestep_fps = 10
+
+    def test_runs_ticks_for_elapsed_time(self):
+        mover = self.declare_Mover()()
+        mover.ticks = 0
+        Game.app_loop_callback(0.25)
+        self.assertEqual(2, mover.ticks)
+        self.assertAlmostEqual(0.1, Game.delta_time)
+        self.assertAlmostEqual(0.5, Game.interpolation_alpha)
+
+    def test_runs_no_ticks_when_not_enough_time_passed(self):
+        mover = self.declare_Mover()()
+        mover.ticks = 0
+        Game.app_loop_callback(0.05)
+        self.assertEqual(0, mover.ticks)
+
+    def test_clamps_ticks_per_frame_and_drops_backlog(self):
+        Game.fixed_timestep_max_ticks = 3
+        mover = self.declare_Mover()()
+        mover.ticks = 0
+        Game.app_loop_callback(10.0)
+        self.assertEqual(3, mover.ticks)
+        Game.app_loop_callback(0.0)
+        self.assertEqual(3, mover.ticks)
+
+    def test_draws_at_interpolated_position(self):
+        mover = self.declare_Mover()()
+        mover.x = 0.0
+        Game.app_loop_callback(0.15)
+        self.assertEqual(10.0, mover.x)
+        x, y = mover.get_interpolated_position()
+        self.assertAlmostEqual(5.0, x)
+        mover.reset_interpolation()
+        self.assertEqual((10.0, 0.0), mover.get_interpolated_position())
+
+    def test_variable_timestep_runs_one_tick_per_frame(self):
+        Game.fixed_timestep = False
+        mover = self.declare_Mover()()
+        mover.ticks = 0
+        Game.app_loop_callback(0.25)
+        self.assertEqual(1, mover.ticks)
+        self.assertEqual(0.25, Game.delta_time)
+
+
+class HeadlessStepTest(HeadlessTestCase):
+
+    def setUp(self):
+        # Tests here start the game themselves
+        reimport()
+        Game.headless = True
+
+    def declare_Counter(self):
+        class Counter(Entity):
+            ticks = 0
+            def execute(self):
+                while True:
+                    self.ticks += 1
+                    yield
+        return Counter
+
+    def test_uses_dummy_engines(self):
+        from myrmidon.backend_dummy import MyrmidonWindowDummy, MyrmidonGfxDummy
+        self.declare_Counter()()
+        self.assertIsInstance(Game.engine['window'], MyrmidonWindowDummy)
+        self.assertIsInstance(Game.engine['gfx'], MyrmidonGfxDummy)
+
+    def test_step_runs_requested_ticks(self):
+        counter = self.declare_Counter()()
+        counter.ticks = 0
+        Game.step(100)
+        self.assertEqual(100, counter.ticks)
+        self.assertEqual(100, Game.current_frame)
+
+    def test_step_removes_destroyed_entities(self):
+        Counter = self.declare_Counter()
+        Counter()
+        other = Counter()
+        other.destroy()
+        Game.step()
+        self.assertFalse(other in Game.entity_list)
+
+    def test_step_before_start_raises(self):
+        self.assertRaises(myrmidon.game.MyrmidonError, Game.step)
+
+    def test_step_only_stores_previous_positions_when_drawing(self):
+        self.declare_Counter()()
+        with mock.patch.object(Game, 'interpolation_store_previous') as store_previous:
+            Game.step(3)
+            self.assertEqual(0, store_previous.call_count)
+            Game.fixed_timestep = True
+            Game.step(3)
+            self.assertEqual(0, store_previous.call_count)
+            Game.headless = False
+            Game.step(3)
+            self.assertEqual(3, store_previous.call_count)
+
+
+class CallInFutureTest(HeadlessTestCase):
+
+    def setUp(self):
+        super(CallInFutureTest, self).setUp()
+        self.calls = []
+
+    def test_calls_function_after_frames(self):
+        Game.call_in_future(lambda: self.calls.append(Game.current_frame), 3)
+        Game.step(5)
+        self.assertEqual([3], self.calls)
+
+    def test_cancelled_function_is_not_called(self):
+        handle = Game.call_in_future(lambda: self.calls.append(Game.current_frame), 3)
+        Game.step(1)
+        handle.cancel()
+        Game.step(5)
+        self.assertEqual([], self.calls)
+        self.assertFalse(handle.active)
+
+    def test_repeating_function_called_until_cancelled(self):
+        handle = Game.call_in_future(lambda: self.calls.append(Game.current_frame), 2, repeat = True)
+        Game.step(7)
+        handle.cancel()
+        Game.step(4)
+        self.assertEqual([2, 4, 6], self.calls)
+
+    def test_far_future_timers_fire_on_time(self):
+        wheel = myrmidon.timer_wheel.TimerWheel()
+        fired = []
+        for deadline in (1, 255, 256, 257, 70000, 16777217, 5000000000):
+            wheel.add(lambda deadline = deadline: fired.append((deadline, wheel.current)), deadline)
+        wheel.advance(16777300)
+        self.assertEqual([(1, 1), (255, 255), (256, 256), (257, 257), (70000, 70000), (16777217, 16777217)], fired)
+        self.assertEqual(1, len(wheel))
+
+    def test_calls_function_after_seconds(self):
+        now = [1000]
+        with mock.patch.object(Game, 'timer_milliseconds', classmethod(lambda cls: now[0])):
+            Game.call_in_seconds(lambda: self.calls.append(now[0]), 0.5)
+            Game.step()
+            now[0] = 1499
+            Game.step()
+            now[0] = 1520
+            Game.step()
+            Game.step()
+        self.assertEqual([1520], self.calls)
+
+    def test_seconds_ignore_system_clock_changes(self):
+        import time
+        Game.call_in_seconds(lambda: self.calls.append(True), 60)
+        with mock.patch.object(time, 'time', lambda: 4000000000.0):
+            Game.step()
+        self.assertEqual([], self.calls)
+
+
+class ActiveSetTest(HeadlessTestCase):
+
+    def setUp(self):
+        super(ActiveSetTest, self).setUp()
+        self.log = []
+
+    def declare_Sleeper(self):
+        log = self.log
+        class Sleeper(Entity):
+            def execute(self, frames):
+                while True:
+                    log.append((self, Game.current_frame))
+                    yield self.sleep(frames)
+        return Sleeper
+
+    def test_sleeping_entity_resumes_on_correct_frame(self):
+        sleeper = self.declare_Sleeper()(3)
+        Game.step(10)
+        self.assertEqual([0, 3, 7], [frame for entity, frame in self.log])
+
+    def test_sleeping_entity_is_not_in_active_list(self):
+        sleeper = self.declare_Sleeper()(3)
+        Game.step(2)
+        self.assertFalse(sleeper in Game.entity_priority_buckets.get(0, []))
+        self.assertTrue(sleeper in Game.entity_list)
+
+    def test_stopped_entity_is_not_iterated(self):
+        sleeper = self.declare_Sleeper()(0)
+        sleeper.stop_executing()
+        with mock.patch.object(type(sleeper), '_iterate_generator') as iterate:
+            Game.step(5)
+        self.assertFalse(iterate.called)
+        sleeper.start_executing()
+        Game.step(2)
+        self.assertEqual([0, 5, 6], [frame for entity, frame in self.log])
+
+    def test_stopping_while_asleep_keeps_remaining_sleep(self):
+        sleeper = self.declare_Sleeper()(3)
+        Game.step(2)
+        sleeper.stop_executing()
+        Game.step(5)
+        sleeper.start_executing()
+        Game.step(5)
+        self.assertEqual([0, 8], [frame for entity, frame in self.log])
+
+    def test_woken_entities_keep_priority_order(self):
+        Sleeper = self.declare_Sleeper()
+        low = Sleeper(1)
+        high = Sleeper(1)
+        high.priority = 10
+        mid = Sleeper(2)
+        mid.priority = 5
+        Game.step(6)
+        self.assertEqual(
+            [(low, 0), (high, 0), (mid, 0), (high, 1), (low, 1), (mid, 2),
+             (high, 3), (low, 3), (high, 5), (mid, 5), (low, 5)],
+            self.log
+            )
+
+
+class PriorityOrderTest(HeadlessTestCase):
+
+    def setUp(self):
+        super(PriorityOrderTest, self).setUp()
+        self.log = []
+
+    def declare_Logger(self):
+        log = self.log
+        class Logger(Entity):
+            def execute(self, name, priority = 0):
+                self.name = name
+                self.priority = priority
+                while True:
+                    yield
+                    log.append(self.name)
+        return Logger
+
+    def test_executes_in_priority_then_creation_order(self):
+        Logger = self.declare_Logger()
+        Logger('a')
+        Logger('b', 5)
+        Logger('c')
+        Logger('d', -1)
+        Logger('e', 5)
+        Game.step()
+        self.assertEqual(['b', 'e', 'a', 'c', 'd'], self.log)
+
+    def test_changing_priority_moves_entity_next_frame(self):
+        Logger = self.declare_Logger()
+        a = Logger('a')
+        Logger('b')
+        Logger('c')
+        Game.step()
+        a.priority = -1
+        Game.step()
+        self.assertEqual(1, Game.frame_stats['priority_moves'])
+        a.priority = 0
+        Game.step()
+        self.assertEqual(['a', 'b', 'c', 'b', 'c', 'a', 'a', 'b', 'c'], self.log)
+
+    def test_registering_does_not_move_entities(self):
+        Logger = self.declare_Logger()
+        for i in range(10):
+            Logger(i)
+        Game.step()
+        self.assertEqual(0, Game.frame_stats['priority_moves'])
+        self.assertEqual(0, Game.frame_stats['priority_buckets_added'])
+
+    def test_entities_created_mid_frame_run_that_frame(self):
+        Logger = self.declare_Logger()
+        log = self.log
+        class Spawner(Entity):
+            _priority = 5
+            def execute(self):
+                yield
+                # Priorities given as class defaults so they start in the right bucket
+                for name, priority in (('existing', 0), ('new_lower', -3), ('new_higher', 10), ('same', 5)):
+                    entity_class = type(name, (Logger,), {'_priority' : priority})
+                    entity_class(name, priority)
+                log.append('spawner')
+                while True:
+                    yield
+        Logger('a', 0)
+        Spawner()
+        Game.step()
+        # Ones in buckets still to come run in them, ones in buckets already run go last
+        self.assertEqual(['spawner', 'same', 'a', 'existing', 'new_lower', 'new_higher'], self.log)
+        del self.log[:]
+        Game.step()
+        self.assertEqual(['new_higher', 'same', 'a', 'existing', 'new_lower'], self.log)
+
+    def test_entities_created_by_late_entities_run_that_frame(self):
+        log = self.log
+        class Spawner(Entity):
+            def execute(self, name, children):
+                yield
+                log.append(name)
+                if children:
+                    Spawner(name + '+', children - 1)
+                while True:
+                    yield
+                    log.append(name)
+        class LowSpawner(Spawner):
+            _priority = -5
+        LowSpawner('s', 2)
+        Game.step()
+        self.assertEqual(['s', 's+', 's++'], self.log)
+        del self.log[:]
+        Game.step()
+        self.assertEqual(['s+', 's++', 's'], self.log)
+
+    def test_empty_buckets_are_removed(self):
+        Logger = self.declare_Logger()
+        a = Logger('a', 3)
+        Game.step()
+        self.assertEqual([3, 0], Game.entity_priority_order)
+        a.destroy()
+        Game.step(2)
+        self.assertEqual([0], Game.entity_priority_order)
+
+
+class ProfilerTest(HeadlessTestCase):
+
+    def declare_Worker(self):
+        class Worker(Entity):
+            def execute(self):
+                while True:
+                    yield
+                    self.switch_state("resting")
+            def resting(self):
+                while True:
+                    yield
+        return Worker
+
+    def test_counts_calls_per_class_and_state(self):
+        Worker = self.declare_Worker()
+        Worker()
+        Worker()
+        Game.start_profiler()
+        Game.step(3)
+        stats = Game.profiler.get_stats(Worker)
+        self.assertEqual([('Worker', 'execute', 2), ('Worker', 'resting', 4)],
+                         sorted((entry['class'], entry['state'], entry['calls']) for entry in stats))
+        self.assertEqual(3, Game.profiler.frames_sampled)
+
+    def test_sampling_only_profiles_some_frames(self):
+        self.declare_Worker()()
+        Game.start_profiler(sample_every = 2)
+        Game.step(6)
+        self.assertEqual(3, Game.profiler.frames_sampled)
+        self.assertEqual(3, sum(entry['calls'] for entry in Game.profiler.get_stats('Worker')))
+
+    def test_reports(self):
+        import json
+        self.declare_Worker()()
+        Game.start_profiler()
+        Game.step(2)
+        profiler = Game.stop_profiler()
+        self.assertIsNone(Game.profiler)
+        report = json.loads(profiler.to_json())
+        self.assertEqual(2, report['frames_sampled'])
+        self.assertEqual(2, sum(entry['calls'] for entry in report['entries'] if entry['class'] == 'Worker'))
+        table = profiler.to_table()
+        self.assertTrue("Worker" in table)
+        self.assertTrue("2 frames sampled" in table)
+
+
+class TimelineTest(MockEngineTestCase):
+
+    def test_records_every_phase_of_a_frame(self):
+        Game.start_timeline()
+        Game.app_loop_callback(0.0)
+        frames = Game.timeline.get_frames()
+        self.assertEqual(1, len(frames))
+        self.assertEqual(
+            ["window_tick", "registration", "priority_update", "input", "entity_execution",
+             "spawn_queue", "collision_pass", "scheduled_callbacks", "removal", "gfx_pre", "gfx_draw", "gfx_post",
+             "clock_wait"],
+            [phase for phase, duration in frames[0]['phases']]
+            )
+        self.assertAlmostEqual(frames[0]['duration'],
+                               sum(duration for phase, duration in frames[0]['phases']))
+
+    def test_keeps_only_recent_frames(self):
+        Game.start_timeline(max_frames = 3)
+        for i in range(5):
+            Game.app_loop_callback(0.0)
+        self.assertEqual([3, 4, 5], [frame['frame'] for frame in Game.timeline.get_frames()])
+
+    def test_exports_chrome_trace(self):
+        import json
+        Game.start_timeline()
+        Game.app_loop_callback(0.0)
+        trace = json.loads(Game.stop_timeline().to_chrome_trace())
+        self.assertIsNone(Game.timeline)
+        self.assertEqual(14, len(trace['traceEvents']))
+        self.assertTrue(all(event['ph'] == "X" for event in trace['traceEvents']))
+        self.assertEqual("frame 1", trace['traceEvents'][0]['name'])
+
+
+class EntityPoolTest(HeadlessTestCase):
+
+    def declare_Shot(self, pooled = True):
+        class Shot(Entity):
+            def execute(self, speed):
+                self.speed = speed
+                self.ticks = 0
+                while True:
+                    self.ticks += 1
+                    self.x += self.speed
+                    yield
+        Shot.pooled = pooled
+        return Shot
+
+    def test_destroyed_entity_is_recycled(self):
+        Shot = self.declare_Shot()
+        shot = Shot(5)
+        shot.z = 10
+        Game.step()
+        shot.destroy()
+        Game.step()
+        self.assertFalse(shot.is_alive())
+        recycled = Shot(2)
+        self.assertTrue(recycled is shot)
+        self.assertTrue(recycled.is_alive())
+        self.assertEqual(1, Game.frame_stats['entities_recycled'])
+        self.assertEqual(0, recycled.z)
+        self.assertEqual(2, recycled.speed)
+        self.assertEqual(1, recycled.ticks)
+        self.assertTrue(recycled.drawing)
+
+    def test_recycled_entity_executes_once_per_frame(self):
+        Shot = self.declare_Shot()
+        shot = Shot(1)
+        shot.destroy()
+        Game.step()
+        recycled = Shot(1)
+        Game.step(3)
+        self.assertEqual(4, recycled.ticks)
+        self.assertEqual(1, Game.entity_list.count(recycled))
+        self.assertEqual(1, Game.entity_draw_list.count(recycled))
+
+    def test_pooled_entities_wait_hidden_and_are_not_found(self):
+        Shot = self.declare_Shot()
+        shot = Shot(1)
+        shot.destroy()
+        Game.step()
+        self.assertFalse(shot.drawing)
+        self.assertEqual([], Game.get_entities(Shot))
+        shot.destroy()
+        self.assertEqual([], Game.entities_to_remove)
+
+    def test_pooled_entities_are_hidden_through_the_gfx_engine(self):
+        Shot = self.declare_Shot()
+        shot = Shot(1)
+        shot.destroy()
+        with mock.patch.object(Game.engine['gfx'], 'alter_display') as alter_display:
+            Game.step()
+            alter_display.assert_called_once_with(shot, False)
+            alter_display.reset_mock()
+            self.assertTrue(Shot(1) is shot)
+            alter_display.assert_called_once_with(shot, True)
+
+    def test_pooled_entities_are_not_collided_with(self):
+        Shot = self.declare_Shot()
+        Shot.collision_on = True
+        shot = Shot(0)
+        shot.destroy()
+        Game.step()
+        class Box(Entity):
+            collision_on = True
+            collision_rectangle_width = 10
+            collision_rectangle_height = 10
+            def execute(self):
+                while True:
+                    yield
+        box = Box()
+        self.assertEqual([], Game.collide_query(box))
+        self.assertEqual(None, Game.raycast((-50, 0), (1, 0), 100, exclude = box))
+
+    def test_pool_limit(self):
+        Shot = self.declare_Shot()
+        Shot.pool_limit = 1
+        shots = [Shot(1), Shot(1)]
+        for shot in shots:
+            shot.destroy()
+        Game.step()
+        self.assertEqual([shots[0]], Game.entity_pools[Shot])
+        self.assertFalse(shots[1] in Game.entity_list)
+
+    def test_unpooled_entities_are_not_recycled(self):
+        Shot = self.declare_Shot(pooled = False)
+        shot = Shot(1)
+        shot.destroy()
+        Game.step()
+        self.assertFalse(Shot(1) is shot)
+
+
+class SpawnTest(MockEngineTestCase):
+
+    def declare_Spawned(self):
+        class Spawned(Entity):
+            def execute(self, value = None):
+                self.value = value
+                while True:
+                    yield
+        return Spawned
+
+    def test_spawn_many_registers_with_gfx_once(self):
+        Spawned = self.declare_Spawned()
+        gfx = Game.engine['gfx']
+        gfx.reset_mock()
+        spawned = Game.spawn_many(Spawned, 3, ((value,) for value in "abcdef"))
+        self.assertEqual(['a', 'b', 'c'], [entity.value for entity in spawned])
+        self.assertEqual(spawned, Game.get_entities(Spawned))
+        self.assertFalse(gfx.register_entity.called)
+        gfx.register_entities.assert_called_once_with(spawned)
+
+    def test_spawn_many_without_arguments(self):
+        Spawned = self.declare_Spawned()
+        spawned = Game.spawn_many(Spawned, 4)
+        self.assertEqual(4, len(spawned))
+        self.assertTrue(all(entity.value is None for entity in spawned))
+
+    def test_queued_spawns_are_created_after_execution_in_one_batch(self):
+        Spawned = self.declare_Spawned()
+        class Spawner(Entity):
+            def execute(self):
+                yield
+                Game.queue_spawn(Spawned, 1)
+                Game.queue_spawn(Spawned, value = 2)
+                while True:
+                    yield
+        spawner = Spawner()
+        gfx = Game.engine['gfx']
+        gfx.reset_mock()
+        Game.app_loop_callback(0.0)
+        spawned = Game.get_entities(Spawned)
+        self.assertEqual([1, 2], [entity.value for entity in spawned])
+        self.assertTrue(all(entity.parent is spawner for entity in spawned))
+        gfx.register_entities.assert_called_once_with(spawned)
+        self.assertEqual([], Game.entity_spawn_queue)
+
+
+class LightEntityTest(HeadlessTestCase):
+
+    def declare_Spark(self):
+        class Spark(LightEntity):
+            __slots__ = ('ticks',)
+            def execute(self, speed):
+                self.ticks = 0
+                while True:
+                    self.ticks += 1
+                    self.x += speed
+                    yield
+        return Spark
+
+    def test_has_no_instance_dict(self):
+        Spark = self.declare_Spark()
+        spark = Spark(1)
+        self.assertFalse(hasattr(spark, '__dict__'))
+        with self.assertRaises(AttributeError):
+            spark.not_declared = 1
+
+    def test_executes_every_frame(self):
+        Spark = self.declare_Spark()
+        spark = Spark(2)
+        Game.step(3)
+        self.assertEqual(4, spark.ticks)
+        self.assertEqual(8, spark.x)
+        self.assertTrue(spark in Game.get_entities(Spark))
+
+    def test_sleep(self):
+        class Sleeper(LightEntity):
+            __slots__ = ('frames',)
+            def execute(self):
+                self.frames = []
+                while True:
+                    self.frames.append(Game.current_frame)
+                    yield self.sleep(2)
+        class EntitySleeper(Entity):
+            def execute(self):
+                self.frames = []
+                while True:
+                    self.frames.append(Game.current_frame)
+                    yield self.sleep(2)
+        sleeper = Sleeper()
+        entity_sleeper = EntitySleeper()
+        Game.step(7)
+        self.assertEqual(entity_sleeper.frames, sleeper.frames)
+
+    def test_destroyed_when_execute_ends(self):
+        class Once(LightEntity):
+            __slots__ = ()
+            def execute(self):
+                yield
+        once = Once()
+        self.assertTrue(once.is_alive())
+        Game.step(2)
+        self.assertFalse(once.is_alive())
+        self.assertFalse(once in Game.entity_list)
+
+    def test_only_needed_gfx_hooks_called(self):
+        Spark = self.declare_Spark()
+        spark = Spark(1)
+        gfx = mock.Mock()
+        Game.engine['gfx'] = gfx
+        Game.gfx_alter_hooks = ('z',)
+        spark.z = 5
+        spark.drawing = False
+        self.assertEqual(5, spark.z)
+        self.assertFalse(spark.drawing)
+        gfx.alter_z.assert_called_once_with(spark, 5)
+        self.assertFalse(gfx.alter_display.called)
+
+    def test_all_gfx_hooks_called_if_not_declared(self):
+        Spark = self.declare_Spark()
+        spark = Spark(1)
+        gfx = mock.Mock()
+        Game.engine['gfx'] = gfx
+        Game.gfx_alter_hooks = None
+        spark.image = "img"
+        spark.drawing = False
+        gfx.alter_image.assert_called_once_with(spark, "img")
+        gfx.alter_display.assert_called_once_with(spark, False)
+
+    def test_refuses_gfx_engine_needing_position_hooks(self):
+        Game.gfx_alter_hooks = ('x', 'y')
+        with self.assertRaises(myrmidon.game.MyrmidonError):
+            self.declare_Spark()(1)
+
+
+class EntityArrayStoreTest(HeadlessTestCase):
+
+    def declare_Swarm(self):
+        class Swarm(Entity):
+            array_store = True
+            array_store_fields = ('speed',)
+            @classmethod
+            def batch_update(cls, store):
+                store.x += store.speed
+                store.alpha = store.alpha * 0.5
+            def execute(self, x, speed):
+                self.x = x
+                self.speed = speed
+                self.executed = 0
+                while True:
+                    self.executed += 1
+                    yield
+        return Swarm
+
+    def test_properties_read_and_write_arrays(self):
+        class Stored(Entity):
+            array_store = True
+        entity = Stored()
+        entity.x = 10
+        entity.colour = (0.5, 0.25, 1.0)
+        store = Game.get_entity_store(Stored)
+        self.assertEqual(1, len(store))
+        self.assertEqual(10.0, store.x[0])
+        self.assertEqual((0.5, 0.25, 1.0), entity.colour)
+        store.y[0] = 7
+        self.assertEqual(7.0, entity.y)
+        self.assertEqual(1.0, entity.scale)
+
+    def test_batch_update_runs_instead_of_execute(self):
+        Swarm = self.declare_Swarm()
+        swarms = [Swarm(i, 2) for i in range(3)]
+        Game.step(2)
+        self.assertEqual([4.0, 5.0, 6.0], [s.x for s in swarms])
+        self.assertEqual(0.25, swarms[0].alpha)
+        self.assertEqual([1, 1, 1], [s.executed for s in swarms])
+
+    def test_destroyed_entity_leaves_store(self):
+        Swarm = self.declare_Swarm()
+        swarms = [Swarm(i, 0) for i in range(3)]
+        swarms[0].destroy()
+        Game.step()
+        store = Game.get_entity_store(Swarm)
+        self.assertEqual(2, len(store))
+        self.assertEqual(set([1.0, 2.0]), set(store.x))
+        self.assertEqual(set(swarms[1:]), set(store.entities))
+        for entity in store.entities:
+            self.assertEqual(store.x[entity._store_index], entity.x)
+        # Destroyed Entities keep their last values
+        self.assertEqual(0.0, swarms[0].x)
+
+    def test_store_grows(self):
+        Swarm = self.declare_Swarm()
+        swarms = Game.spawn_many(Swarm, 200, ((i, 1) for i in range(200)))
+        Game.step()
+        self.assertEqual([i + 1.0 for i in range(200)], [s.x for s in swarms])
+
+    def test_stopped_entities_marked_in_store(self):
+        class Mover(Entity):
+            array_store = True
+            @classmethod
+            def batch_update(cls, store):
+                store.x += store.executing
+        movers = [Mover() for i in range(3)]
+        movers[1].stop_executing()
+        Game.step(2)
+        self.assertEqual([2.0, 0.0, 2.0], [m.x for m in movers])
+        movers[1].start_executing()
+        Game.step()
+        self.assertEqual([3.0, 1.0, 3.0], [m.x for m in movers])
+
+    def test_collisions_follow_batch_update(self):
+        class Block(Entity):
+            array_store = True
+            collision_on = True
+            collision_rectangle_width = 10
+            collision_rectangle_height = 10
+            @classmethod
+            def batch_update(cls, store):
+                store.x += 100
+        class Target(Entity):
+            collision_on = True
+            collision_rectangle_width = 10
+            collision_rectangle_height = 10
+            def execute(self, x):
+                self.x = x
+                while True:
+                    yield
+        blocks = [Block() for i in range(3)]
+        target = Target(100)
+        self.assertFalse(blocks[0].collide_with(target).result)
+        self.assertEqual([], Game.collide_query(target, Block))
+        Game.step()
+        self.assertTrue(blocks[0].collide_with(target).result)
+        self.assertEqual(set(blocks), set(Game.collide_query(target, Block)))
+        Game.step()
+        self.assertFalse(blocks[0].collide_with(target).result)
+        self.assertEqual([], Game.collide_query(target, Block))
+
+    def test_first_entity_can_use_store(self):
+        reimport()
+        Game.headless = True
+        class Stored(Entity):
+            array_store = True
+            def execute(self):
+                self.x = 3
+                while True:
+                    yield
+        entity = Stored()
+        Game.step()
+        self.assertEqual(3.0, Game.get_entity_store(Stored).x[0])
+        self.assertEqual(3.0, entity.x)
+
+
+class ParticleEmitterTest(HeadlessTestCase):
+
+    def setUp(self):
+        super(ParticleEmitterTest, self).setUp()
+        self.image = Game.load_image()
+        self.image.width = 4
+        self.image.height = 2
+
+    def test_emit_and_move(self):
+        emitter = Game.create_particle_emitter(
+            self.image, 10, 20, speed = (2.0, 2.0), direction = 0.0, spread = 0.0,
+            gravity = (0.0, 1.0), life = (3, 3)
+            )
+        self.assertEqual(4, emitter.emit(4))
+        Game.step()
+        self.assertEqual([12.0] * 4, list(emitter.get_particles("x")))
+        self.assertEqual([20.0] * 4, list(emitter.get_particles("y")))
+        Game.step()
+        self.assertEqual([14.0] * 4, list(emitter.get_particles("x")))
+        self.assertEqual([21.0] * 4, list(emitter.get_particles("y")))
+        Game.step()
+        self.assertEqual(0, emitter.particle_count)
+
+    def test_rate_builds_up(self):
+        emitter = Game.create_particle_emitter(self.image, rate = 0.5, life = (100, 100))
+        Game.step(3)
+        self.assertEqual(2, emitter.particle_count)
+
+    def test_max_particles(self):
+        emitter = Game.create_particle_emitter(self.image, max_particles = 10)
+        self.assertEqual(10, emitter.emit(15))
+        self.assertEqual(0, emitter.emit(1))
+
+    def test_dead_particles_removed(self):
+        emitter = Game.create_particle_emitter(self.image, life = (1, 1))
+        emitter.emit(3)
+        emitter.configure(life = (5, 5))
+        emitter.emit(2)
+        Game.step()
+        self.assertEqual(2, emitter.particle_count)
+        self.assertEqual([4.0, 4.0], list(emitter.get_particles("life")))
+
+    def test_destroy_when_empty(self):
+        emitter = Game.create_particle_emitter(self.image, life = (2, 2), destroy_when_empty = True)
+        emitter.emit(1)
+        Game.step(3)
+        self.assertFalse(emitter.is_alive())
+
+    def test_unknown_setting(self):
+        with self.assertRaises(myrmidon.game.MyrmidonError):
+            Game.create_particle_emitter(self.image, colour_of_magic = 8)
+
+    def test_vertex_arrays(self):
+        emitter = Game.create_particle_emitter(
+            self.image, 10, 20, speed = (0.0, 0.0), life = (4, 4),
+            start_alpha = 1.0, end_alpha = 0.0, start_scale = 2.0, end_scale = 2.0
+            )
+        emitter.emit(1)
+        Game.step(2)
+        vertices, tex_coords, colours = emitter.get_vertex_arrays()
+        self.assertEqual([[6, 18], [14, 18], [14, 22], [6, 22]], vertices.tolist())
+        self.assertEqual([[0, 0], [1, 0], [1, 1], [0, 1]], tex_coords.tolist())
+        self.assertEqual([0.5] * 4, colours[:, 3].tolist())
+
+
+class CollideGroupsTest(HeadlessTestCase):
+
+    def declare_Shape(self):
+        class Shape(Entity):
+            collision_on = True
+            def execute(self, collision_type, x, y, rotation, size, offset):
+                self.collision_type = collision_type
+                self.collision_rectangle_width = size
+                self.collision_rectangle_height = size * 0.5
+                self.collision_circle_radius = size * 0.5
+                self.collision_offset = offset
+                self.x = x
+                self.y = y
+                self.rotation = rotation
+                while True:
+                    yield
+        return Shape
+
+    def random_shapes(self, Shape, rand, count):
+        shapes = []
+        for i in range(count):
+            offset = None
+            if rand.random() < 0.3:
+                offset = (rand.uniform(-5, 5), rand.uniform(-5, 5))
+            shapes.append(Shape(
+                rand.choice(("rectangle", "circle", "point")),
+                rand.uniform(0, 200), rand.uniform(0, 200),
+                rand.choice((0.0, rand.uniform(0, 360))),
+                rand.uniform(5, 40), offset
+                ))
+        return shapes
+
+    def test_matches_check_collision(self):
+        import random
+        rand = random.Random(7)
+        Shape = self.declare_Shape()
+        group_a = self.random_shapes(Shape, rand, 60)
+        group_b = self.random_shapes(Shape, rand, 60)
+        expected = [
+            (a, b) for a in range(len(group_a)) for b in range(len(group_b))
+            if Game.check_collision(group_a[a], group_b[b])
+            ]
+        self.assertTrue(len(expected) > 20)
+        self.assertEqual(expected, [tuple(pair) for pair in Game.collide_groups(group_a, group_b).tolist()])
+
+    def test_same_group_skips_self(self):
+        Shape = self.declare_Shape()
+        a = Shape("circle", 0, 0, 0, 10, None)
+        b = Shape("circle", 5, 0, 0, 10, None)
+        c = Shape("circle", 100, 0, 0, 10, None)
+        self.assertEqual([(a, b), (b, a)], Game.collide_groups([a, b, c], [a, b, c], return_entities = True))
+
+    def test_collision_off_skipped(self):
+        Shape = self.declare_Shape()
+        a = Shape("circle", 0, 0, 0, 10, None)
+        b = Shape("circle", 5, 0, 0, 10, None)
+        b.collision_on = False
+        self.assertEqual(0, len(Game.collide_groups([a], [b])))
+
+    def test_groups_by_class(self):
+        Shape = self.declare_Shape()
+        class Bullet(Shape):
+            pass
+        a = Shape("rectangle", 0, 0, 0, 10, None)
+        b = Bullet("point", 3, 3, 0, 10, None)
+        self.assertEqual([(b, a)], Game.collide_groups(Bullet, [a], return_entities = True))
+
+
+# The narrowphase collision methods as they were before their values were
+# cached, all results are checked against these over the same corpus of shapes.
+def reference_rectangle_corners(rectangle):
+    width, height = rectangle.collision_rectangle_size()
+    centre = rectangle.get_centre_point()
+    x = rectangle.x - centre[0]
+    y = rectangle.y - centre[1]
+    if not rectangle.collision_offset is None:
+        x += rectangle.collision_offset[0]
+        y += rectangle.collision_offset[1]
+    corners = {}
+    for name, corner_x, corner_y in (("ul", 0, 0), ("ur", width, 0), ("ll", 0, height), ("lr", width, height)):
+        rot = Game.rotate_point(corner_x, corner_y, rectangle.rotation)
+        corners[name] = float(x + rot[0]), float(y + rot[1])
+    return corners
+
+
+def reference_rectangle_to_rectangle(rectangle_a, rectangle_b):
+    corners_a = reference_rectangle_corners(rectangle_a)
+    corners_b = reference_rectangle_corners(rectangle_b)
+    axes = [
+        (corners_a['ur'][0] - corners_a['ul'][0], corners_a['ur'][1] - corners_a['ul'][1]),
+        (corners_a['ur'][0] - corners_a['lr'][0], corners_a['ur'][1] - corners_a['lr'][1]),
+        (corners_b['ul'][0] - corners_b['ll'][0], corners_b['ul'][1] - corners_b['ll'][1]),
+        (corners_b['ul'][0] - corners_b['ur'][0], corners_b['ul'][1] - corners_b['ur'][1]),
+        ]
+    for axis in axes:
+        extents = []
+        for corners in (corners_a, corners_b):
+            values = []
+            for corner in corners.values():
+                projection = ((corner[0] * axis[0]) + (corner[1] * axis[1])) / ((axis[0] * axis[0]) + (axis[1] * axis[1]))
+                values.append(((projection * axis[0]) * axis[0]) + ((projection * axis[1]) * axis[1]))
+            extents.append((min(values), max(values)))
+        if not (extents[1][0] <= extents[0][1] and extents[1][1] >= extents[0][0]):
+            return False
+    return True
+
+
+def reference_point_to_rectangle(point, rectangle):
+    position = point.collision_point_calculate_point()
+    rotated = Game.rotate_point_about_point(position[0], position[1], -rectangle.rotation, rectangle.x, rectangle.y)
+    return Game.point_in_rectangle(rotated, reference_rectangle_corners(rectangle)['ul'], rectangle.collision_rectangle_size())
+
+
+def reference_circle_to_rectangle(circle, rectangle):
+    radius = circle.collision_circle_calculate_radius()
+    size = rectangle.collision_rectangle_size()
+    rotated = Game.rotate_point_about_point(circle.x, circle.y, -rectangle.rotation, rectangle.x, rectangle.y)
+    half_width = size[0] / 2
+    half_height = size[1] / 2
+    distance = (abs(rotated[0] - rectangle.x), abs(rotated[1] - rectangle.y))
+    if distance[0] > (half_width + radius) or distance[1] > (half_height + radius):
+        return False
+    if distance[0] <= half_width or distance[1] <= half_height:
+        return True
+    return ((distance[0] - half_width) ** 2) + ((distance[1] - half_height) ** 2) <= radius**2
+
+
+def reference_circle_to_circle(circle_a, circle_b):
+    radius_a = circle_a.collision_circle_calculate_radius()
+    radius_b = circle_b.collision_circle_calculate_radius()
+    return not Game.get_distance_squared((circle_a.x, circle_a.y), (circle_b.x, circle_b.y)) > (radius_a + radius_b)**2
+
+
+def reference_point_to_circle(point, circle):
+    position = point.collision_point_calculate_point()
+    return not Game.get_distance(position, (circle.x, circle.y)) > circle.collision_circle_calculate_radius()
+
+
+def reference_point_to_point(point_a, point_b):
+    return point_a.collision_point_calculate_point() == point_b.collision_point_calculate_point()
+
+
+def reference_check_collision(entity_a, entity_b):
+    types = (entity_a.collision_type, entity_b.collision_type)
+    methods = {
+        ("rectangle", "rectangle") : reference_rectangle_to_rectangle,
+        ("point", "rectangle") : reference_point_to_rectangle,
+        ("circle", "rectangle") : reference_circle_to_rectangle,
+        ("circle", "circle") : reference_circle_to_circle,
+        ("point", "circle") : reference_point_to_circle,
+        ("point", "point") : reference_point_to_point,
+        }
+    if not types in methods:
+        return methods[(types[1], types[0])](entity_b, entity_a)
+    return methods[types](entity_a, entity_b)
+
+
+class CollisionLayerTest(HeadlessTestCase):
+
+    def declare_Body(self):
+        class Body(Entity):
+            collision_on = True
+            collision_type = "circle"
+            collision_circle_radius = 10
+            def execute(self, x, layer, mask = -1):
+                self.x = x
+                self.collision_layer = layer
+                self.collision_mask = mask
+                self.hits = []
+                while True:
+                    yield
+            def on_collision(self, other):
+                self.hits.append(other)
+        return Body
+
+    def test_both_entities_called_once_per_frame(self):
+        Body = self.declare_Body()
+        a = Body(0, 1)
+        b = Body(5, 1)
+        c = Body(100, 1)
+        Game.step()
+        self.assertEqual([b], a.hits)
+        self.assertEqual([a], b.hits)
+        self.assertEqual([], c.hits)
+        Game.step()
+        self.assertEqual([b, b], a.hits)
+
+    def test_pairs_found_once(self):
+        Body = self.declare_Body()
+        bodies = [Body(i, 1) for i in range(5)]
+        Game.step()
+        pairs = Game.collision_layer_pairs()
+        self.assertEqual(10, len(pairs))
+        self.assertEqual(10, len(set(frozenset(pair) for pair in pairs)))
+
+    def test_masks_must_include_each_others_layers(self):
+        Body = self.declare_Body()
+        player = Body(0, 1, mask = 2)
+        enemy = Body(5, 2)
+        bullet = Body(5, 4, mask = 2)
+        Game.step()
+        self.assertEqual([enemy], player.hits)
+        self.assertEqual([enemy], bullet.hits)
+        self.assertEqual([player, bullet], enemy.hits)
+
+    def test_no_layer_means_no_callbacks(self):
+        Body = self.declare_Body()
+        a = Body(0, 0)
+        b = Body(5, 1)
+        Game.step()
+        self.assertEqual([], a.hits)
+        self.assertEqual([], b.hits)
+        self.assertFalse(a in Game.collision_layer_entities)
+
+    def test_layer_changed_later(self):
+        Body = self.declare_Body()
+        a = Body(0, 0)
+        b = Body(5, 1)
+        a.collision_layer = 1
+        a.reset_collision_model()
+        Game.step()
+        self.assertEqual([b], a.hits)
+        a.collision_layer = 0
+        a.reset_collision_model()
+        Game.step()
+        self.assertEqual([b], a.hits)
+
+    def test_mixed_shapes(self):
+        Body = self.declare_Body()
+        class Crate(Body):
+            collision_type = "rectangle"
+            collision_rectangle_width = 10
+            collision_rectangle_height = 10
+        class Pellet(Body):
+            collision_circle_radius = 2
+        crate = Crate(0, 1)
+        pellet = Pellet(-6, 1)
+        Game.step()
+        self.assertTrue(crate.collide_with(pellet).result)
+        self.assertEqual([pellet], crate.hits)
+        self.assertEqual([crate], pellet.hits)
+
+    def test_destroyed_in_callback(self):
+        Body = self.declare_Body()
+        class Bullet(Body):
+            def on_collision(self, other):
+                Body.on_collision(self, other)
+                self.destroy()
+        bullet = Bullet(0, 1)
+        a = Body(5, 1)
+        b = Body(-16, 1)
+        Game.step()
+        # The bullet destroys itself on its first hit, so b never hears about it
+        self.assertEqual([a], bullet.hits)
+        self.assertEqual([bullet], a.hits)
+        self.assertEqual([], b.hits)
+        self.assertFalse(bullet in Game.collision_layer_entities)
+
+
+class PositionQueryTest(HeadlessTestCase):
+
+    def declare_Agent(self):
+        class Agent(Entity):
+            def execute(self, x, y):
+                self.x = x
+                self.y = y
+                while True:
+                    yield
+        return Agent
+
+    def random_agents(self, Agent, seed, count = 300):
+        import random
+        rand = random.Random(seed)
+        return [Agent(rand.uniform(-500, 500), rand.randint(-50, 50) * 10) for i in range(count)]
+
+    def distance_sq(self, entity, point):
+        return (entity.x - point[0]) ** 2 + (entity.y - point[1]) ** 2
+
+    def test_query_radius_matches_brute_force(self):
+        Agent = self.declare_Agent()
+        agents = self.random_agents(Agent, 1)
+        for point, radius in (((0, 0), 100), ((480, -300), 250), ((-2000, 0), 50), ((10, 10), 5000), ((0, 0), 0)):
+            expected = set(agent for agent in agents if self.distance_sq(agent, point) <= radius * radius)
+            found = Game.query_radius(point, radius, Agent)
+            self.assertEqual(len(expected), len(found))
+            self.assertEqual(expected, set(found))
+
+    def test_query_rectangle_matches_brute_force(self):
+        Agent = self.declare_Agent()
+        agents = self.random_agents(Agent, 2)
+        expected = set(agent for agent in agents if -100 <= agent.x <= 150 and 0 <= agent.y <= 200)
+        self.assertEqual(expected, set(Game.query_rectangle((-100, 0), (250, 200), "Agent")))
+
+    def test_nearest_matches_brute_force(self):
+        Agent = self.declare_Agent()
+        agents = self.random_agents(Agent, 3)
+        for point in ((0, 0), (333, -333), (5000, 5000), (-700, 20)):
+            expected = sorted(agents, key = lambda agent: (self.distance_sq(agent, point), agents.index(agent)))
+            self.assertEqual(expected[:1], Game.nearest(point, Agent))
+            self.assertEqual(expected[:7], Game.nearest(point, Agent, k = 7))
+        self.assertEqual(sorted(agents, key = lambda agent: (self.distance_sq(agent, (0, 0)), agents.index(agent))),
+                         Game.nearest((0, 0), Agent, k = 1000))
+
+    def test_nearest_options(self):
+        Agent = self.declare_Agent()
+        a = Agent(0, 0)
+        b = Agent(30, 0)
+        c = Agent(0, 30)
+        d = Agent(100, 0)
+        self.assertEqual([b], Game.nearest((0, 0), Agent, exclude = a))
+        self.assertEqual([a, b, c], Game.nearest((0, 0), Agent, k = 10, max_distance = 30))
+        self.assertEqual([b, c], Game.query_radius((0, 0), 30, Agent, exclude = a))
+        self.assertEqual([], Game.nearest((0, 0), "Nothing"))
+
+    def test_grid_rebuilt_for_new_and_destroyed(self):
+        Agent = self.declare_Agent()
+        a = Agent(0, 0)
+        self.assertEqual([a], Game.query_radius((0, 0), 10, Agent))
+        b = Agent(5, 0)
+        self.assertEqual([a, b], Game.query_radius((0, 0), 10, Agent))
+        a.destroy()
+        self.assertEqual([b], Game.query_radius((0, 0), 10, Agent))
+
+    def test_grid_rebuilt_when_entities_move(self):
+        Agent = self.declare_Agent()
+        a = Agent(0, 0)
+        b = Agent(5, 0)
+        self.assertEqual([a, b], Game.query_radius((0, 0), 10, Agent))
+        a.x = 1000
+        self.assertEqual([b], Game.query_radius((0, 0), 10, Agent))
+        self.assertEqual([a], Game.query_radius((1000, 0), 10))
+        b.y = 1000
+        self.assertEqual([], Game.query_radius((0, 0), 10))
+        Game.step()
+        self.assertEqual([a], Game.query_radius((1000, 0), 10, Agent))
+
+
+class RaycastTest(HeadlessTestCase):
+
+    def declare_Shape(self):
+        class Shape(Entity):
+            collision_on = True
+            def execute(self, collision_type, x, y, rotation = 0, width = 20, height = 10, layer = 0):
+                self.collision_type = collision_type
+                self.collision_rectangle_width = width
+                self.collision_rectangle_height = height
+                self.collision_circle_radius = width * 0.5
+                self.collision_layer = layer
+                self.x = x
+                self.y = y
+                self.rotation = rotation
+                while True:
+                    yield
+        return Shape
+
+    def random_shapes(self, Shape, seed, count = 200):
+        import random
+        rand = random.Random(seed)
+        return [
+            Shape(rand.choice(("rectangle", "circle")), rand.uniform(-600, 600), rand.uniform(-600, 600),
+                  rand.choice((0, rand.uniform(0, 360))), rand.uniform(2, 60), rand.uniform(2, 60))
+            for i in range(count)
+            ]
+
+    def test_matches_testing_every_entity(self):
+        import random
+        from myrmidon.raycast import ray_to_entity
+        Shape = self.declare_Shape()
+        shapes = self.random_shapes(Shape, 4)
+        rand = random.Random(9)
+        rays = [((rand.uniform(-700, 700), rand.uniform(-700, 700)), (rand.uniform(-1, 1), rand.uniform(-1, 1)))
+                for i in range(40)]
+        # Straight along and diagonally through cell boundaries
+        rays += [((0, 0), (1, 0)), ((0, 0), (0, -1)), ((-640, -640), (1, 1)), ((128, 0), (0, 1))]
+        for origin, direction in rays:
+            length = (direction[0] ** 2 + direction[1] ** 2) ** 0.5
+            unit = (direction[0] / length, direction[1] / length)
+            expected = []
+            for shape in shapes:
+                distance = ray_to_entity(origin[0], origin[1], unit[0], unit[1], shape)
+                if not distance is None and distance <= 900:
+                    expected.append((distance, shape))
+            expected.sort(key = lambda hit: hit[0])
+            hits = Game.raycast(origin, direction, 900, all_hits = True)
+            self.assertEqual([shape for distance, shape in expected], [hit.entity for hit in hits])
+            first = Game.raycast(origin, direction, 900)
+            if expected:
+                self.assertEqual(expected[0][1], first.entity)
+                self.assertAlmostEqual(expected[0][0], first.distance)
+            else:
+                self.assertIsNone(first)
+
+    def test_agrees_with_collision_points(self):
+        Shape = self.declare_Shape()
+        Marker = self.declare_Shape()
+        targets = [Shape("circle", 100, 3, width = 30), Shape("rectangle", 200, -4, width = 10, height = 30)]
+        for target in targets:
+            hit = Game.segment_cast((0, 0), (300, 0), exclude = None, all_hits = True)
+            distance = [h.distance for h in hit if h.entity is target][0]
+            marker = Marker("point", 0, 0)
+            marker.collision_on = False
+            marker.x = distance + 0.01
+            self.assertTrue(Game.check_collision(marker, target))
+            marker.x = distance - 0.01
+            self.assertFalse(Game.check_collision(marker, target))
+
+    def test_hit_details(self):
+        Shape = self.declare_Shape()
+        circle = Shape("circle", 50, 0, width = 20)
+        hit = Game.raycast((0, 0), (2, 0), 100)
+        self.assertIs(circle, hit.entity)
+        self.assertAlmostEqual(40, hit.distance)
+        self.assertAlmostEqual(40, hit.point[0])
+        self.assertAlmostEqual(0, hit.point[1])
+        self.assertIsNone(Game.raycast((0, 0), (1, 0), 39))
+        self.assertIsNone(Game.raycast((0, 0), (-1, 0), 100))
+        self.assertEqual(0, Game.raycast((50, 5), (1, 0), 100).distance)
+
+    def test_rotated_rectangle(self):
+        Shape = self.declare_Shape()
+        # Turned a quarter so it reaches down from its top left corner
+        rectangle = Shape("rectangle", 100, 0, rotation = 90, width = 40, height = 10)
+        corners = rectangle.collision_rectangle_calculate_corners()
+        top = min(corner[1] for corner in corners.values())
+        hit = Game.raycast((min(corner[0] for corner in corners.values()) + 1, -100), (0, 1), 500)
+        self.assertIs(rectangle, hit.entity)
+        self.assertAlmostEqual(top + 100, hit.distance)
+
+    def test_mask_and_exclude(self):
+        Shape = self.declare_Shape()
+        turret = Shape("circle", 0, 0, width = 10, layer = 1)
+        wall = Shape("rectangle", 50, -20, width = 10, height = 40, layer = 2)
+        enemy = Shape("circle", 100, 0, width = 10, layer = 4)
+        self.assertIs(turret, Game.raycast((0, 0), (1, 0), 200).entity)
+        self.assertIs(wall, Game.raycast((0, 0), (1, 0), 200, exclude = turret).entity)
+        self.assertIs(enemy, Game.raycast((0, 0), (1, 0), 200, mask = 4).entity)
+        self.assertEqual([turret, wall, enemy], [hit.entity for hit in Game.segment_cast((0, 0), (200, 0), all_hits = True)])
+        self.assertEqual([wall], [hit.entity for hit in Game.segment_cast((0, 0), (200, 0), mask = 3, exclude = turret, all_hits = True)])
+
+    def test_destroyed_entities_are_not_hit(self):
+        Shape = self.declare_Shape()
+        near = Shape("rectangle", 50, 0)
+        far = Shape("rectangle", 100, 0)
+        Game.raycast((0, 5), (1, 0), 200)
+        near.destroy()
+        self.assertIs(far, Game.raycast((0, 5), (1, 0), 200).entity)
+        far.destroy()
+        self.assertIsNone(Game.raycast((0, 5), (1, 0), 200))
+        self.assertEqual([], Game.segment_cast((0, 5), (200, 5), all_hits = True))
+
+    def test_point_hits_and_zero_length(self):
+        Shape = self.declare_Shape()
+        point = Shape("point", 40, 40)
+        position = point.collision_point_calculate_point()
+        hit = Game.segment_cast((0, 0), (position[0] * 2, position[1] * 2))
+        self.assertIs(point, hit.entity)
+        self.assertIsNone(Game.segment_cast((0, 0), (0, 0)))
+        self.assertRaises(myrmidon.game.MyrmidonError, Game.raycast, (0, 0), (0, 0), 10)
+
+
+class SpriteBatchTest(HeadlessTestCase):
+
+    def make_image(self, width, height, *textures):
+        image = Game.load_image()
+        image.width = width
+        image.height = height
+        image.surfaces = list(textures)
+        return image
+
+    def declare_Sprite(self):
+        class Sprite(Entity):
+            def execute(self, image, x, y, **attributes):
+                self.image = image
+                self.x = x
+                self.y = y
+                for name in attributes:
+                    setattr(self, name, attributes[name])
+                while True:
+                    yield
+        return Sprite
+
+    def make_batch(self):
+        from myrmidon.sprite_batch import SpriteBatch
+        return SpriteBatch(plain_draw_classes = (Entity, LightEntity))
+
+    def matrix_corner(self, entity, corner_x, corner_y):
+        """Where a corner of the image ends up going through the same matrix
+        operations as drawing a single entity with OpenGL does."""
+        import math
+        def multiply(a, b):
+            return [[sum(a[i][k] * b[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+        def translate(x, y):
+            return [[1, 0, x], [0, 1, y], [0, 0, 1]]
+        def scale(x, y):
+            return [[x, 0, 0], [0, y, 0], [0, 0, 1]]
+        matrix = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+        draw_x, draw_y = entity.get_screen_draw_position()
+        if not entity.rotation == 0.0 or entity.flip_vertical or entity.flip_horizontal:
+            cen = entity.get_centre_point()
+            x = draw_x + (cen[0] * entity.scale)
+            y = draw_y + (cen[1] * entity.scale)
+            matrix = multiply(matrix, translate(x, y))
+            angle = math.radians(entity.rotation)
+            matrix = multiply(matrix, [[math.cos(angle), -math.sin(angle), 0], [math.sin(angle), math.cos(angle), 0], [0, 0, 1]])
+            if entity.flip_vertical:
+                matrix = multiply(matrix, scale(1.0, -1.0))
+            if entity.flip_horizontal:
+                matrix = multiply(matrix, scale(-1.0, 1.0))
+            matrix = multiply(matrix, translate(-x, -y))
+        matrix = multiply(matrix, translate(draw_x, draw_y))
+        matrix = multiply(matrix, scale(entity.scale, entity.scale))
+        return (matrix[0][0] * corner_x + matrix[0][1] * corner_y + matrix[0][2],
+                matrix[1][0] * corner_x + matrix[1][1] * corner_y + matrix[1][2])
+
+    def test_corners_match_single_entity_drawing(self):
+        import random
+        rand = random.Random(3)
+        Sprite = self.declare_Sprite()
+        batch = self.make_batch()
+        sprites = []
+        for i in range(50):
+            image = self.make_image(rand.randint(1, 64), rand.randint(1, 64), "texture")
+            sprite = Sprite(
+                image, rand.uniform(-100, 100), rand.uniform(-100, 100),
+                rotation = rand.choice((0.0, rand.uniform(0, 360))), scale = rand.choice((1.0, rand.uniform(0.1, 3))),
+                flip_horizontal = rand.random() < 0.3, flip_vertical = rand.random() < 0.3,
+                colour = (rand.random(), rand.random(), rand.random()), alpha = rand.uniform(0.1, 1)
+                )
+            if rand.random() < 0.3:
+                sprite.centre_point = (rand.uniform(0, 10), rand.uniform(0, 10))
+            sprites.append(sprite)
+            batch.add(sprite)
+        vertices, tex_coords, colours = batch.build()
+        self.assertEqual((200, 2), vertices.shape)
+        for i, sprite in enumerate(sprites):
+            corners = ((0, 0), (sprite.image.width, 0), (sprite.image.width, sprite.image.height), (0, sprite.image.height))
+            for j, corner in enumerate(corners):
+                expected = self.matrix_corner(sprite, corner[0], corner[1])
+                self.assertAlmostEqual(expected[0], vertices[i * 4 + j][0], places = 3)
+                self.assertAlmostEqual(expected[1], vertices[i * 4 + j][1], places = 3)
+                self.assertEqual(float(corner[0] > 0), tex_coords[i * 4 + j][0])
+                self.assertEqual(float(corner[1] > 0), tex_coords[i * 4 + j][1])
+                self.assertAlmostEqual(sprite.alpha, colours[i * 4 + j][3], places = 5)
+                self.assertAlmostEqual(sprite.colour[1], colours[i * 4 + j][1], places = 5)
+
+    def test_runs_split_on_texture_blend_and_clip(self):
+        Sprite = self.declare_Sprite()
+        batch = self.make_batch()
+        image_a = self.make_image(4, 4, "a")
+        image_b = self.make_image(4, 4, "b", "c")
+        entities = [
+            Sprite(image_a, 0, 0), Sprite(image_a, 1, 0),
+            Sprite(image_b, 2, 0), Sprite(image_b, 3, 0, image_seq = 1),
+            Sprite(image_b, 4, 0, image_seq = 1, blend = True),
+            Sprite(image_b, 5, 0, image_seq = 1, blend = True, clip = ((0, 0), (5, 5))),
+            Sprite(image_b, 6, 0, image_seq = 1, blend = True, clip = ((0, 0), (5, 5))),
+            Sprite(image_b, 6, 0, alpha = 0.0), Sprite(None, 6, 0),
+            Sprite(image_a, 7, 0),
+            ]
+        for entity in entities:
+            batch.add(entity)
+        self.assertEqual(
+            [("a", False, None, 0, 2), ("b", False, None, 2, 1), ("c", False, None, 3, 1), ("c", True, None, 4, 1),
+             ("c", True, ((0, 0), (5, 5)), 5, 2), ("a", False, None, 7, 1)],
+            [(run.texture, run.blend, run.clip, run.first, run.count) for run in batch.steps]
+            )
+        self.assertEqual(32, len(batch.build()[0]))
+
+    def test_custom_draws_keep_their_place(self):
+        Sprite = self.declare_Sprite()
+        class Fancy(Sprite):
+            def draw(self):
+                pass
+        class Plain(Sprite):
+            pass
+        batch = self.make_batch()
+        image = self.make_image(4, 4, "a")
+        first = Sprite(image, 0, 0)
+        fancy = Fancy(image, 0, 0)
+        plain = Plain(image, 0, 0)
+        invisible = Fancy(image, 0, 0, normal_draw = False)
+        for entity in (first, fancy, plain, invisible):
+            batch.add(entity)
+        steps = batch.steps
+        self.assertEqual(4, len(steps))
+        self.assertEqual(2, steps[0].count)
+        self.assertIs(fancy, steps[1])
+        self.assertEqual((2, 1), (steps[2].first, steps[2].count))
+        self.assertIs(invisible, steps[3])
+
+    def test_state_sorted_groups_render_state_within_z(self):
+        Sprite = self.declare_Sprite()
+        batch = self.make_batch()
+        image_a = self.make_image(4, 4, "a")
+        image_b = self.make_image(4, 4, "b")
+        clip = ((0, 0), (5, 5))
+        b1 = Sprite(image_b, 0, 0)
+        a1 = Sprite(image_a, 0, 0)
+        blended = Sprite(image_a, 0, 0, blend = True)
+        b2 = Sprite(image_b, 0, 0)
+        clipped = Sprite(image_a, 0, 0, clip = clip)
+        a2 = Sprite(image_a, 0, 0)
+        hidden = Sprite(image_a, 0, 0)
+        hidden._drawing = False
+        above = Sprite(image_b, 0, 0, z = -1)
+        above_a = Sprite(image_a, 0, 0, z = -1)
+        ordered = batch.state_sorted([b1, a1, blended, b2, clipped, hidden, a2, above, above_a])
+        self.assertEqual([b1, b2, a1, a2, clipped, blended, above, above_a], ordered)
+
+    def test_state_sorted_does_not_move_custom_draws(self):
+        Sprite = self.declare_Sprite()
+        class Fancy(Sprite):
+            def draw(self):
+                pass
+        batch = self.make_batch()
+        image_a = self.make_image(4, 4, "a")
+        image_b = self.make_image(4, 4, "b")
+        b1 = Sprite(image_b, 0, 0)
+        a1 = Sprite(image_a, 0, 0)
+        fancy = Fancy(image_a, 0, 0)
+        b2 = Sprite(image_b, 0, 0)
+        no_image = Sprite(None, 0, 0)
+        a2 = Sprite(image_a, 0, 0)
+        b3 = Sprite(image_b, 0, 0)
+        ordered = batch.state_sorted([b1, a1, fancy, b2, a2, no_image, b3, a2])
+        self.assertEqual([b1, a1, fancy, b2, a2, no_image, b3, a2], ordered)
+        ordered = batch.state_sorted([a1, b1, fancy, a2, b2, b3, a1])
+        self.assertEqual([a1, b1, fancy, a2, a1, b2, b3], ordered)
+
+    def test_state_sorted_batch_has_fewer_runs(self):
+        import random
+        rand = random.Random(5)
+        Sprite = self.declare_Sprite()
+        images = [self.make_image(4, 4, name) for name in "abcd"]
+        sprites = [Sprite(rand.choice(images), 0, 0, blend = rand.random() < 0.5) for i in range(100)]
+        batch = self.make_batch()
+        for sprite in sprites:
+            batch.add(sprite)
+        unsorted_runs = len(batch.steps)
+        batch = self.make_batch()
+        for sprite in batch.state_sorted(sprites):
+            batch.add(sprite)
+        self.assertEqual(8, len(batch.steps))
+        self.assertTrue(unsorted_runs > len(batch.steps))
+        self.assertEqual(400, len(batch.build()[0]))
+
+    def test_render_stats(self):
+        self.assertEqual(
+            {'texture_binds' : 0, 'state_changes' : 0, 'draw_calls' : 0},
+            Game.render_stats
+            )
+
+
+class DrawOrderTest(HeadlessTestCase):
+
+    def declare_Thing(self, pooled = False):
+        class Thing(Entity):
+            def execute(self, x, y, z):
+                self.x = x
+                self.y = y
+                self.z = z
+                while True:
+                    yield
+        Thing.pooled = pooled
+        return Thing
+
+    def draw_order(self):
+        return [x for x in Game.draw_order.entities(Game.draw_order_y_sort) if not x is self.first]
+
+    def test_highest_z_drawn_first_in_creation_order(self):
+        Thing = self.declare_Thing()
+        a = Thing(0, 0, 5)
+        b = Thing(0, 0, -2)
+        c = Thing(0, 0, 5)
+        d = Thing(0, 0, 10)
+        self.assertEqual([d, a, c, b], self.draw_order())
+
+    def test_changing_z_keeps_creation_order_within_new_depth(self):
+        Thing = self.declare_Thing()
+        a = Thing(0, 0, 5)
+        b = Thing(0, 0, 1)
+        c = Thing(0, 0, 1)
+        self.assertEqual([a, b, c], self.draw_order())
+        a.z = 1
+        self.assertEqual([a, b, c], self.draw_order())
+        self.assertFalse(5 in Game.draw_order.depths)
+        b.z = 1
+        self.assertEqual([a, b, c], self.draw_order())
+        b.z = 3
+        self.assertEqual([b, a, c], self.draw_order())
+        c.z = 3
+        self.assertEqual([b, c, a], self.draw_order())
+
+    def test_changing_z_and_back_restores_order(self):
+        Thing = self.declare_Thing()
+        a = Thing(0, 0, 0)
+        b = Thing(0, 0, 0)
+        c = Thing(0, 0, 0)
+        a.z = 1
+        self.assertEqual([a, b, c], self.draw_order())
+        a.z = 0
+        self.assertEqual([a, b, c], self.draw_order())
+        c.z = -1
+        b.z = -1
+        c.z = 0
+        self.assertEqual([a, c, b], self.draw_order())
+        b.z = 0
+        self.assertEqual([a, b, c], self.draw_order())
+
+    def test_destroyed_entities_are_removed(self):
+        Thing = self.declare_Thing()
+        a = Thing(0, 0, 5)
+        b = Thing(0, 0, 2)
+        a.destroy()
+        Game.step()
+        self.assertEqual([b], self.draw_order())
+        self.assertFalse(a in Game.draw_order)
+        self.assertEqual([0, 2], Game.draw_order.depths)
+
+    def test_recycled_entities_go_back_to_their_reset_depth(self):
+        Thing = self.declare_Thing(pooled = True)
+        a = Thing(0, 0, 5)
+        b = Thing(0, 0, 0)
+        a.destroy()
+        Game.step()
+        self.assertEqual([b], self.draw_order())
+        recycled = Entity.__new__(Thing)
+        Thing.__init__(recycled, 0, 0, 0)
+        self.assertTrue(recycled is a)
+        self.assertEqual([b, a], self.draw_order())
+
+    def test_recycled_entities_drawn_as_if_newly_created(self):
+        Thing = self.declare_Thing(pooled = True)
+        a = Thing(0, 0, 0)
+        b = Thing(0, 0, 0)
+        a.destroy()
+        Game.step()
+        self.assertFalse(a in Game.entity_list)
+        self.assertFalse(a in Game.entity_draw_list)
+        recycled = Thing(0, 0, 0)
+        c = Thing(0, 0, 0)
+        self.assertTrue(recycled is a)
+        self.assertEqual([b, a, c], self.draw_order())
+        self.assertEqual([b, a, c], [x for x in Game.entity_list if isinstance(x, Thing)])
+        self.assertEqual([b, a, c], [x for x in Game.entity_draw_list if isinstance(x, Thing)])
+        self.assertTrue(a.drawing)
+
+    def test_light_entities(self):
+        class Spark(LightEntity):
+            def execute(self):
+                while True:
+                    yield
+        a = Spark()
+        b = Spark()
+        a.z = -1
+        self.assertEqual([b, a], self.draw_order())
+
+    def test_y_sort(self):
+        Thing = self.declare_Thing()
+        low = Thing(0, 50, 0)
+        high = Thing(0, -20, 0)
+        middle = Thing(0, 10, 0)
+        level_with_middle = Thing(0, 10, 0)
+        ground = Thing(0, 100, 10)
+        ground_above = Thing(0, 0, 10)
+        Game.draw_order_y_sort = True
+        self.assertEqual([ground_above, ground, high, middle, level_with_middle, low], self.draw_order())
+        Game.draw_order_y_sort = [0]
+        self.assertEqual([ground, ground_above, high, middle, level_with_middle, low], self.draw_order())
+        high.y = 60
+        self.assertEqual([ground, ground_above, middle, level_with_middle, low, high], self.draw_order())
+        Game.draw_order_y_sort = False
+        self.assertEqual([ground, ground_above, low, high, middle, level_with_middle], self.draw_order())
+
+    def test_changes_only_counted_when_order_changes(self):
+        Thing = self.declare_Thing()
+        a = Thing(0, 0, 0)
+        b = Thing(0, 10, 0)
+        Game.draw_order.entities()
+        changes = Game.draw_order.changes
+        Game.draw_order.entities(True)
+        a.z = 0
+        Game.draw_order.entities()
+        self.assertEqual(changes, Game.draw_order.changes)
+        a.y = 20
+        Game.draw_order.entities(True)
+        self.assertEqual(changes + 1, Game.draw_order.changes)
+        Thing(0, 0, 1)
+        Game.draw_order.entities(True)
+        self.assertEqual(changes + 2, Game.draw_order.changes)
+        Game.draw_order.entities(True)
+        Game.draw_order.entities(set([0]))
+        self.assertEqual(changes + 2, Game.draw_order.changes)
+        b.y = 30
+        self.assertEqual([a, b], [x for x in Game.draw_order.entities(set([0])) if x in (a, b)])
+        self.assertEqual(changes + 3, Game.draw_order.changes)
+        Game.draw_order.entities()
+        self.assertEqual(changes + 3, Game.draw_order.changes)
+
+
+class TextureAtlasTest(HeadlessTestCase):
+
+    def assert_packed(self, sizes, page_sizes, placements, padding):
+        for i, (page, x, y) in enumerate(placements):
+            width, height = sizes[i]
+            self.assertTrue(0 <= x and x + width <= page_sizes[page][0])
+            self.assertTrue(0 <= y and y + height <= page_sizes[page][1])
+            for j in range(i):
+                other_page, other_x, other_y = placements[j]
+                other_width, other_height = sizes[j]
+                if other_page == page:
+                    self.assertTrue(
+                        x + width + padding <= other_x or other_x + other_width + padding <= x or
+                        y + height + padding <= other_y or other_y + other_height + padding <= y)
+
+    def test_packs_without_overlapping(self):
+        import random
+        from myrmidon.texture_atlas import pack_pages
+        rand = random.Random(4)
+        for trial in range(50):
+            sizes = [(rand.randint(1, 100), rand.randint(1, 100)) for i in range(rand.randint(1, 60))]
+            padding = rand.choice((0, 1, 2))
+            page_sizes, placements = pack_pages(sizes, rand.choice((128, 512)), padding)
+            self.assertEqual(len(sizes), len(placements))
+            self.assert_packed(sizes, page_sizes, placements, padding)
+
+    def test_smallest_power_of_two_page(self):
+        from myrmidon.texture_atlas import pack_pages
+        page_sizes, placements = pack_pages([(32, 32)] * 4, 2048, 0)
+        self.assertEqual([(64, 64)], page_sizes)
+        page_sizes, placements = pack_pages([(30, 20)] * 3, 2048, 1)
+        self.assertEqual([(64, 64)], page_sizes)
+        self.assertEqual(([], []), pack_pages([], 2048, 1))
+
+    def test_spreads_over_full_size_pages(self):
+        from myrmidon.texture_atlas import pack_pages
+        sizes = [(60, 60)] * 10
+        page_sizes, placements = pack_pages(sizes, 128, 1)
+        self.assertEqual([(128, 128)] * 3, page_sizes)
+        self.assert_packed(sizes, page_sizes, placements, 1)
+
+    def test_too_large_for_page(self):
+        from myrmidon import texture_atlas
+        with self.assertRaises(texture_atlas.MyrmidonError):
+            texture_atlas.pack_pages([(10, 10), (300, 10)], 256, 1)
+
+    def test_layout_cache(self):
+        import os, shutil, tempfile
+        from myrmidon.texture_atlas import pack_pages, load_layout, save_layout
+        directory = tempfile.mkdtemp()
+        try:
+            cache_file = os.path.join(directory, "atlas.json")
+            sources = [("a.png", 10, 20), (None, 30, 5)]
+            self.assertEqual(None, load_layout(cache_file, sources, 256, 1))
+            layout = pack_pages([(10, 20), (30, 5)], 256, 1)
+            save_layout(cache_file, sources, 256, 1, layout)
+            self.assertEqual(layout, load_layout(cache_file, sources, 256, 1))
+            self.assertEqual(None, load_layout(cache_file, [("a.png", 10, 21), (None, 30, 5)], 256, 1))
+            self.assertEqual(None, load_layout(cache_file, sources, 512, 1))
+            self.assertEqual(None, load_layout(cache_file, sources, 256, 2))
+            with open(cache_file, "w") as cache:
+                cache.write("not json")
+            self.assertEqual(None, load_layout(cache_file, sources, 256, 1))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_frame_uvs(self):
+        from myrmidon.texture_atlas import frame_uvs
+        self.assertEqual(((16, 8), [(0.25, 0.5, 0.5, 0.625)]), frame_uvs((64, 64), 16, 32, 16, 8))
+        size, uvs = frame_uvs((64, 32), 0, 0, 32, 16, True, 16, 8, inset = 0)
+        self.assertEqual((16, 8), size)
+        self.assertEqual([(0.0, 0.0, 0.25, 0.25), (0.25, 0.0, 0.5, 0.25),
+                          (0.0, 0.25, 0.25, 0.5), (0.25, 0.25, 0.5, 0.5)], uvs)
+        size, uvs = frame_uvs((64, 64), 0, 0, 32, 16, True, 16)
+        self.assertEqual(((16, 16), 2), (size, len(uvs)))
+
+    def test_sheet_frames_in_slicing_order(self):
+        # Sequence images keep their sheet as one texture, frames must come out in the
+        # same order, and leave off the same partial frames, as cutting it up did
+        from myrmidon.texture_atlas import frame_uvs
+        sheet_width, sheet_height = 70, 33
+        size, uvs = frame_uvs((sheet_width, sheet_height), 0, 0, sheet_width, sheet_height, True, 16, 16)
+        expected = []
+        for a in range(0, sheet_height // 16):
+            for b in range(sheet_width // 16):
+                expected.append(((b * 16 + 0.5) / sheet_width, (a * 16 + 0.5) / sheet_height,
+                                 ((b + 1) * 16 - 0.5) / sheet_width, ((a + 1) * 16 - 0.5) / sheet_height))
+        self.assertEqual((16, 16), size)
+        self.assertEqual(8, len(uvs))
+        for frame, expected_frame in zip(uvs, expected):
+            for value, expected_value in zip(frame, expected_frame):
+                self.assertAlmostEqual(expected_value, value)
+
+    def test_sheet_frames_sample_only_their_own_texels(self):
+        # Linear filtering reads half a texel either side of a sample, so every frame
+        # has to stay at least that far from the frames next to it
+        from myrmidon.texture_atlas import frame_uvs
+        sheet_width, sheet_height = 64, 48
+        size, uvs = frame_uvs((sheet_width, sheet_height), 0, 0, sheet_width, sheet_height, True, 16, 16)
+        self.assertEqual(12, len(uvs))
+        for i, (left, top, right, bottom) in enumerate(uvs):
+            column, row = i % 4, i // 4
+            self.assertAlmostEqual(column * 16 + 0.5, left * sheet_width)
+            self.assertAlmostEqual(row * 16 + 0.5, top * sheet_height)
+            self.assertAlmostEqual((column + 1) * 16 - 0.5, right * sheet_width)
+            self.assertAlmostEqual((row + 1) * 16 - 0.5, bottom * sheet_height)
+        # Single images are padded in atlases instead, so they keep their full area
+        self.assertEqual([(0.0, 0.0, 1.0, 1.0)], frame_uvs((64, 48), 0, 0, 64, 48)[1])
+
+    def declare_builder(self):
+        from myrmidon.texture_atlas import AtlasBuilder
+        class Builder(AtlasBuilder):
+            def __init__(self, *args, **kwargs):
+                AtlasBuilder.__init__(self, *args, **kwargs)
+                self.pages = []
+                self.loaded = []
+            def load_source(self, image):
+                self.loaded.append(image)
+                return image, image[0], image[1]
+            def create_page(self, width, height):
+                self.pages.append({"size" : (width, height), "copies" : []})
+                return len(self.pages) - 1
+            def copy_to_page(self, texture, source, x, y):
+                self.pages[texture]["copies"].append((source, x, y))
+            def make_image(self, texture, uvs, width, height, entry):
+                return (texture, uvs, width, height, entry["image"])
+        return Builder
+
+    def test_builder(self):
+        import os, shutil, tempfile
+        Builder = self.declare_builder()
+        directory = tempfile.mkdtemp()
+        try:
+            cache_file = os.path.join(directory, "atlas.json")
+            images = [(32, 32), {"image" : (64, 16), "sequence" : True, "width" : 16}, (8, 8)]
+            builder = Builder()
+            result = builder.build(images, 128, 1, cache_file)
+            self.assertEqual(1, len(builder.pages))
+            self.assertEqual(3, len(builder.pages[0]["copies"]))
+            self.assertEqual([(32, 32), (64, 16), (8, 8)], [x[4] for x in result])
+            self.assertEqual((32, 32), result[0][2:4])
+            self.assertEqual((16, 16), result[1][2:4])
+            self.assertEqual(4, len(result[1][1]))
+            page_width, page_height = builder.pages[0]["size"]
+            for source, x, y in builder.pages[0]["copies"]:
+                image = result[[x[4] for x in result].index(source)]
+                inset = 0.5 if len(image[1]) > 1 else 0.0
+                self.assertEqual(((x + inset) / page_width, (y + inset) / page_height), image[1][0][:2])
+            self.assertTrue(os.path.exists(cache_file))
+
+            again = Builder().build(images, 128, 1, cache_file)
+            self.assertEqual(result, again)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_builder_auto_place(self):
+        Builder = self.declare_builder()
+        builder = Builder(page_size = 64, padding = 0)
+        self.assertEqual((0, 0, 0), builder.auto_place("a", 32, 32))
+        self.assertEqual((0, 32, 0), builder.auto_place("b", 32, 32))
+        self.assertEqual((0, 0, 32), builder.auto_place("c", 64, 32))
+        self.assertEqual((1, 0, 0), builder.auto_place("d", 10, 10))
+        self.assertEqual(None, builder.auto_place("e", 65, 10))
+        self.assertEqual([(64, 64), (64, 64)], [x["size"] for x in builder.pages])
+
+    def test_load_atlas_with_dummy_engine(self):
+        images = Game.load_atlas(["a.png", {"image" : "b.png", "sequence" : True}])
+        self.assertEqual(2, len(images))
+        self.assertEqual(None, images[0].uvs)
+
+    def test_sprite_batch_uses_uvs(self):
+        from myrmidon.sprite_batch import SpriteBatch
+        class Sprite(Entity):
+            def execute(self, image, image_seq):
+                self.image = image
+                self.image_seq = image_seq
+                while True:
+                    yield
+        image = Game.load_image()
+        image.width = 8
+        image.height = 8
+        image.surfaces = ["atlas", "atlas"]
+        image.uvs = [(0.0, 0.0, 0.25, 0.5), (0.25, 0.5, 0.5, 1.0)]
+        whole = Game.load_image()
+        whole.width = 8
+        whole.height = 8
+        whole.surfaces = ["texture"]
+        batch = SpriteBatch(plain_draw_classes = (Entity, LightEntity))
+        for entity in (Sprite(image, 0), Sprite(image, 1), Sprite(whole, 0)):
+            batch.add(entity)
+        self.assertEqual(2, len(batch.steps))
+        self.assertEqual(2, batch.steps[0].count)
+        tex_coords = batch.build()[1].tolist()
+        self.assertEqual([[0.0, 0.0], [0.25, 0.0], [0.25, 0.5], [0.0, 0.5],
+                          [0.25, 0.5], [0.5, 0.5], [0.5, 1.0], [0.25, 1.0],
+                          [0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0]], tex_coords)
+
+
+class NarrowphaseCorpusTest(HeadlessTestCase):
+
+    def declare_Shape(self):
+        class Shape(Entity):
+            collision_on = True
+            def execute(self, collision_type, x, y, rotation, width, height, offset):
+                self.collision_type = collision_type
+                self.collision_rectangle_width = width
+                self.collision_rectangle_height = height
+                self.collision_circle_radius = width * 0.5
+                self.collision_offset = offset
+                self.x = x
+                self.y = y
+                self.rotation = rotation
+                while True:
+                    yield
+        return Shape
+
+    def corpus(self, Shape, seed):
+        """Random shapes mixed with ones on a whole number grid, so there are
+        plenty of pairs that exactly touch along edges and corners."""
+        import random
+        rand = random.Random(seed)
+        shapes = []
+        for i in range(90):
+            collision_type = rand.choice(("rectangle", "circle", "point"))
+            if i % 3 == 0:
+                shapes.append(Shape(
+                    collision_type, rand.randint(0, 12) * 5 + rand.randint(0, 1), rand.randint(0, 12) * 5 + rand.randint(0, 1),
+                    rand.choice((0, 90, 180, 270, 45)), rand.randint(1, 4) * 5, rand.randint(1, 4) * 5, None
+                    ))
+                continue
+            offset = None
+            if rand.random() < 0.3:
+                offset = (rand.uniform(-5, 5), rand.uniform(-5, 5))
+            shapes.append(Shape(
+                collision_type, rand.uniform(0, 60), rand.uniform(0, 60),
+                rand.choice((0.0, rand.uniform(-720, 720))),
+                rand.uniform(0.5, 30), rand.uniform(0.5, 30), offset
+                ))
+        return shapes
+
+    def assert_matches_reference(self, shapes):
+        hits = 0
+        for a in shapes:
+            for b in shapes:
+                expected = reference_check_collision(a, b)
+                self.assertEqual(expected, Game.check_collision(a, b), (a.collision_type, b.collision_type))
+                hits += expected
+        self.assertTrue(hits > len(shapes))
+
+    def test_matches_reference(self):
+        Shape = self.declare_Shape()
+        for seed in range(3):
+            self.assert_matches_reference(self.corpus(Shape, seed))
+
+    def test_matches_reference_after_moving(self):
+        import random
+        rand = random.Random(11)
+        Shape = self.declare_Shape()
+        shapes = self.corpus(Shape, 5)
+        self.assert_matches_reference(shapes)
+        for shape in shapes:
+            shape.x += rand.choice((0, 5, -2.5))
+            shape.rotation += rand.choice((0, 30))
+            shape.scale = rand.choice((1.0, 0.5, 2.0))
+        self.assert_matches_reference(shapes)
+
+    def test_collide_query_matches_brute_force(self):
+        Shape = self.declare_Shape()
+        shapes = []
+        for seed in range(3):
+            shapes.extend(self.corpus(Shape, seed))
+            for a in shapes:
+                expected = set(b for b in shapes if b is not a and a.collide_with(b).result)
+                self.assertEqual(expected, set(Game.collide_query(a)), a.collision_type)
+
+    def test_shape_cached_until_transform_changes(self):
+        Shape = self.declare_Shape()
+        shape = Shape("rectangle", 10, 10, 30, 20, 10, None)
+        cached = shape.collision_rectangle_calculate_shape()
+        self.assertIs(cached, shape.collision_rectangle_calculate_shape())
+        shape.x = 20
+        moved = shape.collision_rectangle_calculate_shape()
+        self.assertIsNot(cached, moved)
+        self.assertEqual(moved.corners[0], shape.collision_rectangle_calculate_corners()['ul'][0])
+
+    def test_circles_without_helper_module(self):
+        Shape = self.declare_Shape()
+        a = Shape("circle", 0, 0, 0, 10, 10, None)
+        b = Shape("circle", 10, 0, 0, 10, 10, None)
+        c = Shape("circle", 10.5, 0, 0, 10, 10, None)
+        self.assertFalse(hasattr(a, "get_distance_squared"))
+        self.assertTrue(Game.check_collision(a, b))
+        self.assertFalse(Game.check_collision(a, c))
+
+
 class GetDistanceTest(unittest.TestCase):
 
     def test_returns_correct_value_for_quadrant_1(self):